@@ -6,3 +6,7 @@ Project to build email rules and filters
 from . import utils
 from . import rules
 from . import actions
+from . import api
+from . import matching
+from . import imap
+from . import perf
@@ -4,5 +4,7 @@ actions
 """
 
 from .rule_collection import Rule_Collection
-from .build_xmls import build_xml_text
+from .build_xmls import build_xml_text, Shard, shard_xml_texts, write_sharded_feeds
+from .concurrent_collection import ConcurrentCollectionBuilder
+from .fleet import Account, AccountBuild, build_fleet
 
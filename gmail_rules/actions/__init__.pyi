@@ -2,7 +2,18 @@ from ..actions.rule_collection import (
     Rule_Collection
 )
 from ..actions.build_xmls import (
-    build_xml_text
+    build_xml_text,
+    Shard,
+    shard_xml_texts,
+    write_sharded_feeds
+)
+from ..actions.concurrent_collection import (
+    ConcurrentCollectionBuilder
+)
+from ..actions.fleet import (
+    Account,
+    AccountBuild,
+    build_fleet
 )
 # from gmail_rules.actions.build_xmls import (
 
@@ -1,17 +1,211 @@
 from distutils.command import build
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, Mapping
+
+from ..rules import address_group as _AG
+from ..rules import rule as _R
 from ..utils import helpers as _hp
 
-__all__ = ["build_xml_text"]
+__all__ = ["build_xml_text", "Shard", "shard_xml_texts", "write_sharded_feeds"]
+
+
+MAX_SHARD_BYTES : int = 1_000_000
+"""Default maximum size (in bytes) of each sharded feed"""
+
+MAX_SHARD_ENTRIES : int = 1_000
+"""Default maximum number of `<entry>` elements in each sharded feed"""
+
+MANIFEST_FILENAME : str = "manifest.json"
+"""Name of the manifest written next to the sharded feeds"""
+
+
+@dataclass
+class Shard:
+    """Description of one sharded feed written by :obj:`write_sharded_feeds()`
+
+    Attributes
+    ----------
+    filename : `str`
+        Name of the shard's file (relative to the output directory)
+    sha256 : `str`
+        Hex digest of the shard's contents
+    bytes : `int`
+        Size of the shard in bytes
+    entries : `int`
+        Number of `<entry>` elements in the shard
+    written : `bool`
+        Whether the file was (re)written, or skipped because it was unchanged
+    """
+    filename: str
+    sha256: str
+    bytes: int
+    entries: int
+    written: bool = True
+
 
 def build_xml_text(text: str) -> str:
     """
     Build a final string that can be pasted into a .xml file from the strings
     returned by the `build_rule()` methods in the `Rule` classes
     """
-    final_text = f"<?xml version='1.0' encoding='UTF-8'?>\n<feed xmlns='http://www.w3.org/2005/Atom' xmlns:apps='http://schemas.google.com/apps/2006'>\n\t<title>Mail Filters</title>\n\t<author>\n\t\t<name>{_hp.AUTHOR_NAME}</name>\n\t\t<email>{_hp.AUTHOR_EMAIL}</email>\n\t</author>\n{_hp.indent(text)}\n</feed>".expandtabs(_hp.TAB_SPACING)
+    final_text = f"<?xml version='1.0' encoding='UTF-8'?>\n<feed xmlns='http://www.w3.org/2005/Atom' xmlns:apps='http://schemas.google.com/apps/2006'>\n\t<title>Mail Filters</title>\n\t<author>\n\t\t<name>{_hp.escape_xml(_hp.AUTHOR_NAME)}</name>\n\t\t<email>{_hp.escape_xml(_hp.AUTHOR_EMAIL)}</email>\n\t</author>\n{_hp.indent(text)}\n</feed>".expandtabs(_hp.TAB_SPACING)
 
     return final_text
 
+
+def _feed_size(rendered_rule: str) -> int:
+    """Number of bytes `rendered_rule` adds to the output of :obj:`build_xml_text()`"""
+    return len(_hp.indent(f"\n\n{rendered_rule}").expandtabs(_hp.TAB_SPACING).encode("utf-8"))
+
+
+def shard_xml_texts(
+    rules: Iterable[_R.Rule],
+    max_bytes: int = MAX_SHARD_BYTES,
+    max_entries: int = MAX_SHARD_ENTRIES,
+    address_groups: Mapping[str, _AG.AddressGroup] | None = None,
+) -> list[tuple[str, int]]:
+    """Splits rules into several complete feeds that each respect a size and entry limit
+
+    Rules are kept in the same order as in :obj:`Rule_Collection.build_final_string()`,
+    and a rule (including all of its labels) is never split across feeds, except
+    for the separate parts of a rule whose emails are an :obj:`AddressSet`.  The
+    rules of a :obj:`Rule_Collection` are taken from its render caches (see
+    :obj:`Rule_Collection.iter_rule_parts()`), so unchanged rules are not rendered again.
+
+    Parameters
+    ----------
+    rules : :obj:`Rule_Collection` or iterable of :obj:`Rule`
+        Rules to split into feeds
+    max_bytes : int, optional
+        Maximum size (in bytes, UTF-8 encoded) of each feed, by default `MAX_SHARD_BYTES`
+    max_entries : int, optional
+        Maximum number of `<entry>` elements in each feed, by default `MAX_SHARD_ENTRIES`
+    address_groups : Mapping[str, AddressGroup], optional
+        Address groups referenced by the rules, by default `None` (the groups registered on `rules`
+        and its child collections when it is a :obj:`Rule_Collection`)
+
+    Returns
+    -------
+    list[tuple[str, int]]
+        `(feed text, number of entries)` for every feed, each built with :obj:`build_xml_text()`
+
+    Raises
+    ------
+    ValueError
+        Raises a `ValueError` when a single rule does not fit within the limits on its own
+    """
+    if address_groups is None and hasattr(rules, "iter_rule_parts"):
+        rendered_rules = rules.iter_rule_parts()
+    else:
+        rendered_rules = ((rule, rule.build_rule_parts(address_groups)) for rule in reversed(list(rules)))      ## MATCHES THE ORDER OF build_final_string()
+
+    feed_overhead = len(build_xml_text("").encode("utf-8"))
+
+    shards: list[tuple[str, int]] = []
+    current_rules: list[str] = []
+    current_bytes = feed_overhead
+    current_entries = 0
+
+    for rule, rule_parts in rendered_rules:
+        rule_entries = max(len(rule.labels), 1)
+
+        for rendered_rule in rule_parts:
+            rule_bytes = _feed_size(rendered_rule)
+
+            if feed_overhead + rule_bytes > max_bytes or rule_entries > max_entries:
+                raise ValueError(f"{rule.name} does not fit in a feed of {max_bytes} bytes and {max_entries} entries")
+
+            if current_rules and (current_bytes + rule_bytes > max_bytes or current_entries + rule_entries > max_entries):
+                shards.append((build_xml_text("".join(current_rules)), current_entries))
+                current_rules, current_bytes, current_entries = [], feed_overhead, 0
+
+            current_rules.append(f"\n\n{rendered_rule}")
+            current_bytes += rule_bytes
+            current_entries += rule_entries
+
+    if current_rules:
+        shards.append((build_xml_text("".join(current_rules)), current_entries))
+
+    return shards
+
+
+def write_sharded_feeds(
+    rules: Iterable[_R.Rule],
+    directory: str,
+    basename: str = "mailFilters",
+    max_bytes: int = MAX_SHARD_BYTES,
+    max_entries: int = MAX_SHARD_ENTRIES,
+    max_workers: int | None = None,
+) -> list[Shard]:
+    """Writes rules to `directory` as several size-limited feeds plus a manifest
+
+    Shards are named `{basename}-0001.xml`, `{basename}-0002.xml`, etc. and are
+    written in parallel, each with an atomic rename.  `manifest.json` records the
+    SHA-256 of every shard, so shards that are unchanged since the previous run are
+    not rewritten, and shards left over from a previous (larger) run are removed.
+
+    Parameters
+    ----------
+    rules : :obj:`Rule_Collection` or iterable of :obj:`Rule`
+        Rules to write
+    directory : str
+        Directory the shards and manifest are written to (created if needed)
+    basename : str, optional
+        Prefix of each shard's filename, by default `"mailFilters"`
+    max_bytes : int, optional
+        Maximum size (in bytes) of each shard, by default `MAX_SHARD_BYTES`
+    max_entries : int, optional
+        Maximum number of `<entry>` elements in each shard, by default `MAX_SHARD_ENTRIES`
+    max_workers : int, optional
+        Number of threads used to write shards, by default `None` (chosen by :obj:`ThreadPoolExecutor`)
+
+    Returns
+    -------
+    list[Shard]
+        Description of every shard, in order
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST_FILENAME)
+
+    previous_hashes: dict[str, str] = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as manifest_file:
+            previous_hashes = {shard["filename"]: shard["sha256"] for shard in json.load(manifest_file).get("shards", [])}
+
+    shards: list[Shard] = []
+    pending_writes: list[tuple[str, bytes]] = []
+
+    for index, (feed_text, entries) in enumerate(shard_xml_texts(rules, max_bytes, max_entries), start=1):
+        data = feed_text.encode("utf-8")
+        shard = Shard(f"{basename}-{index:04d}.xml", hashlib.sha256(data).hexdigest(), len(data), entries)
+
+        if previous_hashes.get(shard.filename) == shard.sha256 and os.path.exists(os.path.join(directory, shard.filename)):
+            shard.written = False
+        else:
+            pending_writes.append((os.path.join(directory, shard.filename), data))
+
+        shards.append(shard)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda pending_write: _hp.atomic_write(*pending_write), pending_writes))
+
+    current_filenames = {shard.filename for shard in shards}
+    for stale_filename in previous_hashes.keys() - current_filenames:
+        if os.path.basename(stale_filename) != stale_filename:
+            continue
+        stale_path = os.path.join(directory, stale_filename)
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+
+    manifest = {"shards": [{"filename": shard.filename, "sha256": shard.sha256, "bytes": shard.bytes, "entries": shard.entries} for shard in shards]}
+    _hp.atomic_write(manifest_path, json.dumps(manifest, indent=4).encode("utf-8"))
+
+    return shards
+
 # def build_mail_rule_file(filename: str) -> None:
 #     xml_text = f"{build_xml_text(final_string)}"
 
@@ -0,0 +1,160 @@
+import itertools
+import threading
+from typing import Iterable
+
+from ..rules import rule as _R
+from ..rules import rule_spec as _RS
+from ..utils import helpers as _hp
+from . import rule_collection as _RC
+
+__all__ = ["ConcurrentCollectionBuilder"]
+
+
+class _Stripe:
+    """One shard of a :obj:`ConcurrentCollectionBuilder`: a lock and the rules whose names hash to it"""
+
+    __slots__ = ("lock", "rules", "sequences")
+
+    def __init__(self) -> None:
+        self.lock: threading.Lock = threading.Lock()
+        self.rules: dict[str, tuple[str, int, _R.Rule | _RS.RuleSpec]] = {}
+        self.sequences: dict[str, itertools.count] = {}
+
+
+class ConcurrentCollectionBuilder:
+    """Collects rules from several threads and then produces a normal :obj:`Rule_Collection`
+
+    Rules are stored in `stripes` shards, each guarded by its own lock, so threads
+    adding rules with different names rarely wait for each other.  Checking for a
+    duplicate name and inserting the rule happen under the same lock, so two
+    threads can never both add a rule with the same name.  Every rule is tagged
+    with its `source` and its position among the rules of that source, and
+    :obj:`ConcurrentCollectionBuilder.freeze()` orders rules by `(source, position)`,
+    so the final collection does not depend on how the threads were scheduled.
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the collection built by :obj:`ConcurrentCollectionBuilder.freeze()`, by default `"Rule Collection"`
+    stripes : int, optional
+        Number of independently locked shards, by default `16`
+    """
+
+    def __init__(self, name: str = "Rule Collection", stripes: int = 16) -> None:
+        if stripes < 1:
+            raise ValueError(f"stripes needs to be at least 1, but it is {stripes}")
+
+        self.name: str = name
+        """`str` representing the name of the collection that will be built"""
+
+        self._stripes: tuple[_Stripe, ...] = tuple(_Stripe() for _ in range(stripes))
+        """Independently locked shards of the rules, selected by the hash of a rule's name"""
+
+
+    def __len__(self) -> int:
+        return sum(len(stripe.rules) for stripe in self._stripes)
+
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._stripe(name).rules
+
+
+    def _stripe(self, key: str) -> _Stripe:
+        return self._stripes[hash(key) % len(self._stripes)]
+
+
+    def _next_sequence(self, source: str) -> int:
+        """Position of the next rule added from `source`"""
+        source_stripe = self._stripe(source)
+        with source_stripe.lock:
+            sequence = source_stripe.sequences.get(source)
+            if sequence is None:
+                sequence = source_stripe.sequences[source] = itertools.count()
+            return next(sequence)
+
+
+    def add_rules(self, rules_to_add: "_R.Rule | _RS.RuleSpec | list | tuple | set | frozenset | dict", source: str = "") -> None:
+        """Add :obj:`Rule` objects from `source` (safe to call from several threads at once)
+
+        Parameters
+        ----------
+        rules_to_add : :obj:`Rule` or :obj:`RuleSpec` or list or tuple or set or frozenset or dict
+            The :obj:`Rule` (or :obj:`Rule`) that should be added
+        source : str, optional
+            Name of the source the rules were read from, by default `""`.  Rules are ordered by source
+            and then by the order they were added from that source
+
+        Raises
+        ------
+        KeyError
+            Raises a `KeyError` when a rule with the same name has already been added (from any source)
+        TypeError
+            Raises a `TypeError` when a rule is not of type :obj:`Rule`
+        """
+        if isinstance(rules_to_add, (_R.Rule, _RS.RuleSpec)):
+            sequence = self._next_sequence(source)      ## TAKEN BEFORE LOCKING THE RULE'S STRIPE, SO ONLY ONE LOCK IS EVER HELD
+
+            stripe = self._stripe(rules_to_add.name)
+            with stripe.lock:
+                if rules_to_add.name in stripe.rules:
+                    existing_source = stripe.rules[rules_to_add.name][0]
+                    raise KeyError(f"{rules_to_add.name} is already in the collection of rules (added from {existing_source!r})")
+                stripe.rules[rules_to_add.name] = (source, sequence, rules_to_add)
+
+        elif type(rules_to_add) in _hp.ITERABLE_DATA_TYPES:
+            for rule in rules_to_add:
+                self.add_rules(rule, source)
+
+        else:
+            raise TypeError(f"rules_to_add is not of type Rule.  It is of type {type(rules_to_add)}")
+
+
+    def add_rule(self, rule_to_add: _R.Rule | _RS.RuleSpec, source: str = "") -> None:
+        """Alias for :obj:`ConcurrentCollectionBuilder.add_rules()`"""
+        self.add_rules(rule_to_add, source)
+
+
+    def ordered_rules(self, sources: Iterable[str] | None = None) -> list[_R.Rule | _RS.RuleSpec]:
+        """Every rule added so far, ordered by `(source, position within the source)`
+
+        Parameters
+        ----------
+        sources : Iterable[str], optional
+            Order of the sources, by default `None` (sources are sorted by name).
+            Sources that are not listed are placed after the listed ones, sorted by name
+
+        Returns
+        -------
+        list
+            `list` of :obj:`Rule` and :obj:`RuleSpec`
+        """
+        entries = []
+        for stripe in self._stripes:
+            with stripe.lock:
+                entries.extend(stripe.rules.values())
+
+        source_positions = {source: position for position, source in enumerate(sources or ())}
+        entries.sort(key=lambda entry: (source_positions.get(entry[0], len(source_positions)), entry[0], entry[1]))
+
+        return [rule for _, _, rule in entries]
+
+
+    def freeze(self, sources: Iterable[str] | None = None) -> _RC.Rule_Collection:
+        """Builds a :obj:`Rule_Collection` from the rules that have been added
+
+        Call this once every loading thread has finished.
+
+        Parameters
+        ----------
+        sources : Iterable[str], optional
+            Order of the sources in the collection, by default `None` (see :obj:`ConcurrentCollectionBuilder.ordered_rules()`)
+
+        Returns
+        -------
+        Rule_Collection
+            Collection containing every rule in a deterministic order
+        """
+        collection = _RC.Rule_Collection(self.name)
+        collection.add_rules(self.ordered_rules(sources))
+
+        return collection
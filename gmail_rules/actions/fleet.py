@@ -0,0 +1,305 @@
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Container, Iterable, Mapping
+
+from ..rules import address_group as _AG
+from ..rules import rule as _R
+from ..rules import rule_spec as _RS
+from ..utils import helpers as _hp
+from . import build_xmls as _BX
+from . import rule_collection as _RC
+
+__all__ = ["Account", "AccountBuild", "build_fleet"]
+
+
+SUMMARY_FILENAME : str = "fleet-summary.json"
+"""Name of the summary written next to the account feeds"""
+
+_FEED_TAIL : str = "\n</feed>"
+"""End of every feed built by :obj:`build_xml_text()`"""
+
+_rendered_fragments: dict[str, str] = {}
+"""Feed segments of the shared fragments, set once in each worker process by :obj:`_initialize_worker()`"""
+
+_fragment_collections: dict[str, _RC.Rule_Collection] = {}
+"""Shared fragments that some account renders again (see :obj:`_fragment_segment()`), set once in each worker process by :obj:`_initialize_worker()`"""
+
+
+@dataclass
+class Account:
+    """Definition of one mailbox's filter feed for :obj:`build_fleet()`
+
+    Attributes
+    ----------
+    name : `str`
+        Name of the account (used for the feed's filename by default)
+    fragments : `tuple`
+        Names (`str`) of the shared fragments included in the feed, in the order they are added
+    rules : `list`
+        Account-specific :obj:`Rule` (or :obj:`RuleSpec`) added after the fragments
+    overrides : `dict`
+        Replaces rules of the account's fragments by name: each fragment rule named by a
+        key is replaced (in place) by the :obj:`Rule` or :obj:`RuleSpec` it maps to, or
+        dropped when it maps to `None`
+    address_groups : `dict`
+        Email addresses (`list` of `str`) of the account's address groups by name, registered
+        on the account's collection (see :obj:`Rule_Collection.register_address_group()`).
+        They are visible to the account's rules and, like groups of a parent collection,
+        take precedence over the fragments' groups of the same name
+    filename : `str`
+        Name of the feed's file, by default `"{name}.xml"`
+    additional_comment : `str`
+        Comment above all of the account's rules (see :obj:`Rule_Collection.build_final_string()`)
+    """
+    name: str
+    fragments: tuple[str, ...] = ()
+    rules: list[_R.Rule | _RS.RuleSpec] = field(default_factory=list)
+    overrides: dict[str, _R.Rule | _RS.RuleSpec | None] = field(default_factory=dict)
+    address_groups: dict[str, list[str]] = field(default_factory=dict)
+    filename: str | None = None
+    additional_comment: str | None = None
+
+
+    def __post_init__(self) -> None:
+        self.fragments = tuple(self.fragments)
+        if self.filename is None:
+            self.filename = f"{self.name}.xml"
+        if os.path.basename(self.filename) != self.filename:
+            raise ValueError(f"The feed of {self.name} needs to be a filename without directories, but it is {self.filename}")
+
+
+@dataclass
+class AccountBuild:
+    """Result of building one account's feed with :obj:`build_fleet()`
+
+    Attributes
+    ----------
+    name : `str`
+        Name of the account
+    filename : `str`
+        Name of the feed's file (relative to the output directory)
+    bytes : `int`
+        Size of the feed in bytes
+    entries : `int`
+        Number of `<entry>` elements in the feed
+    build_time : `float`
+        Time (in seconds) spent rendering the feed
+    write_time : `float`
+        Time (in seconds) spent writing the feed
+    """
+    name: str
+    filename: str
+    bytes: int
+    entries: int
+    build_time: float
+    write_time: float
+
+
+def _feed_segment(rendered_rules: str) -> str:
+    """Converts rendered rules into the (indented) text they add to a feed
+
+    Indenting and expanding tabs work line by line, and rendered rules always start
+    with a new line, so segments can be joined without changing the result of
+    :obj:`build_xml_text()`
+    """
+    return _hp.indent(rendered_rules).expandtabs(_hp.TAB_SPACING)
+
+
+def _initialize_worker(rendered_fragments: dict[str, str], fragment_collections: dict[str, _RC.Rule_Collection]) -> None:
+    """Stores the shared fragments once per worker process instead of once per account"""
+    global _rendered_fragments, _fragment_collections
+    _rendered_fragments = rendered_fragments
+    _fragment_collections = fragment_collections
+
+
+def _shadowed_groups(fragment: _RC.Rule_Collection, group_names: Container[str]) -> bool:
+    """Whether a rule of `fragment` references one of the account's groups in `group_names`, which take precedence over the fragment's groups"""
+    return bool(group_names) and any(address_group_ref.name in group_names for rule in fragment for address_group_ref in rule.address_group_refs)
+
+
+def _override_rules(collection: _RC.Rule_Collection, overrides: Mapping[str, _R.Rule | _RS.RuleSpec | None]) -> _RC.Rule_Collection:
+    """Copy of `collection` where the rules named in `overrides` are replaced (or dropped when they map to `None`)
+
+    Child collections without any overridden rule are included by reference, so
+    their cached renders are reused.
+    """
+    overridden_collection = _RC.Rule_Collection(collection.name)
+    overridden_collection.address_groups = collection.address_groups
+
+    for member in collection._members:
+        if isinstance(member, _RC.Rule_Collection):
+            if any(rule.name in overrides for rule in member):
+                member = _override_rules(member, overrides)
+            overridden_collection.add_collection(member)
+        elif member.name not in overrides:
+            overridden_collection.add_rule(member)
+        elif overrides[member.name] is not None:
+            overridden_collection.add_rule(overrides[member.name])
+
+    return overridden_collection
+
+
+def _fragment_segment(fragment_name: str, overrides: Mapping[str, _R.Rule | _RS.RuleSpec | None], address_groups: Mapping[str, _AG.AddressGroup]) -> str:
+    """Feed segment of a shared fragment, rendered again only when the account overrides one of its rules or address groups"""
+    fragment = _fragment_collections.get(fragment_name)
+    if fragment is None:
+        return _rendered_fragments[fragment_name]
+
+    overridden = bool(overrides) and any(rule.name in overrides for rule in fragment)
+    if not overridden and not _shadowed_groups(fragment, address_groups):
+        return _rendered_fragments[fragment_name]
+
+    if overridden:
+        fragment = _override_rules(fragment, overrides)
+    return _feed_segment(fragment._render_rules(address_groups))
+
+
+def _build_account(account: Account, directory: str) -> AccountBuild:
+    """Builds and writes the feed of one account (run in a worker process)"""
+    start_time = time.perf_counter()
+
+    account_collection = _RC.Rule_Collection(account.name)
+    for group_name, addresses in account.address_groups.items():
+        account_collection.register_address_group(group_name, addresses)
+    account_collection.add_rules(account.rules)
+
+    segments = [_BX.build_xml_text("")[:-len(_FEED_TAIL)]]
+    if account.additional_comment is not None:
+        segments.append(_feed_segment(_hp.add_xml_comment(account.additional_comment)))
+    segments.append(_feed_segment(account_collection.build_final_string()))
+    segments.extend(_fragment_segment(fragment_name, account.overrides, account_collection.address_groups) for fragment_name in reversed(account.fragments))      ## MATCHES THE ORDER OF build_final_string()
+    segments.append(_FEED_TAIL)
+
+    data = "".join(segments).encode("utf-8")
+    build_time = time.perf_counter() - start_time
+
+    _hp.atomic_write(os.path.join(directory, account.filename), data)
+
+    return AccountBuild(
+        name=account.name,
+        filename=account.filename,
+        bytes=len(data),
+        entries=data.count(b"<entry>"),
+        build_time=build_time,
+        write_time=time.perf_counter() - start_time - build_time,
+    )
+
+
+def build_fleet(
+    accounts: Iterable[Account],
+    fragments: Mapping[str, _RC.Rule_Collection],
+    directory: str,
+    max_workers: int | None = None,
+    chunksize: int = 16,
+) -> list[AccountBuild]:
+    """Builds one filter feed for every account from shared fragments plus account-specific rules
+
+    Each shared fragment (a :obj:`Rule_Collection`) is rendered once, up front, and
+    handed to every worker process when it starts, so fragments are not rebuilt
+    (or sent again) for each account.  Each account's feed is the same as
+    :obj:`build_xml_text()` of a :obj:`Rule_Collection` that includes its fragments
+    (see :obj:`Rule_Collection.add_collection()`) followed by its own rules.  An
+    account can replace or drop fragment rules by name with :obj:`Account.overrides`
+    and define address groups with :obj:`Account.address_groups`; only the fragments
+    whose rules or referenced groups it replaces are rendered again for that account.  Feeds
+    are written with atomic renames, and `fleet-summary.json` records the time and
+    size of every account's feed.
+
+    Parameters
+    ----------
+    accounts : Iterable[Account]
+        Accounts to build
+    fragments : Mapping[str, Rule_Collection]
+        Shared fragments by name
+    directory : str
+        Directory the feeds and summary are written to (created if needed)
+    max_workers : int, optional
+        Number of worker processes, by default `None` (chosen by :obj:`ProcessPoolExecutor`)
+    chunksize : int, optional
+        Number of accounts sent to a worker at a time, by default `16`
+
+    Returns
+    -------
+    list[AccountBuild]
+        Result of every account's build, in the order of `accounts`
+
+    Raises
+    ------
+    KeyError
+        Raises a `KeyError` when an account uses a fragment that is not in `fragments`
+    KeyError
+        Raises a `KeyError` when an account overrides a rule that is not in its fragments
+    KeyError
+        Raises a `KeyError` when two rules of an account's feed have the same name (like :obj:`Rule_Collection.add_collection()`)
+    ValueError
+        Raises a `ValueError` when two accounts would write the same file
+    """
+    accounts = list(accounts)
+    os.makedirs(directory, exist_ok=True)
+
+    filenames = set()
+    for account in accounts:
+        if account.filename in filenames:
+            raise ValueError(f"More than one account writes {account.filename}")
+        filenames.add(account.filename)
+
+        for fragment_name in account.fragments:
+            if fragment_name not in fragments:
+                raise KeyError(f"{account.name} uses the fragment {fragment_name}, which is not defined")
+
+    used_fragments = {fragment_name for account in accounts for fragment_name in account.fragments}
+    fragment_rule_names = {fragment_name: frozenset(rule.name for rule in fragments[fragment_name]) for fragment_name in used_fragments}
+    fragment_collections = {}
+    checked_fragment_pairs = set()
+
+    for account in accounts:
+        for first_fragment, second_fragment in itertools.combinations(account.fragments, 2):
+            if (first_fragment, second_fragment) not in checked_fragment_pairs:
+                duplicate_names = fragment_rule_names[first_fragment] & fragment_rule_names[second_fragment]
+                if duplicate_names or first_fragment == second_fragment:
+                    raise KeyError(f"{account.name} includes {', '.join(sorted(duplicate_names)) or first_fragment} more than once through its fragments")
+                checked_fragment_pairs.add((first_fragment, second_fragment))
+
+        for rule_name in account.overrides:
+            overridden_in = [fragment_name for fragment_name in account.fragments if rule_name in fragment_rule_names[fragment_name]]
+            if not overridden_in:
+                raise KeyError(f"{account.name} overrides {rule_name}, which is not in any of its fragments")
+            for fragment_name in overridden_in:
+                fragment_collections[fragment_name] = fragments[fragment_name]
+
+        for fragment_name in account.fragments:
+            if fragment_name not in fragment_collections and _shadowed_groups(fragments[fragment_name], account.address_groups):
+                fragment_collections[fragment_name] = fragments[fragment_name]
+
+        account_rule_names = [rule.name for rule in account.rules]
+        account_rule_names += [rule.name for rule in account.overrides.values() if rule is not None]
+        seen_names = set()
+        for rule_name in account_rule_names:
+            in_fragments = rule_name not in account.overrides and any(rule_name in fragment_rule_names[fragment_name] for fragment_name in account.fragments)
+            if rule_name in seen_names or in_fragments:
+                raise KeyError(f"{rule_name} is in the feed of {account.name} more than once")
+            seen_names.add(rule_name)
+
+    start_time = time.perf_counter()
+    rendered_fragments = {
+        fragment_name: _feed_segment(fragments[fragment_name]._render_rules())
+        for fragment_name in used_fragments
+    }
+    fragment_time = time.perf_counter() - start_time
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_initialize_worker, initargs=(rendered_fragments, fragment_collections)) as executor:
+        account_builds = list(executor.map(_build_account, accounts, [directory] * len(accounts), chunksize=chunksize))
+
+    summary = {
+        "accounts": [asdict(account_build) for account_build in account_builds],
+        "total_bytes": sum(account_build.bytes for account_build in account_builds),
+        "fragment_time": fragment_time,
+        "wall_time": time.perf_counter() - start_time,
+    }
+    _hp.atomic_write(os.path.join(directory, SUMMARY_FILENAME), json.dumps(summary, indent=4).encode("utf-8"))
+
+    return account_builds
@@ -1,5 +1,8 @@
+from typing import Iterable, Iterator, Mapping
 
+from ..rules import address_group as _AG
 from ..rules import rule as _R
+from ..rules import rule_spec as _RS
 from ..utils import helpers as _hp
 
 
@@ -19,12 +22,30 @@ class Rule_Collection:
         self.name = name
         """`str` representing the name of the collection of rules"""
 
-        self.rules_list: list[_R.Rule] = []
+        self.rules_list: list[_R.Rule | _RS.RuleSpec] = []
         """`list` of `Rule` objects that will be included in a single file"""
 
-        self.rules_dict: dict[str, _R.Rule] = {}
+        self.rules_dict: dict[str, _R.Rule | _RS.RuleSpec] = {}
         """`dict` where keys are a rule's title (`rule_title`) and the values are that rule"""
 
+        self.collections: list[Rule_Collection] = []
+        """`list` of child :obj:`Rule_Collection` objects that are included in this collection by reference"""
+
+        self._members: list[_R.Rule | _RS.RuleSpec | Rule_Collection] = []
+        """`list` of the rules and child collections in the order they were added"""
+
+        self._revision: int = 0
+        """`int` that is incremented every time a rule or collection is added to this collection"""
+
+        self.address_groups: dict[str, _AG.AddressGroup] = {}
+        """`dict` of the :obj:`AddressGroup` registered on this collection, by name"""
+
+        self._render_cache: tuple[tuple, str] | None = None
+        """Cached `(fingerprint, rendered rules)` pair that is reused while the collection is unchanged"""
+
+        self._member_renders: dict[int, tuple] = {}
+        """Cached `(member fingerprint, rendered member, rendered parts)` for each rule (by position in `self._members`)"""
+
 
     def __getitem__(self, name: str) -> _R.Rule:
         """Allows easy retrieval of :obj:`Rule` stored in a `Rule_Collection`
@@ -42,7 +63,43 @@ class Rule_Collection:
         _R.Rule
             :obj:`Rule` with the corresponding name
         """
-        return self.rules_dict[name]
+        if name in self.rules_dict:
+            return self.rules_dict[name]
+
+        for collection in self.collections:
+            try:
+                return collection[name]
+            except KeyError:
+                continue
+
+        raise KeyError(name)
+
+
+    def __iter__(self) -> Iterator[_R.Rule]:
+        """Iterates over every :obj:`Rule` in this collection, including the rules
+        of child collections, in the order they were added
+
+        Yields
+        ------
+        _R.Rule
+            The next :obj:`Rule` in the flattened collection
+        """
+        for member in self._members:
+            if isinstance(member, Rule_Collection):
+                yield from member
+            else:
+                yield member
+
+
+    def __len__(self) -> int:
+        """Number of :obj:`Rule` in this collection, including the rules of child collections
+
+        Returns
+        -------
+        int
+            Total number of rules in the flattened collection
+        """
+        return len(self.rules_list) + sum(len(collection) for collection in self.collections)
 
 
     @property
@@ -58,29 +115,35 @@ class Rule_Collection:
 
 
     #### TODO: FIX THIS TO ACCOUNT FOR INDENTING ####
-    def add_rules(self, rules_to_add: _R.Rule | list | tuple | set | frozenset | dict) -> None:
+    def add_rules(self, rules_to_add: "_R.Rule | _RS.RuleSpec | Rule_Collection | list | tuple | set | frozenset | dict") -> None:
         """Add :obj:`Rule` objects to a :obj:`Rule_Collection`
 
         Parameters
         ----------
-        rules_to_add : :obj:`Rule` or list or tuple or set or frozenset or dict
-            The :obj:`Rule` (or :obj:`Rule`) that should be added to the :obj:`Rule_Collection`
+        rules_to_add : :obj:`Rule` or :obj:`RuleSpec` or :obj:`Rule_Collection` or list or tuple or set or frozenset or dict
+            The :obj:`Rule` (or :obj:`Rule`) that should be added to the :obj:`Rule_Collection`.
+            Child :obj:`Rule_Collection` objects are included by reference (see :obj:`Rule_Collection.add_collection()`)
 
         Raises
         ------
         KeyError
-            Raises a `KeyError` when a certain rule is already in the collection
+            Raises a `KeyError` when a certain rule is already in the collection (or one of its child collections)
         TypeError
             Raises a `TypeError` when a rule is not of type :obj:`Rule`
         TypeError
             Raises a `TypeError` if a rule is not an iterable of :obj:`Rule`
         """
-        if isinstance(rules_to_add, _R.Rule):
-            if rules_to_add.name in self.rules_dict:
+        if isinstance(rules_to_add, (_R.Rule, _RS.RuleSpec)):
+            if self._has_rule_name(rules_to_add.name):
                 raise KeyError(f"{rules_to_add.name} is already in the collection of rules.  Use update_rule() to change the value of this rule")
 
             self.rules_dict[rules_to_add.name] = rules_to_add
             self.rules_list.append(rules_to_add)
+            self._members.append(rules_to_add)
+            self._revision += 1
+
+        elif isinstance(rules_to_add, Rule_Collection):
+            self.add_collection(rules_to_add)
 
         elif type(rules_to_add) in _hp.ITERABLE_DATA_TYPES:
             for rule in rules_to_add:
@@ -93,7 +156,7 @@ class Rule_Collection:
             raise TypeError(f"rules_to_add is not of type Rule.  It is of type {type(rules_to_add)}")
 
 
-    def add_rule(self, rule_to_add: _R.Rule) -> None:
+    def add_rule(self, rule_to_add: _R.Rule | _RS.RuleSpec) -> None:
         """Alias for :obj:`Rule_Collection.add_rules()`.  Adds :obj:`Rule` to a :obj:`Rule_Collection`
 
         Parameters
@@ -113,6 +176,249 @@ class Rule_Collection:
         self.add_rules(rule_to_add)
 
 
+    def add_collection(self, collection_to_add: "Rule_Collection") -> None:
+        """Include a child :obj:`Rule_Collection` in this collection by reference
+
+        The child collection is not copied, so the same collection (e.g. a group of
+        common rules) can be included in many parent collections.  The rendered
+        output of the child is cached on the child itself, so it is only rebuilt
+        once no matter how many parents include it.
+
+        Parameters
+        ----------
+        collection_to_add : :obj:`Rule_Collection`
+            The collection that should be included in this collection
+
+        Raises
+        ------
+        TypeError
+            Raises a `TypeError` when `collection_to_add` is not a :obj:`Rule_Collection`
+        ValueError
+            Raises a `ValueError` when including the collection would create a cycle
+        KeyError
+            Raises a `KeyError` when a rule of `collection_to_add` has the same name as a rule already in this collection
+        """
+        if not isinstance(collection_to_add, Rule_Collection):
+            raise TypeError(f"collection_to_add is not of type Rule_Collection.  It is of type {type(collection_to_add)}")
+
+        if collection_to_add is self or self in collection_to_add.iter_collections():
+            raise ValueError(f"Adding {collection_to_add.name} to {self.name} would create a cycle of collections")
+
+        duplicate_names = [rule.name for rule in collection_to_add if self._has_rule_name(rule.name)]
+        if duplicate_names:
+            raise KeyError(f"{', '.join(duplicate_names)} from {collection_to_add.name} are already in {self.name}")
+
+        self.collections.append(collection_to_add)
+        self._members.append(collection_to_add)
+        self._revision += 1
+
+
+    def register_address_group(self, name: str, addresses: Iterable[str] = ()) -> _AG.AddressGroup:
+        """Registers a named group of email addresses that rules can reference with :obj:`AddressGroupRef`
+
+        The group is also available to the rules of every child collection.  A group
+        registered on a parent collection takes precedence over a child's group of the
+        same name.
+
+        Parameters
+        ----------
+        name : str
+            Name of the group
+        addresses : Iterable[str], optional
+            Email addresses in the group, by default `()`
+
+        Returns
+        -------
+        AddressGroup
+            The registered group (use :obj:`AddressGroup.ref` in a rule's `list_of_emails`)
+
+        Raises
+        ------
+        KeyError
+            Raises a `KeyError` when a group with this name is already registered
+        """
+        if name in self.address_groups:
+            raise KeyError(f"{name} is already an address group of {self.name}.  Use update_address_group() to change its addresses")
+
+        address_group = _AG.AddressGroup(name, addresses)
+        self.address_groups[name] = address_group
+
+        return address_group
+
+
+    def update_address_group(self, name: str, addresses: Iterable[str]) -> None:
+        """Replaces the addresses of a registered address group
+
+        Only the entries of rules that reference the group are rebuilt by the next build.
+
+        Parameters
+        ----------
+        name : str
+            Name of the group
+        addresses : Iterable[str]
+            New email addresses of the group
+
+        Raises
+        ------
+        KeyError
+            Raises a `KeyError` when no group with this name is registered
+        """
+        self.address_groups[name].update(addresses)
+
+
+    def resolve_address_groups(self) -> dict[str, _AG.AddressGroup]:
+        """Collects the address groups of this collection and all of its child collections
+
+        Returns
+        -------
+        dict[str, AddressGroup]
+            Every registered group by name (groups of parent collections take precedence)
+        """
+        address_groups = {}
+        for collection in self.collections:
+            address_groups.update(collection.resolve_address_groups())
+        address_groups.update(self.address_groups)
+
+        return address_groups
+
+
+    def _has_rule_name(self, name: str) -> bool:
+        """Whether a rule named `name` is in this collection or any of its child collections"""
+        return name in self.rules_dict or any(collection._has_rule_name(name) for collection in self.collections)
+
+
+    def iter_collections(self) -> Iterator["Rule_Collection"]:
+        """Iterates over every child :obj:`Rule_Collection` (recursively) included in this collection
+
+        Yields
+        ------
+        Rule_Collection
+            The next child collection
+        """
+        for collection in self.collections:
+            yield collection
+            yield from collection.iter_collections()
+
+
+    def _visible_address_groups(self, inherited_address_groups: Mapping[str, _AG.AddressGroup] | None = None) -> Mapping[str, _AG.AddressGroup]:
+        """Address groups that the rules of this collection can reference (groups of parent collections take precedence)"""
+        if not inherited_address_groups:
+            return self.address_groups
+        if not self.address_groups:
+            return inherited_address_groups
+        return {**self.address_groups, **inherited_address_groups}
+
+
+    @staticmethod
+    def _rule_fingerprint(rule: "_R.Rule | _RS.RuleSpec", address_groups: Mapping[str, _AG.AddressGroup]) -> tuple:
+        """Fingerprint of a rule (see :obj:`Rule._render_key()`), including the `(uid, revision)` of every address group it references"""
+        if not rule.address_group_refs:
+            return rule._render_key()
+        return (rule._render_key(), tuple(
+            address_groups[address_group_ref.name].key if address_group_ref.name in address_groups else None
+            for address_group_ref in rule.address_group_refs
+        ))
+
+
+    def _fingerprint(self, inherited_address_groups: Mapping[str, _AG.AddressGroup] | None = None) -> tuple:
+        """Builds a `tuple` that changes whenever this collection (or anything it includes) changes
+
+        Parameters
+        ----------
+        inherited_address_groups : Mapping[str, AddressGroup], optional
+            Address groups registered on parent collections, by default `None`
+
+        Returns
+        -------
+        tuple
+            Fingerprint of the current state of the collection
+        """
+        address_groups = self._visible_address_groups(inherited_address_groups)
+
+        return (self._revision, tuple(
+            member._fingerprint(address_groups) if isinstance(member, Rule_Collection) else self._rule_fingerprint(member, address_groups)
+            for member in self._members
+        ))
+
+
+    def _render_rules(self, inherited_address_groups: Mapping[str, _AG.AddressGroup] | None = None) -> str:
+        """Renders the rules of this collection (and its child collections), reusing
+        the cached render when nothing has changed since the last build
+
+        When something has changed, only the rules whose fingerprint changed (e.g.
+        the rules that reference an updated address group) are rendered again.
+
+        Parameters
+        ----------
+        inherited_address_groups : Mapping[str, AddressGroup], optional
+            Address groups registered on parent collections, by default `None`
+
+        Returns
+        -------
+        str
+            `str` representing the xmls of all the rules in this collection
+        """
+        fingerprint = self._fingerprint(inherited_address_groups)
+
+        if self._render_cache is not None and self._render_cache[0] == fingerprint:
+            return self._render_cache[1]
+
+        address_groups = self._visible_address_groups(inherited_address_groups)
+
+        rendered_members = []
+        for index in reversed(range(len(self._members))):      ## MAYBE REMOVE REVERSAL
+            member = self._members[index]
+            if isinstance(member, Rule_Collection):
+                rendered_members.append(member._render_rules(address_groups))
+                continue
+
+            rendered_members.append(self._render_member(index, fingerprint[1][index], address_groups)[1])
+
+        rendered_rules = "".join(rendered_members)
+        self._render_cache = (fingerprint, rendered_rules)
+
+        return rendered_rules
+
+
+    def _render_member(self, index: int, member_fingerprint: tuple, address_groups: Mapping[str, _AG.AddressGroup]) -> tuple:
+        """Cached `(member fingerprint, rendered member, rendered parts)` of the rule at `self._members[index]`, rendered again only when its fingerprint changed"""
+        member_render = self._member_renders.get(index)
+        if member_render is None or member_render[0] != member_fingerprint:
+            member = self._members[index]
+            rule_parts = tuple(member.build_rule_parts(address_groups) if member.address_group_refs else member.build_rule_parts())
+            member_render = (member_fingerprint, "\n\n" + "\n\n".join(rule_parts), rule_parts)
+            self._member_renders[index] = member_render
+        return member_render
+
+
+    def iter_rule_parts(self, inherited_address_groups: Mapping[str, _AG.AddressGroup] | None = None) -> Iterator[tuple[_R.Rule | _RS.RuleSpec, tuple[str, ...]]]:
+        """Iterates over every rule with its rendered parts (see :obj:`Rule.build_rule_parts()`),
+        in the order of :obj:`Rule_Collection.build_final_string()`
+
+        The parts come from the same per-rule render caches as :obj:`Rule_Collection.build_final_string()`,
+        so only rules that changed since the last build are rendered again.
+
+        Parameters
+        ----------
+        inherited_address_groups : Mapping[str, AddressGroup], optional
+            Address groups registered on parent collections, by default `None`
+
+        Yields
+        ------
+        tuple[Rule | RuleSpec, tuple[str, ...]]
+            The next rule and its rendered parts
+        """
+        fingerprint = self._fingerprint(inherited_address_groups)
+        address_groups = self._visible_address_groups(inherited_address_groups)
+
+        for index in reversed(range(len(self._members))):      ## MATCHES THE ORDER OF _render_rules()
+            member = self._members[index]
+            if isinstance(member, Rule_Collection):
+                yield from member.iter_rule_parts(address_groups)
+            else:
+                yield member, self._render_member(index, fingerprint[1][index], address_groups)[2]
+
+
     def build_final_string(self, additional_comment: str = None) -> str:
         """Builds the final properly formatted collection of rules
 
@@ -131,8 +437,7 @@ class Rule_Collection:
         if additional_comment is not None:
             final_string += f"{_hp.add_xml_comment(additional_comment)}"
 
-        for rule in reversed(self.rules_list):      ## MAYBE REMOVE REVERSAL
-            final_string += f"\n\n{rule.build_rule()}"
+        final_string += self._render_rules()
 
         return final_string
     #### TODO: FIX THIS TO ACCOUNT FOR INDENTING ^^^ ####
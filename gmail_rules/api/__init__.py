@@ -0,0 +1,8 @@
+"""
+api
+===
+"""
+
+from .filters import FilterDiff, rule_to_filters, collection_to_filters, diff_filters
+from .uploader import GmailFilterUploader, TokenBucket, UploadStats
+from .fake_server import FakeGmailServer
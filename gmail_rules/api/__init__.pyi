@@ -0,0 +1,17 @@
+from ..api.filters import (
+    FilterDiff,
+    rule_to_filters,
+    collection_to_filters,
+    diff_filters
+)
+from ..api.uploader import (
+    GmailFilterUploader,
+    TokenBucket,
+    UploadStats
+)
+from ..api.fake_server import (
+    FakeGmailServer
+)
+
+__all__: list[str]
+__path__: list[str]
@@ -0,0 +1,199 @@
+import asyncio
+import itertools
+import json
+import re
+
+__all__ = ["FakeGmailServer"]
+
+
+_FILTERS_PATH_PATTERN = re.compile(r"^/gmail/v1/users/(?P<user_id>[^/]+)/settings/filters(?:/(?P<filter_id>[^/?]+))?/?(?:\?.*)?$")
+
+_REASONS = {200: "OK", 204: "No Content", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed", 503: "Service Unavailable"}
+
+
+class FakeGmailServer:
+    """Local stand-in for the Gmail settings filters API, used to test :obj:`GmailFilterUploader`
+
+    Supports listing, getting, creating and deleting filters over keep-alive
+    (and pipelined) HTTP/1.1 connections.  Filters are kept in memory in
+    `self.filters`.
+
+    Use it as an async context manager::
+
+        async with FakeGmailServer() as server:
+            uploader = GmailFilterUploader(base_url=server.base_url)
+
+    Parameters
+    ----------
+    host : str, optional
+        Interface to listen on, by default `"127.0.0.1"`
+    port : int, optional
+        Port to listen on, by default `0` (any free port)
+    access_token : str, optional
+        When set, requests without this bearer token are rejected with `401`, by default `None`
+    fail_first : int, optional
+        Number of initial requests that fail with `failure_status` (to exercise retries), by default `0`
+    failure_status : int, optional
+        Status returned for the failing requests, by default `503`
+    latency : float, optional
+        Seconds to wait before answering each request, by default `0.0`
+    drop_responses : int, optional
+        Number of initial requests that are applied but whose connection is closed
+        before the response is sent (to exercise lost responses), by default `0`
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        access_token: str | None = None,
+        fail_first: int = 0,
+        failure_status: int = 503,
+        latency: float = 0.0,
+        drop_responses: int = 0,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.access_token = access_token
+        self.fail_first = fail_first
+        self.failure_status = failure_status
+        self.latency = latency
+        self.drop_responses = drop_responses
+
+        self.filters: dict[str, dict[str, dict]] = {}
+        """Filters stored by the server, keyed by user ID and then filter ID"""
+
+        self.request_count: int = 0
+        """Number of requests received"""
+
+        self.connection_count: int = 0
+        """Number of connections opened"""
+
+        self.max_concurrent_connections: int = 0
+        """Largest number of connections that were open at the same time"""
+
+        self._open_connections: int = 0
+        self._ids = itertools.count(1)
+        self._server: asyncio.base_events.Server | None = None
+
+
+    @property
+    def base_url(self) -> str:
+        """URL that should be passed to :obj:`GmailFilterUploader` as its `base_url`"""
+        return f"http://{self.host}:{self.port}"
+
+
+    async def start(self) -> None:
+        """Starts listening for connections"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+
+    async def close(self) -> None:
+        """Stops the server"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+    async def __aenter__(self) -> "FakeGmailServer":
+        await self.start()
+        return self
+
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connection_count += 1
+        self._open_connections += 1
+        self.max_concurrent_connections = max(self.max_concurrent_connections, self._open_connections)
+
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                content_length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(content_length) if content_length else b""
+
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                status, response = self._respond(method, path, headers, body)
+                if self.request_count <= self.drop_responses:
+                    break
+
+                response_body = json.dumps(response).encode() if response is not None else b""
+
+                writer.write(
+                    f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(response_body)}\r\nConnection: keep-alive\r\n\r\n".encode("latin-1") + response_body
+                )
+                await writer.drain()
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+        finally:
+            self._open_connections -= 1
+            writer.close()
+
+
+    def _respond(self, method: str, path: str, headers: dict[str, str], body: bytes) -> tuple[int, dict | None]:
+        """Handles one request and returns its status and JSON response"""
+        self.request_count += 1
+
+        if self.request_count <= self.fail_first:
+            return self.failure_status, {"error": {"code": self.failure_status, "message": "Injected failure"}}
+
+        if self.access_token is not None and headers.get("authorization") != f"Bearer {self.access_token}":
+            return 401, {"error": {"code": 401, "message": "Invalid credentials"}}
+
+        match = _FILTERS_PATH_PATTERN.match(path)
+        if match is None:
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+
+        user_filters = self.filters.setdefault(match["user_id"], {})
+        filter_id = match["filter_id"]
+
+        if method == "GET" and filter_id is None:
+            return 200, {"filter": list(user_filters.values())} if user_filters else {}
+
+        if method == "POST" and filter_id is None:
+            try:
+                new_filter = json.loads(body)
+            except ValueError:
+                return 400, {"error": {"code": 400, "message": "Invalid JSON"}}
+
+            if not isinstance(new_filter, dict) or not new_filter.get("criteria") and not new_filter.get("action"):
+                return 400, {"error": {"code": 400, "message": "Filter requires criteria or an action"}}
+
+            new_filter = {"id": f"filter-{next(self._ids)}", "criteria": new_filter.get("criteria", {}), "action": new_filter.get("action", {})}
+            user_filters[new_filter["id"]] = new_filter
+            return 200, new_filter
+
+        if filter_id is not None and filter_id not in user_filters and method in ("GET", "DELETE"):
+            return 404, {"error": {"code": 404, "message": "Filter not found"}}
+
+        if method == "GET":
+            return 200, user_filters[filter_id]
+
+        if method == "DELETE":
+            del user_filters[filter_id]
+            return 204, None
+
+        return 405, {"error": {"code": 405, "message": "Method Not Allowed"}}
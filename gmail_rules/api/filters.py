@@ -0,0 +1,163 @@
+import json
+from dataclasses import dataclass, field
+from typing import Iterable, Mapping
+
+from ..rules import address_group as _AG
+from ..rules import rule as _R
+
+__all__ = ["FilterDiff", "rule_to_filters", "collection_to_filters", "diff_filters"]
+
+
+CRITERIA_ATTRIBUTES : dict[str, str] = {
+    "from": "from",
+    "subject": "subject",
+    "hasTheWord": "query",
+    "doesNotHaveTheWord": "negatedQuery",
+}
+"""Maps :obj:`Rule` attribute names onto the Gmail API's filter `criteria` fields"""
+
+
+@dataclass
+class FilterDiff:
+    """Set of changes needed to bring a Gmail account's filters in line with a :obj:`Rule_Collection`
+
+    Attributes
+    ----------
+    create : `list`
+        Gmail API filter resources (`dict`) that should be created
+    delete : `list`
+        IDs (`str`) of existing filters that should be deleted
+    """
+    create: list[dict] = field(default_factory=list)
+    delete: list[str] = field(default_factory=list)
+
+
+def rule_to_filters(rule: _R.Rule, label_ids: Mapping[str, str] | None = None, address_groups: Mapping[str, _AG.AddressGroup] | None = None) -> list[dict]:
+    """Converts a :obj:`Rule` into Gmail API filter resources
+
+    Like the xml representation of a rule, one filter is generated for each of the
+    rule's labels (or a single filter when the rule has no labels), and for each
+    chunk of the `from` criteria of a rule whose emails are an :obj:`AddressSet`.
+    A rule whose address groups are all empty (and has no other senders) has no filters.
+
+    Parameters
+    ----------
+    rule : :obj:`Rule`
+        Rule to convert
+    label_ids : Mapping[str, str], optional
+        Maps label names onto Gmail label IDs, by default `None` (label names are used as IDs)
+    address_groups : Mapping[str, AddressGroup], optional
+        Registered address groups used to resolve the rule's :obj:`AddressGroupRef`, by default `None`
+
+    Returns
+    -------
+    list[dict]
+        `list` of filter resources with `criteria` and `action` keys
+    """
+    label_ids = label_ids or {}
+
+    criteria = {
+        api_name: rule.rule_attributes[attribute_name]
+        for attribute_name, api_name in CRITERIA_ATTRIBUTES.items()
+        if attribute_name in rule.rule_attributes
+    }
+
+    if getattr(rule, "address_group_refs", ()):
+        from_criteria = rule.resolve_from(address_groups)
+        if from_criteria is None:
+            return []
+        criteria["from"] = from_criteria
+
+    remove_label_ids = []
+    if rule.rule_attributes.get("shouldArchive") == "true":
+        remove_label_ids.append("INBOX")
+    if rule.rule_attributes.get("shouldNeverSpam") == "true":
+        remove_label_ids.append("SPAM")
+
+    sender_chunks = [None]
+    if getattr(rule, "address_set", None) is not None:
+        sender_chunks = list(rule.address_set.chunks())
+
+    filters = []
+    for sender_chunk in sender_chunks:
+        if sender_chunk is not None:
+            criteria["from"] = sender_chunk
+
+        for label in (rule.labels or [None]):
+            action = {}
+            if label is not None:
+                action["addLabelIds"] = [label_ids.get(label, label)]
+            if remove_label_ids:
+                action["removeLabelIds"] = list(remove_label_ids)
+
+            filters.append({"criteria": dict(criteria), "action": action})
+
+    return filters
+
+
+def collection_to_filters(collection: Iterable[_R.Rule], label_ids: Mapping[str, str] | None = None, address_groups: Mapping[str, _AG.AddressGroup] | None = None) -> list[dict]:
+    """Converts every :obj:`Rule` in a :obj:`Rule_Collection` into Gmail API filter resources
+
+    Parameters
+    ----------
+    collection : :obj:`Rule_Collection` or iterable of :obj:`Rule`
+        Rules to convert
+    label_ids : Mapping[str, str], optional
+        Maps label names onto Gmail label IDs, by default `None`
+    address_groups : Mapping[str, AddressGroup], optional
+        Address groups referenced by the rules, by default `None` (the groups registered on `collection`)
+
+    Returns
+    -------
+    list[dict]
+        `list` of filter resources for every rule in the collection
+    """
+    if address_groups is None and hasattr(collection, "resolve_address_groups"):
+        address_groups = collection.resolve_address_groups()
+
+    filters = []
+    for rule in collection:
+        filters.extend(rule_to_filters(rule, label_ids, address_groups))
+
+    return filters
+
+
+def _filter_key(filter_resource: dict) -> str:
+    """Canonical `str` used to compare two filters while ignoring their IDs"""
+    return json.dumps(
+        {"criteria": filter_resource.get("criteria", {}), "action": filter_resource.get("action", {})},
+        sort_keys=True,
+    )
+
+
+def diff_filters(existing_filters: list[dict], desired_filters: list[dict]) -> FilterDiff:
+    """Computes which filters need to be created and deleted so an account matches `desired_filters`
+
+    Parameters
+    ----------
+    existing_filters : list[dict]
+        Filters currently in the account (as returned by the Gmail API, including their `id`)
+    desired_filters : list[dict]
+        Filters that the account should end up with
+
+    Returns
+    -------
+    FilterDiff
+        Filters to create and IDs of filters to delete.  Filters that already exist are left alone
+    """
+    existing_by_key: dict[str, list[str]] = {}
+    for existing_filter in existing_filters:
+        existing_by_key.setdefault(_filter_key(existing_filter), []).append(existing_filter["id"])
+
+    diff = FilterDiff()
+    for desired_filter in desired_filters:
+        matching_ids = existing_by_key.get(_filter_key(desired_filter))
+        if matching_ids:
+            matching_ids.pop()
+        else:
+            diff.create.append(desired_filter)
+
+    for leftover_ids in existing_by_key.values():
+        diff.delete.extend(leftover_ids)
+
+    return diff
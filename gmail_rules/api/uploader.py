@@ -0,0 +1,585 @@
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Mapping
+from urllib.parse import urlsplit
+
+from ..actions import rule_collection as _RC
+from . import filters as _F
+
+__all__ = ["GmailFilterUploader", "TokenBucket", "UploadStats"]
+
+
+RETRY_STATUSES : frozenset = frozenset({429, 500, 502, 503, 504})
+"""HTTP status codes that are retried with backoff"""
+
+FILTERS_PATH : str = "/gmail/v1/users/{user_id}/settings/filters"
+"""Path of the Gmail settings filters endpoint"""
+
+
+class TokenBucket:
+    """Token-bucket rate limiter shared by every request made by a :obj:`GmailFilterUploader`
+
+    Parameters
+    ----------
+    rate : float
+        Number of tokens added to the bucket every second
+    capacity : float, optional
+        Maximum number of tokens the bucket can hold (the allowed burst), by default `rate`
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        if rate <= 0:
+            raise ValueError(f"rate needs to be positive, but currently is {rate}")
+
+        self.rate: float = rate
+        """Number of tokens added to the bucket every second"""
+
+        self.capacity: float = max(capacity or rate, 1.0)
+        """Maximum number of tokens the bucket can hold"""
+
+        self._tokens: float = self.capacity
+        self._updated: float = time.monotonic()
+        self._lock: asyncio.Lock = asyncio.Lock()
+
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Waits until `tokens` tokens are available and removes them from the bucket
+
+        Parameters
+        ----------
+        tokens : float, optional
+            Number of tokens to take, by default `1.0`
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+@dataclass
+class UploadStats:
+    """Results and throughput metrics of a :obj:`GmailFilterUploader` run
+
+    Attributes
+    ----------
+    created : `list`
+        IDs (`str`) of the filters that were created
+    deleted : `int`
+        Number of filters that were deleted
+    requests : `int`
+        Number of HTTP responses received (including ones that were retried)
+    retries : `int`
+        Number of operations that had to be retried
+    failures : `list`
+        `(method, path, status, body)` of every operation that permanently failed
+    elapsed : `float`
+        Wall time of the run in seconds
+    """
+    created: list[str] = field(default_factory=list)
+    deleted: int = 0
+    requests: int = 0
+    retries: int = 0
+    failures: list[tuple[str, str, int, str]] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def operations(self) -> int:
+        """Number of operations that succeeded"""
+        return len(self.created) + self.deleted
+
+    @property
+    def operations_per_second(self) -> float:
+        """Successful operations per second of wall time"""
+        return self.operations / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def requests_per_second(self) -> float:
+        """HTTP requests per second of wall time"""
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+
+@dataclass
+class _Operation:
+    """Single HTTP request that creates or deletes one filter"""
+    method: str
+    path: str
+    body: bytes = b""
+    key: str = ""
+    """Canonical key of the filter being created, used to find it when its response was lost"""
+    in_doubt: bool = False
+    """Whether the request was sent but its response never arrived"""
+
+
+class _HTTPConnection:
+    """Minimal keep-alive HTTP/1.1 connection that supports pipelined requests"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+
+
+    @classmethod
+    async def open(cls, host: str, port: int, use_ssl: bool) -> "_HTTPConnection":
+        reader, writer = await asyncio.open_connection(host, port, ssl=use_ssl or None)
+        return cls(reader, writer)
+
+
+    def write_request(self, method: str, path: str, headers: Mapping[str, str], body: bytes) -> None:
+        header_lines = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        self.writer.write(f"{method} {path} HTTP/1.1\r\n{header_lines}Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+
+
+    async def read_response(self) -> tuple[int, dict[str, str], bytes]:
+        status_line = await self.reader.readline()
+        if not status_line:
+            self.closed = True
+            raise ConnectionError("Connection closed by the server")
+
+        status = int(status_line.split(b" ", 2)[1])
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                chunk_size = int((await self.reader.readline()).split(b";", 1)[0], 16)
+                if chunk_size == 0:
+                    while (await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await self.reader.readexactly(chunk_size))
+                await self.reader.readline()
+            body = b"".join(chunks)
+        else:
+            content_length = int(headers.get("content-length", 0))
+            body = await self.reader.readexactly(content_length) if content_length else b""
+
+        if headers.get("connection", "").lower() == "close":
+            self.closed = True
+
+        return status, headers, body
+
+
+    def close(self) -> None:
+        self.closed = True
+        self.writer.close()
+
+
+class _ConnectionPool:
+    """Pool of at most `size` reusable :obj:`_HTTPConnection` objects to a single host"""
+
+    def __init__(self, host: str, port: int, use_ssl: bool, size: int) -> None:
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self._idle: list[_HTTPConnection] = []
+        self._semaphore = asyncio.Semaphore(size)
+
+
+    async def acquire(self, timeout: float | None = None) -> _HTTPConnection:
+        await self._semaphore.acquire()
+        try:
+            while self._idle:
+                connection = self._idle.pop()
+                if not connection.closed and not connection.reader.at_eof():
+                    return connection
+                connection.close()
+            return await asyncio.wait_for(_HTTPConnection.open(self.host, self.port, self.use_ssl), timeout)
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+
+    def release(self, connection: _HTTPConnection | None, reusable: bool) -> None:
+        # `acquire` already released the semaphore when it failed to return a connection
+        if connection is None:
+            return
+        if reusable and not connection.closed:
+            self._idle.append(connection)
+        else:
+            connection.close()
+        self._semaphore.release()
+
+
+    def close(self) -> None:
+        while self._idle:
+            self._idle.pop().close()
+
+
+class GmailFilterUploader:
+    """Creates and deletes Gmail filters concurrently through the Gmail settings filters API
+
+    Operations are split into batches of `batch_size` requests.  Each batch is
+    pipelined over one pooled keep-alive connection, every request waits on a
+    shared :obj:`TokenBucket`, and requests that fail with a retryable status (or
+    a dropped connection) are retried with exponential backoff and jitter.
+
+    When a connection drops before a filter creation was answered, the server may
+    already have created the filter.  The account's filters are listed again and
+    the creation is only re-sent when no matching filter exists that the run has
+    not already accounted for (an identical filter that existed before the run is
+    therefore taken as the created one).  Deletions are always re-sent, since
+    deleting a filter twice only returns `404`.  Opening a connection and waiting
+    for a response both give up after `timeout` seconds.
+
+    Use it as an async context manager so the pooled connections are closed::
+
+        async with GmailFilterUploader(access_token=token) as uploader:
+            stats = await uploader.sync(collection)
+
+    Parameters
+    ----------
+    access_token : str, optional
+        OAuth 2.0 access token sent as a bearer token, by default `None`
+    base_url : str, optional
+        Root URL of the API, by default `"https://gmail.googleapis.com"`
+    user_id : str, optional
+        Gmail user whose filters are changed, by default `"me"`
+    connections : int, optional
+        Maximum number of concurrent connections, by default `8`
+    batch_size : int, optional
+        Number of requests pipelined on a connection at once, by default `10`
+    requests_per_second : float, optional
+        Sustained request rate, by default `10.0`.  `None` disables rate limiting
+    burst : float, optional
+        Number of requests that can be sent at once before rate limiting kicks in, by default `requests_per_second`
+    max_retries : int, optional
+        Number of times an operation is retried before it is recorded as a failure, by default `5`
+    backoff_base : float, optional
+        Delay (in seconds) before the first retry, doubled on every attempt, by default `0.5`
+    backoff_max : float, optional
+        Maximum delay (in seconds) between retries, by default `32.0`
+    label_ids : Mapping[str, str], optional
+        Maps label names onto Gmail label IDs, by default `None` (label names are used as IDs)
+    timeout : float, optional
+        Seconds to wait for a connection to open or a response to arrive before the
+        connection is treated as dropped, by default `30.0`.  `None` waits forever
+    """
+
+    def __init__(
+        self,
+        access_token: str | None = None,
+        base_url: str = "https://gmail.googleapis.com",
+        user_id: str = "me",
+        connections: int = 8,
+        batch_size: int = 10,
+        requests_per_second: float | None = 10.0,
+        burst: float | None = None,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 32.0,
+        label_ids: Mapping[str, str] | None = None,
+        timeout: float | None = 30.0,
+    ) -> None:
+        url = urlsplit(base_url)
+        self.access_token = access_token
+        self.host: str = url.hostname
+        self.use_ssl: bool = url.scheme == "https"
+        self.port: int = url.port or (443 if self.use_ssl else 80)
+        self.path: str = url.path.rstrip("/") + FILTERS_PATH.format(user_id=user_id)
+        self.connections = connections
+        self.batch_size = max(batch_size, 1)
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.label_ids = label_ids
+        self.timeout = timeout
+
+        self._pool: _ConnectionPool | None = None
+        self._bucket: TokenBucket | None = None
+
+
+    async def __aenter__(self) -> "GmailFilterUploader":
+        return self
+
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+    async def close(self) -> None:
+        """Closes every pooled connection and drops the rate limiter, so the uploader can be reused in another event loop"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        self._bucket = None
+
+
+    def _ensure_started(self) -> None:
+        """Creates the connection pool and rate limiter inside the running event loop"""
+        if self._pool is None:
+            self._pool = _ConnectionPool(self.host, self.port, self.use_ssl, self.connections)
+        if self._bucket is None and self.requests_per_second:
+            self._bucket = TokenBucket(self.requests_per_second, self.burst)
+
+
+    def _headers(self, has_body: bool) -> dict[str, str]:
+        headers = {"Host": self.host, "Connection": "keep-alive", "Accept": "application/json"}
+        if self.access_token:
+            headers["Authorization"] = f"Bearer {self.access_token}"
+        if has_body:
+            headers["Content-Type"] = "application/json"
+        return headers
+
+
+    def _backoff_delay(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
+
+
+    async def list_filters(self) -> list[dict]:
+        """Retrieves every filter that currently exists in the account
+
+        Returns
+        -------
+        list[dict]
+            Filter resources (including their `id`)
+
+        Raises
+        ------
+        ConnectionError
+            Raises a `ConnectionError` when the filters cannot be listed
+        asyncio.TimeoutError
+            Raises an `asyncio.TimeoutError` when the connection or the response takes longer than `timeout`
+        """
+        self._ensure_started()
+        if self._bucket is not None:
+            await self._bucket.acquire()
+
+        connection = None
+        reusable = False
+        try:
+            connection = await self._pool.acquire(self.timeout)
+            connection.write_request("GET", self.path, self._headers(False), b"")
+            await connection.writer.drain()
+            status, _, body = await asyncio.wait_for(connection.read_response(), self.timeout)
+            reusable = True
+        finally:
+            self._pool.release(connection, reusable)
+
+        if status >= 400:
+            raise ConnectionError(f"Listing filters failed with status {status}: {body.decode(errors='replace')}")
+
+        return json.loads(body or b"{}").get("filter", [])
+
+
+    async def upload(self, filters_source: "_RC.Rule_Collection | _F.FilterDiff") -> UploadStats:
+        """Creates (and deletes) filters concurrently
+
+        Parameters
+        ----------
+        filters_source : :obj:`Rule_Collection` or :obj:`FilterDiff`
+            A collection whose rules should all be created as filters, or a diff
+            listing the filters to create and the filter IDs to delete
+
+        Returns
+        -------
+        UploadStats
+            Created IDs, failures and throughput metrics of the run
+
+        Raises
+        ------
+        TypeError
+            Raises a `TypeError` when `filters_source` is not a collection or a diff
+        """
+        if isinstance(filters_source, _RC.Rule_Collection):
+            filters_source = _F.FilterDiff(create=_F.collection_to_filters(filters_source, self.label_ids))
+
+        elif not isinstance(filters_source, _F.FilterDiff):
+            raise TypeError(f"filters_source needs to be a Rule_Collection or FilterDiff, but currently is of type {type(filters_source)}")
+
+        self._ensure_started()
+
+        operations = [_Operation("DELETE", f"{self.path}/{filter_id}") for filter_id in filters_source.delete]
+        operations += [
+            _Operation("POST", self.path, json.dumps(new_filter).encode(), _F._filter_key(new_filter))
+            for new_filter in filters_source.create
+        ]
+
+        stats = UploadStats()
+        claims: dict[str, _Operation] = {}
+        start_time = time.perf_counter()
+
+        await asyncio.gather(*(
+            self._run_batch(operations[index:index + self.batch_size], stats, claims)
+            for index in range(0, len(operations), self.batch_size)
+        ))
+
+        stats.elapsed = time.perf_counter() - start_time
+        return stats
+
+
+    async def sync(self, collection: "_RC.Rule_Collection") -> UploadStats:
+        """Makes the account's filters match `collection`, only creating and deleting what changed
+
+        Parameters
+        ----------
+        collection : :obj:`Rule_Collection`
+            Rules the account should end up with
+
+        Returns
+        -------
+        UploadStats
+            Created IDs, failures and throughput metrics of the run
+        """
+        existing_filters = await self.list_filters()
+        desired_filters = _F.collection_to_filters(collection, self.label_ids)
+
+        return await self.upload(_F.diff_filters(existing_filters, desired_filters))
+
+
+    async def _run_batch(self, batch: list[_Operation], stats: UploadStats, claims: dict[str, _Operation]) -> None:
+        """Pipelines one batch of operations over a pooled connection, retrying failed operations"""
+        attempt = 0
+        remaining = batch
+
+        while remaining:
+            postponed: list[_Operation] = []
+            if any(operation.in_doubt for operation in remaining):
+                try:
+                    remaining = await self._drop_applied(remaining, stats, claims)
+                except (OSError, ValueError, asyncio.TimeoutError):
+                    postponed = [operation for operation in remaining if operation.in_doubt]
+                    remaining = [operation for operation in remaining if not operation.in_doubt]
+
+            retry, retry_after = await self._send_batch(remaining, stats, claims) if remaining else ([], 0.0)
+            retry += postponed
+
+            if retry:
+                attempt += 1
+                if attempt > self.max_retries:
+                    stats.failures.extend((operation.method, operation.path, 0, "retries exhausted") for operation in retry)
+                    return
+
+                stats.retries += len(retry)
+                await asyncio.sleep(max(retry_after, self._backoff_delay(attempt)))
+
+            remaining = retry
+
+
+    async def _send_batch(self, batch: list[_Operation], stats: UploadStats, claims: dict[str, _Operation]) -> tuple[list[_Operation], float]:
+        """Pipelines `batch` over one pooled connection and returns the operations to retry and the delay the server asked for
+
+        Creations that were sent but never answered are marked as in doubt, so they
+        are only re-sent once :meth:`_drop_applied` finds that they did not reach the server.
+        """
+        if self._bucket is not None:
+            for _ in batch:
+                await self._bucket.acquire()
+
+        retry: list[_Operation] = []
+        retry_after = 0.0
+        unanswered: list[_Operation] = []
+        connection = None
+        reusable = False
+
+        try:
+            connection = await self._pool.acquire(self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            return list(batch), retry_after
+
+        try:
+            for operation in batch:
+                connection.write_request(operation.method, operation.path, self._headers(bool(operation.body)), operation.body)
+            await connection.writer.drain()
+
+            for index, operation in enumerate(batch):
+                try:
+                    status, headers, body = await asyncio.wait_for(connection.read_response(), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, OSError, ValueError):
+                    unanswered = batch[index:]
+                    break
+
+                stats.requests += 1
+
+                if status in RETRY_STATUSES:
+                    retry.append(operation)
+                    try:
+                        retry_after = max(retry_after, float(headers.get("retry-after", 0)))
+                    except ValueError:
+                        pass
+
+                elif operation.method == "DELETE" and status in (200, 204, 404):
+                    stats.deleted += 1
+
+                elif status < 400:
+                    filter_id = json.loads(body or b"{}").get("id", "")
+                    claimed_operation = claims.pop(filter_id, None)
+                    if claimed_operation is None:
+                        stats.created.append(filter_id)
+                    else:
+                        # The filter was wrongly attributed to an unanswered creation, which has to be sent again
+                        retry.append(claimed_operation)
+
+                else:
+                    stats.failures.append((operation.method, operation.path, status, body.decode(errors="replace")))
+
+            else:
+                reusable = True
+
+        except (OSError, asyncio.TimeoutError):
+            unanswered = list(batch)
+
+        finally:
+            self._pool.release(connection, reusable)
+
+        for operation in unanswered:
+            if operation.method == "POST":
+                operation.in_doubt = True
+            retry.append(operation)
+
+        return retry, retry_after
+
+
+    async def _drop_applied(self, operations: list[_Operation], stats: UploadStats, claims: dict[str, _Operation]) -> list[_Operation]:
+        """Lists the account's filters and removes the in-doubt creations that the server already applied
+
+        An in-doubt creation counts as applied when a filter with the same criteria and
+        action exists whose ID is not yet in `stats.created`.  That filter is recorded
+        as created and claimed in `claims`, in case a pending response turns out to own it.
+
+        Raises
+        ------
+        ConnectionError
+            Raises a `ConnectionError` when the filters cannot be listed
+        """
+        existing_filters = await self.list_filters()
+
+        known_ids = set(stats.created)
+        unclaimed_ids: dict[str, list[str]] = {}
+        for existing_filter in existing_filters:
+            if existing_filter.get("id") not in known_ids:
+                unclaimed_ids.setdefault(_F._filter_key(existing_filter), []).append(existing_filter["id"])
+
+        kept = []
+        for operation in operations:
+            matching_ids = unclaimed_ids.get(operation.key) if operation.in_doubt else None
+            operation.in_doubt = False
+
+            if matching_ids:
+                filter_id = matching_ids.pop()
+                claims[filter_id] = operation
+                stats.created.append(filter_id)
+            else:
+                kept.append(operation)
+
+        return kept
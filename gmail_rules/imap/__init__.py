@@ -0,0 +1,7 @@
+"""
+imap
+====
+"""
+
+from .runner import PROCESSED_KEYWORD, ImapConnectionPool, ImapRunner, RunStats
+from .fake_server import FakeImapServer
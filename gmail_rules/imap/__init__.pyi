@@ -0,0 +1,12 @@
+from ..imap.runner import (
+    PROCESSED_KEYWORD,
+    ImapConnectionPool,
+    ImapRunner,
+    RunStats
+)
+from ..imap.fake_server import (
+    FakeImapServer
+)
+
+__all__: list[str]
+__path__: list[str]
@@ -0,0 +1,458 @@
+import email
+import email.message
+import re
+import socketserver
+import threading
+from dataclasses import dataclass, field
+
+__all__ = ["FakeImapServer"]
+
+
+_TOKEN_PATTERN = re.compile(rb'"((?:[^"\\]|\\.)*)"|(\((?:[^()]|\([^()]*\))*\))|([^\s]+)')
+"""Splits a command line into quoted strings, parenthesized lists and atoms"""
+
+_SECTION_PATTERN = re.compile(rb"BODY(?:\.PEEK)?\[([^\]]*)\]", re.IGNORECASE)
+"""Finds the `BODY[...]` sections requested by a FETCH command"""
+
+
+@dataclass
+class _FakeMessage:
+    raw: bytes
+    flags: set[str] = field(default_factory=set)
+
+
+@dataclass
+class _FakeMailbox:
+    messages: dict[int, _FakeMessage] = field(default_factory=dict)
+    uid_next: int = 1
+
+
+def _parse_uid_set(uid_set: str, all_uids: list[int]) -> list[int]:
+    """Expands an IMAP UID set such as `1:5,7,9:*` into the existing UIDs it refers to"""
+    largest_uid = all_uids[-1] if all_uids else 0
+    selected = set()
+    for part in uid_set.split(","):
+        start, _, end = part.partition(":")
+        start = largest_uid if start == "*" else int(start)
+        end = start if not end else (largest_uid if end == "*" else int(end))
+        low, high = min(start, end), max(start, end)
+        selected.update(uid for uid in all_uids if low <= uid <= high)
+    return sorted(selected)
+
+
+def _split_message(raw: bytes) -> tuple[bytes, bytes]:
+    """Splits a raw message into its header (including the blank line) and its body"""
+    for separator in (b"\r\n\r\n", b"\n\n"):
+        index = raw.find(separator)
+        if index != -1:
+            return raw[:index + len(separator)], raw[index + len(separator):]
+    return raw, b""
+
+
+def _header_fields(header: bytes, names: set[bytes], exclude: bool) -> bytes:
+    """Returns the header lines (including folded lines) whose names are (or are not) in `names`"""
+    selected_lines = []
+    keep = False
+    for line in header.splitlines(keepends=True):
+        if not line.strip():
+            continue
+        if line[:1] in (b" ", b"\t"):
+            if keep:
+                selected_lines.append(line)
+            continue
+        keep = (line.split(b":", 1)[0].strip().upper() in names) != exclude
+        if keep:
+            selected_lines.append(line)
+    return b"".join(selected_lines) + b"\r\n"
+
+
+def _quote_string(value: str | None) -> bytes:
+    """Renders a `BODYSTRUCTURE` field as a quoted string (or `NIL`)"""
+    if value is None:
+        return b"NIL"
+    return b'"' + value.replace("\\", "\\\\").replace('"', '\\"').encode() + b'"'
+
+
+def _part_body(part: email.message.Message) -> bytes:
+    """Returns the body of a message part exactly as it is encoded"""
+    return _split_message(part.as_bytes())[1]
+
+
+def _body_structure(part: email.message.Message) -> bytes:
+    """Renders the `BODYSTRUCTURE` of a message part (with the disposition of single parts)"""
+    if part.is_multipart():
+        return b"(" + b"".join(_body_structure(subpart) for subpart in part.get_payload()) + b" " + _quote_string(part.get_content_subtype().upper()) + b")"
+
+    parameters = [item for name, value in (part.get_params() or [])[1:] for item in (_quote_string(name.upper()), _quote_string(value))]
+    body = _part_body(part)
+    fields = [
+        _quote_string(part.get_content_maintype().upper()),
+        _quote_string(part.get_content_subtype().upper()),
+        b"(" + b" ".join(parameters) + b")" if parameters else b"NIL",
+        _quote_string(part.get("Content-ID")),
+        _quote_string(part.get("Content-Description")),
+        _quote_string(part.get("Content-Transfer-Encoding", "7BIT").upper()),
+        str(len(body)).encode(),
+    ]
+    if part.get_content_maintype() == "text":
+        fields.append(str(body.count(b"\n")).encode())
+
+    disposition = part.get_content_disposition()
+    filename = part.get_filename()
+    fields.append(b"NIL")
+    fields.append(b"(" + _quote_string(disposition.upper()) + (b' ("FILENAME" ' + _quote_string(filename) + b")" if filename else b" NIL") + b")" if disposition else b"NIL")
+
+    return b"(" + b" ".join(fields) + b")"
+
+
+def _find_part(message: email.message.Message, section: bytes) -> email.message.Message | None:
+    """Finds the part with a part number such as `1.2`"""
+    part = message
+    for number in section.split(b"."):
+        index = int(number) - 1
+        if part.is_multipart():
+            subparts = part.get_payload()
+            if not 0 <= index < len(subparts):
+                return None
+            part = subparts[index]
+        elif index != 0:
+            return None
+    return part
+
+
+class _ImapHandler(socketserver.StreamRequestHandler):
+    """Handles one client connection to a :obj:`FakeImapServer`"""
+
+    server: "_ImapTCPServer"
+
+    def handle(self) -> None:
+        self.fake: FakeImapServer = self.server.fake
+        self.selected: str | None = None
+        self.read_only = False
+
+        with self.fake._lock:
+            self.fake.connection_count += 1
+
+        self.send(f"* OK [CAPABILITY {' '.join(self.fake.capabilities)}] Fake IMAP server ready".encode())
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            tag, _, rest = line.rstrip(b"\r\n").partition(b" ")
+            command, _, arguments = rest.partition(b" ")
+            command = command.upper()
+
+            with self.fake._lock:
+                self.fake.command_count += 1
+                if command == b"UID":
+                    self.fake.uid_command_count += 1
+                try:
+                    result = self.dispatch(command, arguments)
+                except (ValueError, KeyError, IndexError) as error:
+                    result = f"BAD {error}"
+
+            self.send(tag + b" " + result.encode())
+
+            if command == b"LOGOUT":
+                return
+
+
+    def send(self, data: bytes) -> None:
+        self.wfile.write(data + b"\r\n")
+
+
+    def dispatch(self, command: bytes, arguments: bytes) -> str:
+        tokens = [next(group for group in match.groups() if group is not None) for match in _TOKEN_PATTERN.finditer(arguments)]
+        tokens = [token.decode() for token in tokens]
+
+        if command == b"CAPABILITY":
+            self.send(f"* CAPABILITY {' '.join(self.fake.capabilities)}".encode())
+            return "OK CAPABILITY completed"
+
+        if command == b"NOOP":
+            return "OK NOOP completed"
+
+        if command == b"LOGOUT":
+            self.send(b"* BYE Logging out")
+            return "OK LOGOUT completed"
+
+        if command == b"LOGIN":
+            if (tokens[0], tokens[1]) != (self.fake.username, self.fake.password):
+                return "NO [AUTHENTICATIONFAILED] Invalid credentials"
+            return "OK LOGIN completed"
+
+        if command == b"LIST":
+            for name in self.fake.mailboxes:
+                self.send(f'* LIST (\\HasNoChildren) "{self.fake.delimiter}" "{name}"'.encode())
+            return "OK LIST completed"
+
+        if command == b"CREATE":
+            if tokens[0] in self.fake.mailboxes:
+                return "NO [ALREADYEXISTS] Mailbox already exists"
+            self.fake.mailboxes[tokens[0]] = _FakeMailbox()
+            return "OK CREATE completed"
+
+        if command in (b"SELECT", b"EXAMINE"):
+            if tokens[0] not in self.fake.mailboxes:
+                self.selected = None
+                return "NO [NONEXISTENT] Mailbox does not exist"
+            mailbox = self.fake.mailboxes[tokens[0]]
+            self.selected = tokens[0]
+            self.read_only = command == b"EXAMINE"
+            self.send(f"* {len(mailbox.messages)} EXISTS".encode())
+            self.send(b"* 0 RECENT")
+            self.send(b"* OK [UIDVALIDITY 1] UIDs valid")
+            self.send(f"* OK [UIDNEXT {mailbox.uid_next}] Predicted next UID".encode())
+            return f"OK [{'READ-ONLY' if self.read_only else 'READ-WRITE'}] {command.decode()} completed"
+
+        if self.selected is None:
+            return "BAD No mailbox selected"
+
+        mailbox = self.fake.mailboxes[self.selected]
+        all_uids = sorted(mailbox.messages)
+
+        if command == b"CLOSE":
+            if not self.read_only:
+                self.expunge(mailbox, all_uids)
+            self.selected = None
+            return "OK CLOSE completed"
+
+        if command == b"UNSELECT":
+            self.selected = None
+            return "OK UNSELECT completed"
+
+        if command == b"EXPUNGE":
+            self.expunge(mailbox, all_uids)
+            return "OK EXPUNGE completed"
+
+        if command != b"UID":
+            return f"BAD Unknown command {command.decode()}"
+
+        uid_command = tokens[0].upper()
+
+        if uid_command == "SEARCH":
+            found_uids = all_uids
+            criteria = [token.upper() for token in tokens[1:]]
+            if criteria[:1] in (["KEYWORD"], ["UNKEYWORD"]):
+                keyword = tokens[2]
+                found_uids = [uid for uid in all_uids if (keyword in mailbox.messages[uid].flags) == (criteria[0] == "KEYWORD")]
+            self.send(("* SEARCH " + " ".join(str(uid) for uid in found_uids)).rstrip().encode())
+            return "OK SEARCH completed"
+
+        uids = _parse_uid_set(tokens[1], all_uids)
+
+        if uid_command == "FETCH":
+            self.fetch(mailbox, all_uids, uids, arguments)
+            return "OK FETCH completed"
+
+        if self.read_only:
+            return "NO Mailbox is read-only"
+
+        if uid_command in ("COPY", "MOVE"):
+            if tokens[2] not in self.fake.mailboxes:
+                return "NO [TRYCREATE] Mailbox does not exist"
+            destination = self.fake.mailboxes[tokens[2]]
+            for uid in uids:
+                destination.messages[destination.uid_next] = _FakeMessage(mailbox.messages[uid].raw, set(mailbox.messages[uid].flags) - {"\\Deleted"})
+                destination.uid_next += 1
+            if uid_command == "MOVE":
+                for uid in uids:
+                    del mailbox.messages[uid]
+            return f"OK {uid_command} completed"
+
+        if uid_command == "STORE":
+            flags = set(tokens[3].strip("()").split())
+            for uid in uids:
+                if tokens[2].upper().startswith("+"):
+                    mailbox.messages[uid].flags |= flags
+                elif tokens[2].upper().startswith("-"):
+                    mailbox.messages[uid].flags -= flags
+                else:
+                    mailbox.messages[uid].flags = set(flags)
+            return "OK STORE completed"
+
+        if uid_command == "EXPUNGE":
+            if "UIDPLUS" not in self.fake.capabilities:
+                return "BAD Unknown UID command EXPUNGE"
+            self.expunge(mailbox, uids)
+            return "OK EXPUNGE completed"
+
+        return f"BAD Unknown UID command {uid_command}"
+
+
+    def expunge(self, mailbox: _FakeMailbox, uids: list[int]) -> None:
+        for uid in uids:
+            if "\\Deleted" in mailbox.messages[uid].flags:
+                del mailbox.messages[uid]
+
+
+    def fetch(self, mailbox: _FakeMailbox, all_uids: list[int], uids: list[int], arguments: bytes) -> None:
+        sections = _SECTION_PATTERN.findall(arguments)
+        for uid in uids:
+            message = mailbox.messages[uid]
+            header, body = _split_message(message.raw)
+            items = [] if self.fake.uid_last else [f"UID {uid}".encode()]
+
+            if b"BODYSTRUCTURE" in arguments.upper():
+                items.append(b"BODYSTRUCTURE " + _body_structure(email.message_from_bytes(message.raw)))
+
+            for section in sections:
+                upper_section = section.upper()
+                if upper_section.startswith(b"HEADER.FIELDS"):
+                    names = set(upper_section.split(b"(", 1)[1].rstrip(b")").split())
+                    data = _header_fields(header, names, upper_section.startswith(b"HEADER.FIELDS.NOT"))
+                elif upper_section == b"HEADER":
+                    data = header
+                elif upper_section == b"TEXT":
+                    data = body
+                elif upper_section[:1].isdigit():
+                    part = _find_part(email.message_from_bytes(message.raw), upper_section)
+                    data = _part_body(part) if part is not None else b""
+                else:
+                    data = message.raw
+
+                self.fake.fetched_bytes += len(data)
+                items.append(b"BODY[" + section + b"] {" + str(len(data)).encode() + b"}\r\n" + data)
+
+            if b"FLAGS" in arguments.upper():
+                items.append(f"FLAGS ({' '.join(sorted(message.flags))})".encode())
+
+            if self.fake.uid_last:
+                items.append(f"UID {uid}".encode())
+
+            response = f"* {all_uids.index(uid) + 1} FETCH (".encode() + b" ".join(items)
+            self.send(response + b")")
+
+
+class _ImapTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeImapServer:
+    """Local stand-in IMAP server used to test :obj:`ImapRunner`
+
+    Implements the subset of IMAP4rev1 (plus `UIDPLUS` and `MOVE`) that the runner
+    uses: `LOGIN`, `LIST`, `CREATE`, `SELECT`/`EXAMINE`, `UNSELECT`, `EXPUNGE` and `UID SEARCH`
+    (`ALL`, `KEYWORD` or `UNKEYWORD`), `FETCH` (of `BODYSTRUCTURE`, `FLAGS` and
+    header, text or numbered `BODY[...]` sections), `COPY`, `MOVE`, `STORE` and
+    `EXPUNGE`.  Messages are kept in memory.
+
+    Use it as a context manager::
+
+        with FakeImapServer() as server:
+            server.add_message("INBOX", raw_message)
+
+    Parameters
+    ----------
+    username : str, optional
+        Username that is accepted by `LOGIN`, by default `"user"`
+    password : str, optional
+        Password that is accepted by `LOGIN`, by default `"password"`
+    host : str, optional
+        Interface to listen on, by default `"127.0.0.1"`
+    port : int, optional
+        Port to listen on, by default `0` (any free port)
+    capabilities : tuple[str, ...], optional
+        Capabilities advertised to clients, by default `("IMAP4rev1", "UIDPLUS", "MOVE")`;
+        `UID EXPUNGE` is rejected without `UIDPLUS`
+    delimiter : str, optional
+        Hierarchy delimiter reported by `LIST`, by default `"/"`
+    uid_last : bool, optional
+        Whether `FETCH` responses send `UID` after the `BODY[...]` sections instead of first, by default `False`
+    """
+
+    def __init__(self, username: str = "user", password: str = "password", host: str = "127.0.0.1", port: int = 0, capabilities: tuple[str, ...] = ("IMAP4rev1", "UIDPLUS", "MOVE"), delimiter: str = "/", uid_last: bool = False) -> None:
+        self.username = username
+        self.password = password
+        self.host = host
+        self.port = port
+        self.capabilities = tuple(capabilities)
+        self.delimiter = delimiter
+        self.uid_last = uid_last
+
+        self.mailboxes: dict[str, _FakeMailbox] = {"INBOX": _FakeMailbox()}
+        """Mailboxes stored by the server, keyed by name"""
+
+        self.connection_count: int = 0
+        """Number of connections opened"""
+
+        self.command_count: int = 0
+        """Number of commands received"""
+
+        self.uid_command_count: int = 0
+        """Number of `UID` commands received"""
+
+        self.fetched_bytes: int = 0
+        """Number of message bytes sent in `FETCH` responses"""
+
+        self._lock = threading.Lock()
+        self._server: _ImapTCPServer | None = None
+        self._thread: threading.Thread | None = None
+
+
+    def add_message(self, mailbox_name: str, raw_message: bytes, flags: set[str] | None = None) -> int:
+        """Adds a message to a mailbox (creating the mailbox if needed)
+
+        Parameters
+        ----------
+        mailbox_name : str
+            Name of the mailbox
+        raw_message : bytes
+            Full RFC 5322 message
+        flags : set[str], optional
+            Flags of the message, by default `None`
+
+        Returns
+        -------
+        int
+            UID of the new message
+        """
+        with self._lock:
+            mailbox = self.mailboxes.setdefault(mailbox_name, _FakeMailbox())
+            uid = mailbox.uid_next
+            mailbox.messages[uid] = _FakeMessage(raw_message, set(flags or ()))
+            mailbox.uid_next += 1
+            return uid
+
+
+    def flags(self, mailbox_name: str) -> list[set[str]]:
+        """Flags of the messages currently in a mailbox, in UID order"""
+        with self._lock:
+            mailbox = self.mailboxes.get(mailbox_name, _FakeMailbox())
+            return [set(mailbox.messages[uid].flags) for uid in sorted(mailbox.messages)]
+
+
+    def messages(self, mailbox_name: str) -> list[bytes]:
+        """Raw messages currently in a mailbox, in UID order"""
+        with self._lock:
+            mailbox = self.mailboxes.get(mailbox_name, _FakeMailbox())
+            return [mailbox.messages[uid].raw for uid in sorted(mailbox.messages)]
+
+
+    def start(self) -> None:
+        """Starts listening for connections in a background thread"""
+        self._server = _ImapTCPServer((self.host, self.port), _ImapHandler)
+        self._server.fake = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+
+    def close(self) -> None:
+        """Stops the server"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+    def __enter__(self) -> "FakeImapServer":
+        self.start()
+        return self
+
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
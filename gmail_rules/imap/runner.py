@@ -0,0 +1,677 @@
+import imaplib
+import itertools
+import queue
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+
+from ..matching import headers as _H
+from ..matching import matcher as _M
+from ..rules import rule as _R
+
+__all__ = ["ImapConnectionPool", "ImapRunner", "PROCESSED_KEYWORD", "RunStats"]
+
+
+_UID_PATTERN = re.compile(rb"UID (\d+)")
+"""Finds the UID in the text of a FETCH response"""
+
+_SECTION_LITERAL_PATTERN = re.compile(rb"BODY\[([^\]]*)\](?:<\d+>)? ?\{\d+\}$")
+"""Matches the section name announcing the literal at the end of the text of a FETCH response"""
+
+_LITERAL_PATTERN = re.compile(rb"\{\d+\}$")
+"""Matches the `{<size>}` announcing the literal at the end of the text of a FETCH response"""
+
+_BODYSTRUCTURE_PATTERN = re.compile(rb"BODYSTRUCTURE \(")
+"""Finds the start of the `BODYSTRUCTURE` in the text of a FETCH response"""
+
+_STRUCTURE_TOKEN_PATTERN = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))')
+"""Splits a `BODYSTRUCTURE` into parentheses, quoted strings and atoms"""
+
+_FETCH_START_PATTERN = re.compile(rb"\d+ \(")
+"""Matches the `<sequence number> (` that starts each message's FETCH response"""
+
+_LIST_PATTERN = re.compile(rb'\((?P<flags>[^)]*)\) (?P<delimiter>"(?:[^"\\]|\\.)*"|NIL) ?(?P<name>.*)', re.IGNORECASE)
+"""Splits a `LIST` response into its flags, hierarchy delimiter and mailbox name"""
+
+PROCESSED_KEYWORD : str = "$GmailRulesProcessed"
+"""Keyword flag stored on every message that an :obj:`ImapRunner` has applied the rules to"""
+
+
+def _quote(mailbox_name: str) -> str:
+    """Quotes a mailbox name so it can be sent in an IMAP command"""
+    return '"' + mailbox_name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _uid_set(uids: Iterable[int]) -> str:
+    """Compresses UIDs into an IMAP UID set such as `1:5,7`"""
+    ranges = []
+    for uid in sorted(uids):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(str(start) if start == end else f"{start}:{end}" for start, end in ranges)
+
+
+def _unquote(value: bytes) -> str:
+    """Decodes an IMAP atom or quoted string"""
+    value = value.strip()
+    if value[:1] == b'"' and value[-1:] == b'"':
+        value = re.sub(rb"\\(.)", rb"\1", value[1:-1])
+    return value.decode()
+
+
+def _parse_fetch_response(data: Iterable[bytes | tuple[bytes, bytes]]) -> dict[int, dict[bytes, bytes]]:
+    """Groups the data of a `UID FETCH` response by message and reads each message's sections
+
+    Each message's response is collected in full (including the text after its
+    last literal) before its UID is read, since servers may send `UID` before or
+    after the `BODY[...]` sections.  When the response has a `BODYSTRUCTURE`, the
+    text from its start is kept as the `BODYSTRUCTURE` section (literals outside
+    `BODY[...]` sections are inlined as quoted strings) for :obj:`_parse_body_structure()`.
+
+    Parameters
+    ----------
+    data : Iterable[bytes | tuple[bytes, bytes]]
+        Untagged `FETCH` data returned by :obj:`imaplib.IMAP4.uid`; each literal
+        arrives as a `(text before the literal, literal)` tuple
+
+    Returns
+    -------
+    dict[int, dict[bytes, bytes]]
+        Fetched sections of every message, keyed by UID and then section name
+    """
+    responses: list[list[tuple[bytes, bytes | None]]] = []
+    for item in data:
+        text, literal = item if isinstance(item, tuple) else (item, None)
+        if not isinstance(text, bytes):
+            continue
+        if _FETCH_START_PATTERN.match(text) or not responses:
+            responses.append([])
+        responses[-1].append((text, literal))
+
+    fetched_sections: dict[int, dict[bytes, bytes]] = {}
+    for response in responses:
+        uid_match = _UID_PATTERN.search(b" ".join(text for text, _ in response))
+        if uid_match is None:
+            continue
+
+        sections = fetched_sections.setdefault(int(uid_match.group(1)), {})
+        texts = []
+        for text, literal in response:
+            if literal is not None:
+                section_match = _SECTION_LITERAL_PATTERN.search(text)
+                if section_match is not None:
+                    sections[section_match.group(1)] = literal
+                else:
+                    text = _LITERAL_PATTERN.sub(b"", text) + b'"' + literal.replace(b"\\", b"\\\\").replace(b'"', b'\\"') + b'"'
+            texts.append(text)
+
+        response_text = b"".join(texts)
+        structure_match = _BODYSTRUCTURE_PATTERN.search(response_text)
+        if structure_match is not None:
+            sections[b"BODYSTRUCTURE"] = response_text[structure_match.start():]
+
+    return fetched_sections
+
+
+def _parse_body_structure(text: bytes) -> list | None:
+    """Parses the `BODYSTRUCTURE` at the start of `text` into nested lists
+
+    Quoted strings and atoms become `str` and `NIL` becomes `None`.  Returns `None`
+    when `text` does not hold a complete `BODYSTRUCTURE`.
+    """
+    structure_match = _BODYSTRUCTURE_PATTERN.match(text)
+    if structure_match is None:
+        return None
+
+    position = structure_match.end() - 1
+    stack: list[list] = []
+    while True:
+        token = _STRUCTURE_TOKEN_PATTERN.match(text, position)
+        if token is None:
+            return None
+        position = token.end()
+
+        if token.group(1):
+            stack.append([])
+        elif token.group(2):
+            completed = stack.pop()
+            if not stack:
+                return completed
+            stack[-1].append(completed)
+        elif token.group(3) is not None:
+            stack[-1].append(re.sub(rb"\\(.)", rb"\1", token.group(3)).decode("utf-8", errors="replace"))
+        else:
+            atom = token.group(4).decode("utf-8", errors="replace")
+            stack[-1].append(None if atom.upper() == "NIL" else atom)
+
+
+def _text_parts(structure: list, section: str = "") -> list[tuple[str, str, str]]:
+    """Lists the text parts of a parsed `BODYSTRUCTURE` that are not attachments
+
+    Parameters
+    ----------
+    structure : list
+        Body structure returned by :obj:`_parse_body_structure()`
+    section : str, optional
+        Part number of `structure`, by default `""` (the whole message)
+
+    Returns
+    -------
+    list[tuple[str, str, str]]
+        Part number (e.g. `"1.2"`), `Content-Type` and transfer encoding of every text part
+    """
+    ## A MULTIPART BODY LISTS ITS PARTS FIRST, FOLLOWED BY ITS SUBTYPE AND EXTENSION DATA
+    if structure and isinstance(structure[0], list):
+        parts = []
+        for index, part in enumerate(itertools.takewhile(lambda item: isinstance(item, list), structure), 1):
+            parts.extend(_text_parts(part, f"{section}.{index}" if section else str(index)))
+        return parts
+
+    if len(structure) < 7 or not isinstance(structure[0], str) or structure[0].lower() != "text":
+        return []
+
+    ## A TEXT PART'S DISPOSITION FOLLOWS ITS 7 BASIC FIELDS, LINE COUNT AND MD5
+    disposition = structure[9] if len(structure) > 9 else None
+    if isinstance(disposition, list) and disposition and str(disposition[0]).lower() == "attachment":
+        return []
+
+    parameters = structure[2] if isinstance(structure[2], list) else []
+    content_type = f"{structure[0]}/{structure[1]}" + "".join(f'; {name}="{value}"' for name, value in zip(parameters[::2], parameters[1::2]))
+
+    return [(section or "1", content_type, structure[5] or "")]
+
+
+def _parse_list_response(folder_list: Iterable[bytes | tuple[bytes, bytes]]) -> tuple[set[str], str | None]:
+    """Reads the mailbox names and the hierarchy delimiter from the lines of a `LIST` response
+
+    Parameters
+    ----------
+    folder_list : Iterable[bytes | tuple[bytes, bytes]]
+        Untagged `LIST` data returned by :obj:`imaplib.IMAP4.list`; mailbox
+        names sent as literals arrive as `(prefix, name)` tuples
+
+    Returns
+    -------
+    tuple[set[str], str | None]
+        Names of the existing mailboxes and the server's hierarchy delimiter
+        (`None` when the server reports `NIL`)
+    """
+    names = set()
+    delimiter = None
+    for item in folder_list:
+        if isinstance(item, tuple):
+            line, literal = item
+        elif isinstance(item, bytes):
+            line, literal = item, None
+        else:
+            continue
+        list_match = _LIST_PATTERN.match(line)
+        if list_match is None:
+            continue
+        if list_match.group("delimiter").upper() != b"NIL":
+            delimiter = _unquote(list_match.group("delimiter"))
+        names.add(literal.decode() if literal is not None else _unquote(list_match.group("name")))
+    return names, delimiter
+
+
+@dataclass
+class RunStats:
+    """Results and throughput metrics of an :obj:`ImapRunner` run
+
+    Attributes
+    ----------
+    messages : `int`
+        Number of messages that were evaluated
+    matched : `int`
+        Number of messages that at least one rule applied to
+    fetched_bytes : `int`
+        Number of header and body bytes fetched from the server
+    labels : `dict`
+        Number of messages copied into each label's folder
+    archived : `int`
+        Number of messages removed from their folder
+    flagged : `int`
+        Number of archived messages that were only flagged `\\Deleted`, because the
+        server supports neither `UIDPLUS` nor `MOVE`
+    folders : `dict`
+        Number of messages evaluated in each folder
+    elapsed : `float`
+        Wall time of the run in seconds
+    """
+    messages: int = 0
+    matched: int = 0
+    fetched_bytes: int = 0
+    labels: dict[str, int] = field(default_factory=dict)
+    archived: int = 0
+    flagged: int = 0
+    folders: dict[str, int] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def messages_per_second(self) -> float:
+        """Evaluated messages per second of wall time"""
+        return self.messages / self.elapsed if self.elapsed else 0.0
+
+
+class ImapConnectionPool:
+    """Pool of logged-in :obj:`imaplib.IMAP4` connections that are reused across folders
+
+    Parameters
+    ----------
+    host : str
+        IMAP server host
+    username : str
+        Username used to log in
+    password : str
+        Password used to log in
+    port : int, optional
+        IMAP server port, by default `993` with SSL and `143` without
+    use_ssl : bool, optional
+        Whether to connect with :obj:`imaplib.IMAP4_SSL`, by default `True`
+    size : int, optional
+        Maximum number of open connections, by default `4`
+    """
+
+    def __init__(self, host: str, username: str, password: str, port: int | None = None, use_ssl: bool = True, size: int = 4) -> None:
+        self.host = host
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.port = port or (imaplib.IMAP4_SSL_PORT if use_ssl else imaplib.IMAP4_PORT)
+        self.size = max(size, 1)
+
+        self._idle: queue.LifoQueue[imaplib.IMAP4] = queue.LifoQueue()
+        self._slots = queue.Queue()
+        for _ in range(self.size):
+            self._slots.put(None)
+
+
+    def open_connection(self) -> imaplib.IMAP4:
+        """Opens a new logged-in connection that is not part of the pool
+
+        The caller has to log out of the connection once it is done with it.
+
+        Returns
+        -------
+        imaplib.IMAP4
+            Logged-in connection
+        """
+        connection_class = imaplib.IMAP4_SSL if self.use_ssl else imaplib.IMAP4
+        connection = connection_class(self.host, self.port)
+        connection.login(self.username, self.password)
+        return connection
+
+
+    @contextmanager
+    def connection(self) -> Iterator[imaplib.IMAP4]:
+        """Borrows a logged-in connection from the pool (opening one if needed)
+
+        Yields
+        ------
+        imaplib.IMAP4
+            Connection that is returned to the pool afterwards
+        """
+        self._slots.get()
+        connection = None
+        reusable = False
+        try:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self.open_connection()
+            yield connection
+            reusable = True
+        finally:
+            if connection is not None:
+                if reusable:
+                    self._idle.put(connection)
+                else:
+                    try:
+                        connection.logout()
+                    except (imaplib.IMAP4.error, OSError):
+                        pass
+            self._slots.put(None)
+
+
+    def close(self) -> None:
+        """Logs out of every idle connection"""
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                connection.logout()
+            except (imaplib.IMAP4.error, OSError):
+                pass
+
+
+    def __enter__(self) -> "ImapConnectionPool":
+        return self
+
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class ImapRunner:
+    """Applies a :obj:`Rule_Collection` to the messages in IMAP folders
+
+    Only the parts of each message that the collection's criteria need are
+    fetched: the `From` header for `from` criteria, `Subject` for `subject`, and
+    the text of the message only when `hasTheWord`/`doesNotHaveTheWord` are used.
+    Bodies are fetched part by part: the `BODYSTRUCTURE` of each message lists its
+    text parts, only those are fetched, and each is decoded by its transfer
+    encoding and charset (attachments are never downloaded).
+    Messages are fetched with `UID FETCH` in batches of `batch_size`, and batches
+    are fetched concurrently over the pool's connections.  Every message is
+    evaluated locally with a :obj:`Matcher`, then each label is applied with one
+    `UID COPY` into the label's folder and archived messages are removed from the
+    folder in bulk: with `UID EXPUNGE` when the server supports `UIDPLUS`, or by
+    moving them into their last label's folder (or `archive_folder`) with
+    `UID MOVE`.  Servers with neither only get the messages flagged `\\Deleted`,
+    since a plain `EXPUNGE` would also remove every other deleted message.
+
+    Every evaluated message is marked with the :obj:`PROCESSED_KEYWORD` flag once
+    its results have been applied, and only messages without that flag are
+    searched for, so running the rules again does not copy the same messages
+    into their labels' folders a second time.  Labels that contain `/` are
+    mapped onto the server's hierarchy delimiter from its `LIST` response.
+
+    Parameters
+    ----------
+    rules : :obj:`Rule_Collection` or iterable of :obj:`Rule`
+        Rules to apply
+    pool : ImapConnectionPool
+        Connections to the IMAP server
+    batch_size : int, optional
+        Number of messages fetched by each `UID FETCH`, by default `200`
+    archive_folder : str, optional
+        Folder that archived messages without any label are moved to, by default `"Archive"`
+    dry_run : bool, optional
+        When `True`, messages are evaluated but no labels or moves are applied, by default `False`
+    """
+
+    def __init__(self, rules: Iterable[_R.Rule], pool: ImapConnectionPool, batch_size: int = 200, archive_folder: str = "Archive", dry_run: bool = False) -> None:
+        self.matcher: _M.Matcher = _M.Matcher(rules)
+        """Compiled form of the rules"""
+
+        self.pool = pool
+        self.batch_size = max(batch_size, 1)
+        self.archive_folder = archive_folder
+        self.dry_run = dry_run
+
+        self.fetch_body: bool = _H.needs_body(self.matcher.rules)
+        """Whether the text of each message is fetched"""
+
+        ## THE BODY HEADERS ARE ONLY USED TO DECODE THE TEXT OF MESSAGES WHOSE BODYSTRUCTURE CANNOT BE READ
+        self.header_names: tuple[str, ...] = tuple(sorted(name.upper() for name in _H.needed_headers(self.matcher.rules) | {"message-id"} | (_H.BODY_HEADERS if self.fetch_body else set())))
+        """Headers fetched for every message"""
+
+        self._fetch_items: str = f"(UID{' BODYSTRUCTURE' if self.fetch_body else ''} BODY.PEEK[HEADER.FIELDS ({' '.join(self.header_names)})])"
+
+
+    def _parse_message(self, sections: dict[bytes, bytes], text_parts: Iterable[tuple[str, str, str]] = ()) -> _M.Message:
+        """Builds a :obj:`Message` from the fetched header section and the decoded `text_parts`"""
+        header = next((data for section, data in sections.items() if section.upper().startswith(b"HEADER")), b"")
+        headers = _H.scan_headers(header, self.header_names)
+
+        body = "\n".join(
+            _H.decode_body(sections.get(section.encode(), b""), content_type, transfer_encoding)
+            for section, content_type, transfer_encoding in text_parts
+        )
+
+        return _M.Message(
+            sender=headers.get("from", ""),
+            to=headers.get("to", ""),
+            subject=headers.get("subject", ""),
+            body=body,
+            message_id=headers.get("message-id", ""),
+        )
+
+
+    def _fetch_text_parts(self, connection: imaplib.IMAP4, folder: str, fetched_sections: dict[int, dict[bytes, bytes]]) -> dict[int, list[tuple[str, str, str]]]:
+        """Fetches the text parts listed by each message's `BODYSTRUCTURE` into its sections
+
+        Messages whose text parts have the same part numbers are fetched with one
+        `UID FETCH`.  When a `BODYSTRUCTURE` cannot be read, the whole `TEXT` of the
+        message is fetched and decoded with its own `Content-Type` header.
+
+        Returns
+        -------
+        dict[int, list[tuple[str, str, str]]]
+            Part number, `Content-Type` and transfer encoding of every fetched text part, keyed by UID
+        """
+        text_parts: dict[int, list[tuple[str, str, str]]] = {}
+        uids_by_sections: dict[tuple[str, ...], list[int]] = {}
+        for uid, sections in fetched_sections.items():
+            structure = _parse_body_structure(sections.pop(b"BODYSTRUCTURE", b""))
+            if structure is not None:
+                parts = _text_parts(structure)
+            else:
+                header = next((data for section, data in sections.items() if section.upper().startswith(b"HEADER")), b"")
+                headers = _H.scan_headers(header, _H.BODY_HEADERS)
+                parts = [("TEXT", headers.get("content-type", ""), headers.get("content-transfer-encoding", ""))]
+
+            text_parts[uid] = parts
+            if parts:
+                uids_by_sections.setdefault(tuple(section for section, _, _ in parts), []).append(uid)
+
+        for section_names, uids in uids_by_sections.items():
+            fetch_items = f"(UID {' '.join(f'BODY.PEEK[{section}]' for section in section_names)})"
+            status, data = connection.uid("FETCH", _uid_set(uids), fetch_items)
+            if status != "OK":
+                raise imaplib.IMAP4.error(f"UID FETCH failed in {folder}: {data}")
+            for uid, sections in _parse_fetch_response(data).items():
+                if uid in fetched_sections:
+                    fetched_sections[uid].update(sections)
+
+        return text_parts
+
+
+    def _fetch_batch(self, folder: str, uids: list[int]) -> tuple[dict[int, _M.Message], int]:
+        """Fetches and parses one batch of messages on a pooled connection"""
+        text_parts: dict[int, list[tuple[str, str, str]]] = {}
+        with self.pool.connection() as connection:
+            status, _ = connection.select(_quote(folder), readonly=True)
+            if status != "OK":
+                raise imaplib.IMAP4.error(f"Cannot select {folder}")
+            status, data = connection.uid("FETCH", _uid_set(uids), self._fetch_items)
+            if status != "OK":
+                raise imaplib.IMAP4.error(f"UID FETCH failed in {folder}: {data}")
+
+            fetched_sections = _parse_fetch_response(data)
+            if self.fetch_body:
+                text_parts = self._fetch_text_parts(connection, folder, fetched_sections)
+
+        fetched_bytes = sum(len(payload) for sections in fetched_sections.values() for payload in sections.values())
+
+        return {uid: self._parse_message(sections, text_parts.get(uid, ())) for uid, sections in fetched_sections.items()}, fetched_bytes
+
+
+    def classify_folder(self, folder: str, stats: RunStats | None = None) -> dict[int, _M.Classification]:
+        """Evaluates the rules against every unprocessed message in `folder` without changing anything
+
+        Parameters
+        ----------
+        folder : str
+            Name of the folder
+        stats : RunStats, optional
+            Stats that the number of messages and fetched bytes are added to, by default `None`
+
+        Returns
+        -------
+        dict[int, Classification]
+            Classification of every message, keyed by UID
+        """
+        with self.pool.connection() as connection:
+            status, _ = connection.select(_quote(folder), readonly=True)
+            if status != "OK":
+                raise imaplib.IMAP4.error(f"Cannot select {folder}")
+            _, data = connection.uid("SEARCH", None, "UNKEYWORD", PROCESSED_KEYWORD)
+
+        uids = [int(uid) for uid in (data[0] or b"").split()]
+        batches = [uids[index:index + self.batch_size] for index in range(0, len(uids), self.batch_size)]
+
+        classifications = {}
+        with ThreadPoolExecutor(max_workers=self.pool.size) as executor:
+            for messages, fetched_bytes in executor.map(lambda batch: self._fetch_batch(folder, batch), batches):
+                if stats is not None:
+                    stats.fetched_bytes += fetched_bytes
+                for uid, message in messages.items():
+                    classifications[uid] = self.matcher.classify(message)
+
+        if stats is not None:
+            stats.messages += len(classifications)
+            stats.matched += sum(1 for classification in classifications.values() if classification.rules)
+            stats.folders[folder] = stats.folders.get(folder, 0) + len(classifications)
+
+        return classifications
+
+
+    def _apply(self, folder: str, classifications: dict[int, _M.Classification], stats: RunStats) -> None:
+        """Copies messages into their labels' folders, removes archived messages and marks them all as processed, in bulk"""
+        if not classifications:
+            return
+
+        uids_by_label: dict[str, list[int]] = {}
+        archived_uids = []
+        unlabeled_archived_uids = []
+        for uid, classification in classifications.items():
+            for label in classification.labels:
+                uids_by_label.setdefault(label, []).append(uid)
+            if classification.archive:
+                archived_uids.append(uid)
+                if not classification.labels:
+                    unlabeled_archived_uids.append(uid)
+
+        with self.pool.connection() as connection:
+            capabilities = connection.capabilities
+            use_move = "UIDPLUS" not in capabilities and "MOVE" in capabilities
+
+            copies = []
+            moves: dict[str, list[int]] = {}
+            existing_folders: set[str] = set()
+            if uids_by_label or unlabeled_archived_uids:
+                _, folder_list = connection.list()
+                existing_folders, delimiter = _parse_list_response(folder_list or [])
+
+                ## MAP NESTED GMAIL LABELS ONTO THE SERVER'S HIERARCHY DELIMITER
+                destinations = {label: label.replace("/", delimiter) if delimiter else label for label in uids_by_label}
+
+                ## WITHOUT UIDPLUS, ARCHIVED MESSAGES ARE MOVED INTO THEIR LAST DESTINATION INSTEAD OF COPIED AND EXPUNGED
+                if use_move:
+                    for uid in archived_uids:
+                        labels = classifications[uid].labels
+                        moves.setdefault(destinations[labels[-1]] if labels else self.archive_folder, []).append(uid)
+                    moved_uids = {destination: set(uids) for destination, uids in moves.items()}
+
+                for label, uids in uids_by_label.items():
+                    destination = destinations[label]
+                    if use_move:
+                        uids = [uid for uid in uids if uid not in moved_uids.get(destination, ())]
+                    if uids:
+                        copies.append((destination, uids))
+                if unlabeled_archived_uids and not use_move:
+                    copies.append((self.archive_folder, unlabeled_archived_uids))
+
+            status, data = connection.select(_quote(folder))
+            if status != "OK":
+                raise imaplib.IMAP4.error(f"Cannot select {folder}: {data}")
+
+            ## MARK MESSAGES AS PROCESSED FIRST SO THE COPIES CARRY THE FLAG TOO
+            processed_set = _uid_set(classifications)
+            status, data = connection.uid("STORE", processed_set, "+FLAGS.SILENT", f"({PROCESSED_KEYWORD})")
+            if status != "OK":
+                raise imaplib.IMAP4.error(f"UID STORE in {folder} failed: {data}")
+
+            transfers = [("COPY", destination, uids) for destination, uids in copies]
+            transfers += [("MOVE", destination, uids) for destination, uids in moves.items()]
+
+            try:
+                for command, destination, uids in transfers:
+                    if destination not in existing_folders:
+                        connection.create(_quote(destination))
+                        existing_folders.add(destination)
+                    status, data = connection.uid(command, _uid_set(uids), _quote(destination))
+                    if status != "OK":
+                        raise imaplib.IMAP4.error(f"UID {command} to {destination} failed: {data}")
+            except (imaplib.IMAP4.error, OSError):
+                ## LEAVE THE MESSAGES UNPROCESSED SO THE NEXT RUN RETRIES THEM
+                self._unmark_processed(connection, folder, processed_set)
+                raise
+
+            for label, uids in uids_by_label.items():
+                stats.labels[label] = stats.labels.get(label, 0) + len(uids)
+
+            if archived_uids:
+                if use_move:
+                    stats.archived += len(archived_uids)
+                else:
+                    archived_set = _uid_set(archived_uids)
+                    connection.uid("STORE", archived_set, "+FLAGS.SILENT", "(\\Deleted)")
+                    if "UIDPLUS" in capabilities:
+                        connection.uid("EXPUNGE", archived_set)
+                        stats.archived += len(archived_uids)
+                    else:
+                        ## A PLAIN EXPUNGE WOULD ALSO REMOVE EVERY OTHER \Deleted MESSAGE IN THE FOLDER
+                        stats.flagged += len(archived_uids)
+
+            ## CLOSE WOULD EXPUNGE EVERY \Deleted MESSAGE, SO ONLY UNSELECT (A LATER SELECT ALSO LEAVES THEM ALONE)
+            if "UNSELECT" in capabilities:
+                connection.unselect()
+
+
+    def _unmark_processed(self, connection: imaplib.IMAP4, folder: str, processed_set: str) -> None:
+        """Removes the :obj:`PROCESSED_KEYWORD` flag again, on a fresh connection when `connection` is no longer usable"""
+        try:
+            connection.uid("STORE", processed_set, "-FLAGS.SILENT", f"({PROCESSED_KEYWORD})")
+            return
+        except (imaplib.IMAP4.error, OSError):
+            pass
+
+        try:
+            fresh_connection = self.pool.open_connection()
+        except (imaplib.IMAP4.error, OSError):
+            return
+        try:
+            status, _ = fresh_connection.select(_quote(folder))
+            if status == "OK":
+                fresh_connection.uid("STORE", processed_set, "-FLAGS.SILENT", f"({PROCESSED_KEYWORD})")
+        except (imaplib.IMAP4.error, OSError):
+            pass
+        finally:
+            try:
+                fresh_connection.logout()
+            except (imaplib.IMAP4.error, OSError):
+                pass
+
+
+    def run(self, folders: Iterable[str] = ("INBOX",)) -> RunStats:
+        """Evaluates the rules against every message in `folders` and applies the results
+
+        Parameters
+        ----------
+        folders : Iterable[str], optional
+            Folders to process, by default `("INBOX",)`
+
+        Returns
+        -------
+        RunStats
+            Counts and throughput of the run
+        """
+        stats = RunStats()
+        start_time = time.perf_counter()
+
+        for folder in folders:
+            classifications = self.classify_folder(folder, stats)
+            if not self.dry_run:
+                self._apply(folder, classifications, stats)
+
+        stats.elapsed = time.perf_counter() - start_time
+        return stats
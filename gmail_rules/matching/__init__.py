@@ -0,0 +1,10 @@
+"""
+matching
+========
+"""
+
+from .aho_corasick import AhoCorasick
+from .coverage import RuleCoverage
+from .matcher import Message, Classification, Matcher, parse_criteria
+from .headers import needed_headers, needs_body, scan_headers, decode_body, parse_message
+from .daemon import LatencyHistogram, ClassificationDaemon, DaemonClient, load_collection
@@ -0,0 +1,28 @@
+from ..matching.aho_corasick import (
+    AhoCorasick
+)
+from ..matching.coverage import (
+    RuleCoverage
+)
+from ..matching.matcher import (
+    Message,
+    Classification,
+    Matcher,
+    parse_criteria
+)
+from ..matching.headers import (
+    needed_headers,
+    needs_body,
+    scan_headers,
+    decode_body,
+    parse_message
+)
+from ..matching.daemon import (
+    LatencyHistogram,
+    ClassificationDaemon,
+    DaemonClient,
+    load_collection
+)
+
+__all__: list[str]
+__path__: list[str]
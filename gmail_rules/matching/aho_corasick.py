@@ -0,0 +1,152 @@
+from typing import Iterable, Iterator
+
+__all__ = ["AhoCorasick"]
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton that finds every occurrence of many patterns in a single pass over a text
+
+    Patterns and texts are compared case-insensitively.  A pattern that starts
+    (or ends) with a word character only matches when it is not directly preceded
+    (or followed) by another word character, so `"sale"` does not match `"wholesale"`
+    but `"@gmail.com"` matches `"someone@gmail.com"`.
+
+    Parameters
+    ----------
+    patterns : Iterable[str]
+        Patterns to search for.  The position of a pattern in this iterable is its ID
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self.patterns: list[str] = [pattern.lower() for pattern in patterns]
+        """`list` of the (lowercased) patterns, indexed by pattern ID"""
+
+        self._goto: list[dict[str, int]] = [{}]
+        """Trie transitions from each state"""
+
+        self._fail: list[int] = [0]
+        """Failure link of each state"""
+
+        self._output: list[tuple[int, ...]] = [()]
+        """IDs of the patterns that end in each state (including ones reached through failure links)"""
+
+        for pattern_id, pattern in enumerate(self.patterns):
+            if pattern:
+                self._insert(pattern, pattern_id)
+
+        self._build_failure_links()
+
+        self._checks_start: list[bool] = [pattern[:1].isalnum() for pattern in self.patterns]
+        self._checks_end: list[bool] = [pattern[-1:].isalnum() for pattern in self.patterns]
+
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+
+    def _insert(self, pattern: str, pattern_id: int) -> None:
+        """Adds a pattern to the trie"""
+        state = 0
+        for character in pattern:
+            next_state = self._goto[state].get(character)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][character] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+
+        self._output[state] += (pattern_id,)
+
+
+    def _build_failure_links(self) -> None:
+        """Breadth-first construction of the failure links and merged outputs"""
+        queue = list(self._goto[0].values())
+
+        for state in queue:
+            for character, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fail_state = self._fail[state]
+                while fail_state and character not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+
+                fallback = self._goto[fail_state].get(character, 0)
+                self._fail[next_state] = fallback if fallback != next_state else 0
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+
+    def iter_matches(self, text: str) -> Iterator[tuple[int, int]]:
+        """Finds every occurrence of every pattern in `text`
+
+        Parameters
+        ----------
+        text : str
+            Text to search
+
+        Yields
+        ------
+        tuple[int, int]
+            `(end_index, pattern_id)` for each match, where `end_index` is the index
+            just past the last character of the match
+        """
+        text = text.lower()
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        patterns = self.patterns
+        checks_start = self._checks_start
+        checks_end = self._checks_end
+        text_length = len(text)
+
+        state = 0
+        for index, character in enumerate(text):
+            while state and character not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(character, 0)
+
+            for pattern_id in output[state]:
+                end = index + 1
+                start = end - len(patterns[pattern_id])
+                if checks_start[pattern_id] and start > 0 and text[start - 1].isalnum():
+                    continue
+                if checks_end[pattern_id] and end < text_length and text[end].isalnum():
+                    continue
+                yield end, pattern_id
+
+
+    def match_ids(self, text: str) -> set[int]:
+        """Finds which patterns occur in `text`
+
+        Parameters
+        ----------
+        text : str
+            Text to search
+
+        Returns
+        -------
+        set[int]
+            IDs of the patterns that occur in `text`
+        """
+        return {pattern_id for _, pattern_id in self.iter_matches(text)}
+
+
+    def match_bits(self, text: str) -> int:
+        """Finds which patterns occur in `text`
+
+        Parameters
+        ----------
+        text : str
+            Text to search
+
+        Returns
+        -------
+        int
+            Bitset where bit `pattern_id` is set when that pattern occurs in `text`
+        """
+        bits = 0
+        for _, pattern_id in self.iter_matches(text):
+            bits |= 1 << pattern_id
+
+        return bits
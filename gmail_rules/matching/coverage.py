@@ -0,0 +1,253 @@
+import json
+import random
+from collections import Counter
+from typing import Iterable
+
+from ..rules import rule as _R
+
+__all__ = ["RuleCoverage"]
+
+
+def _escape_label_value(value: str) -> str:
+    """Escapes a Prometheus label value"""
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class RuleCoverage:
+    """Counts how often each rule and label matches during local evaluation
+
+    Pass an instance to :obj:`Matcher` (or set :obj:`Matcher.coverage`) and every
+    evaluated message is recorded.  Besides the counts, up to `samples_per_rule`
+    example message IDs are kept for every rule with reservoir sampling, so the
+    examples are a uniform sample of all the messages the rule matched.  Counters
+    from several workers can be combined with :obj:`RuleCoverage.merge()` (they
+    can be sent between processes as JSON or by pickling them).  A single instance
+    is not thread-safe; use one per thread and merge them.
+
+    Parameters
+    ----------
+    samples_per_rule : int, optional
+        Maximum number of example message IDs kept for each rule, by default `5`
+    seed : int, optional
+        Seed of the random number generator used for sampling, by default `None`
+    """
+
+    def __init__(self, samples_per_rule: int = 5, seed: int | None = None) -> None:
+        self.samples_per_rule: int = samples_per_rule
+        """Maximum number of example message IDs kept for each rule"""
+
+        self.messages: int = 0
+        """Number of messages evaluated"""
+
+        self.rule_hits: Counter[str] = Counter()
+        """Number of messages matched by each rule (by name)"""
+
+        self.label_hits: Counter[str] = Counter()
+        """Number of messages each label was applied to"""
+
+        self.samples: dict[str, list[str]] = {}
+        """Example message IDs for each rule (by name)"""
+
+        self._sampled_hits: Counter[str] = Counter()
+        """Number of hits with a message ID that each rule's reservoir was sampled from"""
+
+        self._random: random.Random = random.Random(seed)
+        """Random number generator used for sampling"""
+
+
+    def track(self, rules: Iterable[_R.Rule]) -> None:
+        """Adds rules (and their labels) with a count of zero, so rules that never match are exported
+
+        Parameters
+        ----------
+        rules : :obj:`Rule_Collection` or iterable of :obj:`Rule`
+            Rules to track
+        """
+        for rule in rules:
+            self.rule_hits.setdefault(rule.name, 0)
+            for label in rule.labels:
+                self.label_hits.setdefault(label, 0)
+
+
+    def record(self, matched_rules: Iterable[_R.Rule], message_id: str = "") -> None:
+        """Records the rules that matched one message
+
+        Parameters
+        ----------
+        matched_rules : Iterable[Rule]
+            Rules that matched the message
+        message_id : str, optional
+            Identifier of the message, kept as an example for the rules, by default `""` (not sampled)
+        """
+        self.messages += 1
+
+        labels = set()
+        for rule in matched_rules:
+            rule_name = rule.name
+            self.rule_hits[rule_name] += 1
+            labels.update(rule.labels)
+
+            if message_id:
+                self._sample(rule_name, message_id)
+
+        for label in labels:
+            self.label_hits[label] += 1
+
+
+    def _sample(self, rule_name: str, message_id: str) -> None:
+        """Adds `message_id` to the reservoir of a rule (Algorithm R)"""
+        self._sampled_hits[rule_name] += 1
+        reservoir = self.samples.setdefault(rule_name, [])
+
+        if len(reservoir) < self.samples_per_rule:
+            reservoir.append(message_id)
+        else:
+            index = self._random.randrange(self._sampled_hits[rule_name])
+            if index < self.samples_per_rule:
+                reservoir[index] = message_id
+
+
+    def merge(self, other: "RuleCoverage") -> "RuleCoverage":
+        """Adds the counts and samples of another :obj:`RuleCoverage` to this one
+
+        The merged samples are still a uniform sample of the messages matched by
+        each rule in either counter.
+
+        Parameters
+        ----------
+        other : RuleCoverage
+            Counter to merge into this one (it is not modified)
+
+        Returns
+        -------
+        RuleCoverage
+            This counter
+        """
+        self.messages += other.messages
+        self.rule_hits.update(other.rule_hits)
+        self.label_hits.update(other.label_hits)
+        for rule_name in other.rule_hits:
+            self.rule_hits.setdefault(rule_name, 0)
+        for label in other.label_hits:
+            self.label_hits.setdefault(label, 0)
+
+        for rule_name, other_reservoir in other.samples.items():
+            reservoir = list(self.samples.get(rule_name, []))
+            other_reservoir = list(other_reservoir)
+            remaining_hits = self._sampled_hits[rule_name]
+            other_remaining_hits = other._sampled_hits[rule_name]
+
+            merged_reservoir = []
+            while len(merged_reservoir) < self.samples_per_rule and (reservoir or other_reservoir):
+                ## PICK FROM EACH SIDE IN PROPORTION TO THE NUMBER OF HITS IT WAS SAMPLED FROM
+                if other_reservoir and (not reservoir or self._random.randrange(remaining_hits + other_remaining_hits) >= remaining_hits):
+                    merged_reservoir.append(other_reservoir.pop(self._random.randrange(len(other_reservoir))))
+                    other_remaining_hits -= 1
+                else:
+                    merged_reservoir.append(reservoir.pop(self._random.randrange(len(reservoir))))
+                    remaining_hits -= 1
+
+            self.samples[rule_name] = merged_reservoir
+            self._sampled_hits[rule_name] += other._sampled_hits[rule_name]
+
+        return self
+
+
+    def unused_rules(self, rules: Iterable[_R.Rule] | None = None) -> list[str]:
+        """Names of the rules that never matched a message
+
+        Parameters
+        ----------
+        rules : :obj:`Rule_Collection` or iterable of :obj:`Rule`, optional
+            Rules to check, by default `None` (every tracked rule)
+
+        Returns
+        -------
+        list[str]
+            Names of the rules without any hits (in the order of `rules`)
+        """
+        rule_names = (rule.name for rule in rules) if rules is not None else self.rule_hits
+        return [rule_name for rule_name in rule_names if not self.rule_hits.get(rule_name)]
+
+
+    def to_dict(self) -> dict:
+        """Converts the counters into a JSON-serializable `dict` (see :obj:`RuleCoverage.from_dict()`)"""
+        return {
+            "messages": self.messages,
+            "samples_per_rule": self.samples_per_rule,
+            "rules": {
+                rule_name: {"hits": hits, "sampled_hits": self._sampled_hits[rule_name], "samples": self.samples.get(rule_name, [])}
+                for rule_name, hits in self.rule_hits.most_common()
+            },
+            "labels": dict(self.label_hits.most_common()),
+        }
+
+
+    @classmethod
+    def from_dict(cls, coverage_dict: dict, seed: int | None = None) -> "RuleCoverage":
+        """Rebuilds counters from the output of :obj:`RuleCoverage.to_dict()`
+
+        Parameters
+        ----------
+        coverage_dict : dict
+            Exported counters
+        seed : int, optional
+            Seed of the random number generator used for sampling, by default `None`
+
+        Returns
+        -------
+        RuleCoverage
+            Counters with the same counts and samples
+        """
+        coverage = cls(coverage_dict.get("samples_per_rule", 5), seed)
+        coverage.messages = coverage_dict.get("messages", 0)
+        coverage.label_hits.update(coverage_dict.get("labels", {}))
+
+        for rule_name, rule_coverage in coverage_dict.get("rules", {}).items():
+            coverage.rule_hits[rule_name] = rule_coverage["hits"]
+            if rule_coverage.get("samples"):
+                coverage.samples[rule_name] = list(rule_coverage["samples"])
+                coverage._sampled_hits[rule_name] = rule_coverage.get("sampled_hits", rule_coverage["hits"])
+
+        return coverage
+
+
+    def to_json(self) -> str:
+        """Exports the counters as a JSON `str`"""
+        return json.dumps(self.to_dict(), indent=4)
+
+
+    def to_prometheus(self, prefix: str = "gmail_rules") -> str:
+        """Exports the counters in the Prometheus text exposition format
+
+        Parameters
+        ----------
+        prefix : str, optional
+            Prefix of every metric name, by default `"gmail_rules"`
+
+        Returns
+        -------
+        str
+            `str` with one counter for messages, one per rule and one per label
+        """
+        lines = [
+            f"# HELP {prefix}_messages_total Messages evaluated against the rules",
+            f"# TYPE {prefix}_messages_total counter",
+            f"{prefix}_messages_total {self.messages}",
+            f"# HELP {prefix}_rule_hits_total Messages matched by each rule",
+            f"# TYPE {prefix}_rule_hits_total counter",
+        ]
+        lines.extend(
+            f"{prefix}_rule_hits_total{{rule=\"{_escape_label_value(rule_name)}\"}} {hits}"
+            for rule_name, hits in sorted(self.rule_hits.items())
+        )
+        lines.extend([
+            f"# HELP {prefix}_label_hits_total Messages each label was applied to",
+            f"# TYPE {prefix}_label_hits_total counter",
+        ])
+        lines.extend(
+            f"{prefix}_label_hits_total{{label=\"{_escape_label_value(label)}\"}} {hits}"
+            for label, hits in sorted(self.label_hits.items())
+        )
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,532 @@
+import asyncio
+import json
+import os
+import runpy
+import socket
+import stat
+import threading
+import time
+from typing import Iterable
+
+from ..actions import rule_collection as _RC
+from . import headers as _H
+from . import matcher as _M
+
+__all__ = ["LatencyHistogram", "ClassificationDaemon", "DaemonClient", "load_collection"]
+
+
+MAX_REQUEST_BYTES : int = 64 * 1024 * 1024
+"""Default longest request line (including its batch of raw messages) a :obj:`ClassificationDaemon` accepts"""
+
+
+def load_collection(rule_paths: Iterable[str], attribute: str = "collection") -> _RC.Rule_Collection:
+    """Runs rule files and collects the :obj:`Rule_Collection` each of them defines
+
+    Parameters
+    ----------
+    rule_paths : Iterable[str]
+        Python files that each define a :obj:`Rule_Collection` (or a function returning one)
+    attribute : str, optional
+        Name of the variable holding the collection in each file, by default `"collection"`
+
+    Returns
+    -------
+    Rule_Collection
+        Collection that includes the collection of every file (see :obj:`Rule_Collection.add_collection()`)
+
+    Raises
+    ------
+    TypeError
+        Raises a `TypeError` if a file does not define a :obj:`Rule_Collection`
+    """
+    combined_collection = _RC.Rule_Collection("Daemon Rules")
+
+    for rule_path in rule_paths:
+        rule_collection = runpy.run_path(str(rule_path)).get(attribute)
+        if callable(rule_collection):
+            rule_collection = rule_collection()
+        if not isinstance(rule_collection, _RC.Rule_Collection):
+            raise TypeError(f"{rule_path} needs to define {attribute} as a Rule_Collection, but it is of type {type(rule_collection)}")
+        combined_collection.add_collection(rule_collection)
+
+    return combined_collection
+
+
+class LatencyHistogram:
+    """Histogram of latencies with power-of-two buckets (in microseconds)
+
+    Parameters
+    ----------
+    buckets : int, optional
+        Number of buckets; the last one holds everything slower than `2 ** (buckets - 2)` microseconds, by default `24`
+    """
+
+    def __init__(self, buckets: int = 24) -> None:
+        self.counts: list[int] = [0] * buckets
+        """Number of samples in each bucket"""
+
+        self.count: int = 0
+        """Total number of samples"""
+
+        self.total: float = 0.0
+        """Sum of every sample (in seconds)"""
+
+        self.max: float = 0.0
+        """Largest sample (in seconds)"""
+
+
+    def record(self, seconds: float) -> None:
+        """Adds a sample
+
+        Parameters
+        ----------
+        seconds : float
+            Latency to record
+        """
+        microseconds = int(seconds * 1_000_000)
+        self.counts[min(microseconds.bit_length(), len(self.counts) - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+    def percentile(self, percent: float) -> float:
+        """Upper bound (in seconds) of the bucket containing the given percentile
+
+        Parameters
+        ----------
+        percent : float
+            Percentile between `0` and `100`
+
+        Returns
+        -------
+        float
+            Latency in seconds, or `0.0` when there are no samples
+        """
+        if not self.count:
+            return 0.0
+
+        threshold = self.count * percent / 100
+        cumulative = 0
+        for bucket, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= threshold:
+                return min((2 ** bucket) / 1_000_000, self.max)
+
+        return self.max
+
+
+    def to_dict(self) -> dict:
+        """Summary of the histogram that can be serialized to JSON
+
+        Returns
+        -------
+        dict
+            Count, mean, max, p50/p90/p99 (in seconds) and the count of each bucket keyed by its upper bound in microseconds
+        """
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "buckets_us": {str(2 ** bucket): bucket_count for bucket, bucket_count in enumerate(self.counts) if bucket_count},
+        }
+
+
+def _message_from_request(message: dict) -> _M.Message:
+    """Builds a :obj:`Message` from a request, either from its fields or from its raw text"""
+    if "raw" in message:
+        return _H.parse_message(message["raw"].encode("utf-8"))
+
+    return _M.Message(
+        sender=message.get("sender", ""),
+        to=message.get("to", ""),
+        subject=message.get("subject", ""),
+        body=message.get("body", ""),
+        message_id=message.get("message_id", ""),
+    )
+
+
+class ClassificationDaemon:
+    """Long-running server that classifies messages with a compiled :obj:`Rule_Collection`
+
+    The rule files are loaded with :obj:`load_collection()` and compiled into a
+    :obj:`Matcher`.  Clients connect over a Unix socket and send one JSON request
+    per line; each request can carry a batch of messages.  The rule files are
+    polled for changes, recompiled in a worker thread, and swapped in atomically,
+    so requests are never served by a half-built matcher.  If a changed file
+    fails to load, the previous matcher keeps serving and the error is reported
+    in the stats.
+
+    Requests (one JSON object per line)::
+
+        {"messages": [{"sender": "...", "subject": "...", "body": "..."}, {"raw": "From: ...\\r\\n\\r\\n..."}]}
+        {"op": "stats"}
+        {"op": "reload"}
+
+    Parameters
+    ----------
+    rule_paths : Iterable[str]
+        Python files that each define a :obj:`Rule_Collection`
+    socket_path : str
+        Path of the Unix socket to listen on
+    attribute : str, optional
+        Name of the variable holding the collection in each file, by default `"collection"`
+    poll_interval : float, optional
+        Seconds between checks for changed rule files, by default `1.0`
+    max_request_bytes : int, optional
+        Longest request line accepted; longer requests get an error response and
+        their connection is closed, by default `MAX_REQUEST_BYTES`
+    """
+
+    def __init__(self, rule_paths: Iterable[str], socket_path: str, attribute: str = "collection", poll_interval: float = 1.0, max_request_bytes: int = MAX_REQUEST_BYTES) -> None:
+        self.rule_paths: list[str] = [str(rule_path) for rule_path in rule_paths]
+        self.socket_path = str(socket_path)
+        self.attribute = attribute
+        self.poll_interval = poll_interval
+        self.max_request_bytes = max_request_bytes
+
+        self.matcher: _M.Matcher = _M.Matcher(load_collection(self.rule_paths, attribute))
+        """:obj:`Matcher` currently serving requests (replaced as a whole on reload)"""
+
+        self.generation: int = 1
+        """Incremented every time a new matcher is swapped in"""
+
+        self.last_error: str | None = None
+        """Error raised by the most recent failed reload, if any"""
+
+        self.message_latency = LatencyHistogram()
+        """Time spent classifying each message"""
+
+        self.request_latency = LatencyHistogram()
+        """Time spent handling each request"""
+
+        self._file_state = self._read_file_state()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stopped: asyncio.Event | None = None
+        self._thread: threading.Thread | None = None
+        self._ready = threading.Event()
+        self._serve_error: BaseException | None = None
+        self._reload_lock: asyncio.Lock | None = None
+
+
+    def _read_file_state(self) -> tuple:
+        state = []
+        for rule_path in self.rule_paths:
+            try:
+                file_stat = os.stat(rule_path)
+                state.append((file_stat.st_mtime_ns, file_stat.st_size))
+            except OSError:
+                state.append(None)
+        return tuple(state)
+
+
+    def reload(self) -> bool:
+        """Recompiles the rule files and swaps the new matcher in
+
+        Returns
+        -------
+        bool
+            `True` when the new matcher was swapped in, `False` when loading failed
+        """
+        file_state = self._read_file_state()
+        try:
+            new_matcher = _M.Matcher(load_collection(self.rule_paths, self.attribute))
+        except Exception as error:
+            self.last_error = f"{type(error).__name__}: {error}"
+            self._file_state = file_state
+            return False
+
+        self.matcher = new_matcher
+        self.generation += 1
+        self.last_error = None
+        self._file_state = file_state
+        return True
+
+
+    def classify(self, messages: list[dict]) -> list[dict]:
+        """Classifies a batch of messages with the current matcher
+
+        Parameters
+        ----------
+        messages : list[dict]
+            Messages given as their fields (`sender`, `to`, `subject`, `body`, `message_id`) or as `raw` text
+
+        Returns
+        -------
+        list[dict]
+            For each message, the matching `rules`, `labels`, and the `archive` and `never_spam` actions
+        """
+        matcher = self.matcher
+        results = []
+        for message in messages:
+            start_time = time.perf_counter()
+            classification = matcher.classify(_message_from_request(message))
+            self.message_latency.record(time.perf_counter() - start_time)
+            results.append({
+                "rules": classification.rules,
+                "labels": classification.labels,
+                "archive": classification.archive,
+                "never_spam": classification.never_spam,
+            })
+        return results
+
+
+    def stats(self) -> dict:
+        """Current generation, reload error and latency histograms
+
+        Returns
+        -------
+        dict
+            Stats that can be serialized to JSON
+        """
+        return {
+            "generation": self.generation,
+            "rules": len(self.matcher.rules),
+            "last_error": self.last_error,
+            "message_latency": self.message_latency.to_dict(),
+            "request_latency": self.request_latency.to_dict(),
+        }
+
+
+    async def _reload_in_executor(self, only_if_changed: bool = False) -> bool:
+        """Runs :obj:`ClassificationDaemon.reload()` in a worker thread, one reload at a time"""
+        async with self._reload_lock:
+            if only_if_changed and self._read_file_state() == self._file_state:
+                return False
+            return await asyncio.get_running_loop().run_in_executor(None, self.reload)
+
+
+    async def _handle_request(self, request: dict) -> dict:
+        operation = request.get("op", "classify")
+
+        if operation == "stats":
+            return self.stats()
+        if operation == "reload":
+            reloaded = await self._reload_in_executor()
+            return {"reloaded": reloaded, "generation": self.generation, "last_error": self.last_error}
+        if operation == "classify":
+            messages = request["messages"] if "messages" in request else [request["message"]]
+            return {"results": self.classify(messages), "generation": self.generation}
+
+        raise ValueError(f"Unknown op {operation}")
+
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    ## THE REST OF THE REQUEST MAY STILL BE UNREAD, SO THE CONNECTION CANNOT BE REUSED
+                    writer.write(json.dumps({"error": f"Request is longer than {self.max_request_bytes} bytes"}).encode() + b"\n")
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+
+                start_time = time.perf_counter()
+                try:
+                    response = await self._handle_request(json.loads(line))
+                except (ValueError, KeyError, TypeError, AttributeError) as error:
+                    response = {"error": f"{type(error).__name__}: {error}"}
+                self.request_latency.record(time.perf_counter() - start_time)
+
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+
+        except ConnectionError:
+            pass
+
+        finally:
+            writer.close()
+
+
+    async def _watch_files(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if self._read_file_state() != self._file_state:
+                await self._reload_in_executor(only_if_changed=True)
+
+
+    def _remove_socket(self) -> None:
+        """Removes a stale socket left at the socket path
+
+        A socket is only stale when nothing accepts connections on it, so the socket
+        of another running daemon is never taken over.
+
+        Raises
+        ------
+        FileExistsError
+            Raises a `FileExistsError` if something other than a socket exists at the path
+        FileExistsError
+            Raises a `FileExistsError` if another process is listening on the socket
+        """
+        try:
+            file_mode = os.lstat(self.socket_path).st_mode
+        except FileNotFoundError:
+            return
+
+        if not stat.S_ISSOCK(file_mode):
+            raise FileExistsError(f"{self.socket_path} exists and is not a socket")
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(self.socket_path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                pass
+            else:
+                raise FileExistsError(f"Another process is already listening on {self.socket_path}")
+
+        try:
+            os.remove(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+
+    async def serve(self) -> None:
+        """Serves requests until :obj:`ClassificationDaemon.stop()` is called
+
+        Raises
+        ------
+        FileExistsError
+            Raises a `FileExistsError` if something other than a stale socket exists at the socket path
+        """
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._reload_lock = asyncio.Lock()
+
+        self._remove_socket()
+
+        server = await asyncio.start_unix_server(self._handle_connection, self.socket_path, limit=self.max_request_bytes)
+        socket_inode = os.lstat(self.socket_path).st_ino
+        watcher = asyncio.create_task(self._watch_files())
+        self._ready.set()
+
+        try:
+            async with server:
+                await self._stopped.wait()
+        finally:
+            watcher.cancel()
+            ## ONLY REMOVE THE SOCKET FILE THIS DAEMON CREATED
+            try:
+                if os.lstat(self.socket_path).st_ino == socket_inode:
+                    os.remove(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+
+    def _serve_in_thread(self) -> None:
+        """Runs :obj:`ClassificationDaemon.serve()`, keeping any error for :obj:`ClassificationDaemon.start()`"""
+        try:
+            asyncio.run(self.serve())
+        except BaseException as error:
+            self._serve_error = error
+        finally:
+            self._loop = None
+            self._stopped = None
+            self._ready.set()
+
+
+    def start(self) -> None:
+        """Starts serving in a background thread and waits until the socket is listening
+
+        Raises
+        ------
+        Exception
+            Re-raises the error if the daemon fails before the socket is listening
+        """
+        self._ready.clear()
+        self._serve_error = None
+        self._thread = threading.Thread(target=self._serve_in_thread, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+        if self._serve_error is not None:
+            self._thread.join()
+            self._thread = None
+            raise self._serve_error
+
+
+    def stop(self) -> None:
+        """Stops serving and waits for the background thread to finish"""
+        loop, stopped = self._loop, self._stopped
+        if loop is not None and stopped is not None:
+            try:
+                loop.call_soon_threadsafe(stopped.set)
+            except RuntimeError:
+                pass
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+    def __enter__(self) -> "ClassificationDaemon":
+        self.start()
+        return self
+
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+class DaemonClient:
+    """Blocking client for a :obj:`ClassificationDaemon`
+
+    Parameters
+    ----------
+    socket_path : str
+        Path of the daemon's Unix socket
+    """
+
+    def __init__(self, socket_path: str) -> None:
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(str(socket_path))
+        self._file = self._socket.makefile("rwb")
+
+
+    def request(self, request: dict) -> dict:
+        """Sends one request and waits for its response
+
+        Parameters
+        ----------
+        request : dict
+            Request to send
+
+        Returns
+        -------
+        dict
+            Response from the daemon
+        """
+        self._file.write(json.dumps(request).encode() + b"\n")
+        self._file.flush()
+        return json.loads(self._file.readline())
+
+
+    def classify(self, messages: list[dict]) -> list[dict]:
+        """Classifies a batch of messages (see :obj:`ClassificationDaemon.classify()`)"""
+        response = self.request({"messages": messages})
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response["results"]
+
+
+    def stats(self) -> dict:
+        """Gets the daemon's stats (see :obj:`ClassificationDaemon.stats()`)"""
+        return self.request({"op": "stats"})
+
+
+    def close(self) -> None:
+        """Closes the connection"""
+        self._file.close()
+        self._socket.close()
+
+
+    def __enter__(self) -> "DaemonClient":
+        return self
+
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
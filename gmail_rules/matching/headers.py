@@ -0,0 +1,291 @@
+import binascii
+import re
+from email import message_from_bytes, policy
+from email.header import decode_header, make_header
+from typing import Iterable
+
+from ..rules import rule as _R
+from . import matcher as _M
+
+__all__ = ["ATTRIBUTE_HEADERS", "needed_headers", "needs_body", "scan_headers", "decode_body", "parse_message"]
+
+
+ATTRIBUTE_HEADERS : dict[str, tuple[str, ...]] = {
+    "from": ("from",),
+    "subject": ("subject",),
+    "hasTheWord": ("from", "to", "subject"),
+    "doesNotHaveTheWord": ("from", "to", "subject"),
+}
+"""Headers (lowercase) that each :obj:`Rule` attribute needs in order to be evaluated"""
+
+BODY_ATTRIBUTES : frozenset = frozenset({"hasTheWord", "doesNotHaveTheWord"})
+"""Attributes that also search the body of a message"""
+
+_BLANK_LINE_PATTERN = re.compile(rb"\r?\n\r?\n")
+"""Finds the blank line that separates the header from the body"""
+
+_INITIAL_WINDOW : int = 4096
+"""Number of bytes of a :obj:`memoryview` that are searched for the end of the header first"""
+
+BODY_HEADERS : frozenset = frozenset({"content-type", "content-transfer-encoding"})
+"""Headers (lowercase) that describe how the body of a message is encoded"""
+
+_CHARSET_PATTERN = re.compile(r'charset\s*=\s*"?([^";\s]+)', re.IGNORECASE)
+"""Finds the charset parameter of a `Content-Type` header"""
+
+
+def needed_headers(rules: Iterable[_R.Rule]) -> frozenset[str]:
+    """Works out which headers are needed to evaluate a :obj:`Rule_Collection`
+
+    Parameters
+    ----------
+    rules : :obj:`Rule_Collection` or iterable of :obj:`Rule`
+        Rules that will be evaluated
+
+    Returns
+    -------
+    frozenset[str]
+        Lowercase names of the headers used by the rules' attributes
+    """
+    names = set()
+    for rule in rules:
+        if getattr(rule, "address_set", None) is not None or getattr(rule, "address_group_refs", ()):
+            names.add("from")
+        for attribute_name in rule.rule_attributes:
+            names.update(ATTRIBUTE_HEADERS.get(attribute_name, ()))
+
+    return frozenset(names)
+
+
+def needs_body(rules: Iterable[_R.Rule]) -> bool:
+    """Works out whether evaluating a :obj:`Rule_Collection` requires the body of each message
+
+    Parameters
+    ----------
+    rules : :obj:`Rule_Collection` or iterable of :obj:`Rule`
+        Rules that will be evaluated
+
+    Returns
+    -------
+    bool
+        `True` when any rule uses `hasTheWord` or `doesNotHaveTheWord`
+    """
+    return any(not BODY_ATTRIBUTES.isdisjoint(rule.rule_attributes) for rule in rules)
+
+
+def _find_header_end(data: bytes) -> tuple[int, int]:
+    """Finds where the header ends and the body starts (`-1, -1` when there is no blank line)"""
+    if data[:1] == b"\n":
+        return 0, 1
+    if data[:2] == b"\r\n":
+        return 0, 2
+
+    blank_line = _BLANK_LINE_PATTERN.search(data)
+    if blank_line is None:
+        return -1, -1
+
+    return data.index(b"\n", blank_line.start()) + 1, blank_line.end()
+
+
+def _header_block(raw: bytes | bytearray | memoryview) -> tuple[bytes | bytearray, int, int]:
+    """Returns a searchable block containing the whole header, the header's end and the body's start
+
+    For a :obj:`memoryview`, only the bytes up to the end of the header are copied
+    (searching a window that grows until the blank line is found).
+    """
+    if not isinstance(raw, memoryview):
+        header_end, body_start = _find_header_end(raw)
+        return (raw, header_end, body_start) if header_end != -1 else (raw, len(raw), len(raw))
+
+    window = _INITIAL_WINDOW
+    while True:
+        block = raw[:window].tobytes()
+        header_end, body_start = _find_header_end(block)
+        if header_end != -1 and body_start <= len(block):
+            return block, header_end, body_start
+        if window >= len(raw):
+            return block, len(block), len(block)
+        window *= 4
+
+
+def _decode_value(value: bytes) -> str:
+    """Unfolds a header value and decodes RFC 2047 encoded words (only when there are any)"""
+    if b"\n" in value:
+        value = b" ".join(line.strip() for line in value.splitlines())
+    else:
+        value = value.strip()
+
+    text = value.decode("utf-8", errors="replace")
+
+    if "=?" in text:
+        try:
+            text = str(make_header(decode_header(text)))
+        except (ValueError, LookupError):
+            pass
+
+    return text
+
+
+def scan_headers(raw: bytes | bytearray | memoryview, names: Iterable[str] | None = None) -> dict[str, str]:
+    """Extracts header values straight from the raw bytes of a message
+
+    The header is scanned line by line without building an :obj:`email.message.Message`,
+    and scanning stops at the blank line that separates the header from the body.
+    Folded values are unfolded and RFC 2047 encoded words are decoded only for the
+    requested headers that contain them.  When a header appears more than once, the
+    first value is kept.
+
+    Parameters
+    ----------
+    raw : bytes or bytearray or memoryview
+        Raw RFC 5322 message (or just its header)
+    names : Iterable[str], optional
+        Names of the headers to extract, by default `None` (every header)
+
+    Returns
+    -------
+    dict[str, str]
+        Header values keyed by lowercase header name
+    """
+    wanted = None if names is None else {name.lower().encode() for name in names}
+    data, header_end, _ = _header_block(raw)
+
+    fields: dict[str, str] = {}
+    position = 0
+
+    while position < header_end:
+        line_end = data.find(b"\n", position, header_end)
+        if line_end == -1:
+            line_end = header_end
+
+        if data[position] in (32, 9):
+            position = line_end + 1
+            continue
+
+        colon = data.find(b":", position, line_end)
+        if colon == -1:
+            position = line_end + 1
+            continue
+
+        name = bytes(data[position:colon]).strip().lower()
+
+        value_end = line_end
+        while value_end + 1 < header_end and data[value_end + 1] in (32, 9):
+            next_line_end = data.find(b"\n", value_end + 1, header_end)
+            value_end = header_end if next_line_end == -1 else next_line_end
+
+        if (wanted is None or name in wanted) and name.decode("ascii", errors="replace") not in fields:
+            fields[name.decode("ascii", errors="replace")] = _decode_value(bytes(data[colon + 1:value_end]))
+            if wanted is not None and len(fields) == len(wanted):
+                break
+
+        position = value_end + 1
+
+    return fields
+
+
+def _decode_text(data: bytes, charset: str) -> str:
+    """Decodes `data` with `charset`, falling back to UTF-8 for unknown charsets"""
+    try:
+        return data.decode(charset, errors="replace")
+    except LookupError:
+        return data.decode("utf-8", errors="replace")
+
+
+def _decode_parts(body: bytes, content_type: str, transfer_encoding: str) -> str:
+    """Decodes the text parts of a body with the standard library's parser (used for multipart bodies)"""
+    header = f"Content-Type: {content_type}\r\nContent-Transfer-Encoding: {transfer_encoding or '7bit'}\r\n\r\n"
+    message = message_from_bytes(header.encode("utf-8", errors="replace") + body, policy=policy.default)
+
+    texts = []
+    for part in message.walk():
+        if part.get_content_maintype() != "text" or part.is_attachment():
+            continue
+        try:
+            texts.append(part.get_content())
+        except (LookupError, ValueError):
+            texts.append((part.get_payload(decode=True) or b"").decode("utf-8", errors="replace"))
+
+    return "\n".join(texts)
+
+
+def decode_body(body: bytes | bytearray | memoryview, content_type: str = "", transfer_encoding: str = "") -> str:
+    """Decodes the body of a message into the text that rules search
+
+    Single-part text bodies are decoded directly, undoing the `base64` or
+    `quoted-printable` transfer encoding and decoding the charset.  Multipart
+    bodies are handed to the standard library's parser, and the text of every part
+    that is not an attachment is joined.  Bodies that are not text decode to `""`.
+
+    Parameters
+    ----------
+    body : bytes or bytearray or memoryview
+        Body of the message (everything after the blank line that ends the header)
+    content_type : str, optional
+        Value of the message's `Content-Type` header, by default `""` (`text/plain`)
+    transfer_encoding : str, optional
+        Value of the message's `Content-Transfer-Encoding` header, by default `""` (`7bit`)
+
+    Returns
+    -------
+    str
+        Decoded text of the body
+    """
+    media_type = content_type.split(";", 1)[0].strip().lower() or "text/plain"
+    transfer_encoding = transfer_encoding.strip().lower()
+    body = bytes(body)
+
+    if media_type.startswith("multipart/") or media_type == "message/rfc822":
+        return _decode_parts(body, content_type, transfer_encoding)
+    if not media_type.startswith("text/"):
+        return ""
+
+    charset_match = _CHARSET_PATTERN.search(content_type)
+    charset = charset_match.group(1) if charset_match is not None else "utf-8"
+
+    if transfer_encoding == "base64":
+        try:
+            body = binascii.a2b_base64(body)
+        except binascii.Error:
+            return _decode_parts(body, content_type, transfer_encoding)
+    elif transfer_encoding == "quoted-printable":
+        body = binascii.a2b_qp(body)
+
+    return _decode_text(body, charset)
+
+
+def parse_message(raw: bytes | bytearray | memoryview, names: Iterable[str] | None = None, include_body: bool = True) -> _M.Message:
+    """Builds a :obj:`Message` from the raw bytes of a message using :obj:`scan_headers()`
+
+    Parameters
+    ----------
+    raw : bytes or bytearray or memoryview
+        Raw RFC 5322 message
+    names : Iterable[str], optional
+        Headers to extract (e.g. from :obj:`needed_headers()`), by default `None` (`From`, `To`, `Subject` and `Message-ID`)
+    include_body : bool, optional
+        Whether the body is decoded into :obj:`Message.body` (see :obj:`decode_body()`), by default `True`
+
+    Returns
+    -------
+    Message
+        Message that can be evaluated by a :obj:`Matcher`
+    """
+    names = set(names) if names is not None else {"from", "to", "subject"}
+    names.add("message-id")
+    if include_body:
+        names.update(BODY_HEADERS)
+    fields = scan_headers(raw, names)
+
+    body = ""
+    if include_body:
+        _, _, body_start = _header_block(raw)
+        body = decode_body(raw[body_start:], fields.get("content-type", ""), fields.get("content-transfer-encoding", ""))
+
+    return _M.Message(
+        sender=fields.get("from", ""),
+        to=fields.get("to", ""),
+        subject=fields.get("subject", ""),
+        body=body,
+        message_id=fields.get("message-id", ""),
+    )
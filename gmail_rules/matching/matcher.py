@@ -0,0 +1,422 @@
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, Mapping
+
+from ..rules import address_group as _AG
+from ..rules import rule as _R
+from .aho_corasick import AhoCorasick
+from .coverage import RuleCoverage
+
+__all__ = ["Message", "Classification", "Matcher", "parse_criteria"]
+
+
+_TOKEN_PATTERN = re.compile(r'"(?P<phrase>[^"]*)"?|(?P<bracket>[(){}])|(?P<negate>-)(?=[^\s)}])|(?P<word>[^\s(){}"]+)')
+"""Splits a Gmail search string into phrases, brackets, negations and words"""
+
+CRITERIA_FIELDS : dict[str, str] = {
+    "from": "sender",
+    "subject": "subject",
+    "hasTheWord": "text",
+    "doesNotHaveTheWord": "text",
+}
+"""Maps the :obj:`Rule` attributes that are evaluated locally onto the part of a message they search"""
+
+
+@dataclass
+class Message:
+    """The parts of an email message that rules are evaluated against
+
+    Attributes
+    ----------
+    sender : `str`
+        Value of the `From` header
+    to : `str`
+        Value of the `To` header
+    subject : `str`
+        Value of the `Subject` header
+    body : `str`
+        Text of the message body
+    message_id : `str`
+        Identifier of the message (e.g. its `Message-ID` header)
+    """
+    sender: str = ""
+    to: str = ""
+    subject: str = ""
+    body: str = ""
+    message_id: str = ""
+
+    @property
+    def text(self) -> str:
+        """Every searchable part of the message, searched by `hasTheWord` and `doesNotHaveTheWord`"""
+        return f"{self.sender}\n{self.to}\n{self.subject}\n{self.body}"
+
+
+    def scanned_text(self, message_field: str) -> str:
+        """Part of the message that is scanned for terms, with runs of whitespace collapsed to a single space
+
+        Quoted phrases are whitespace-normalized by :obj:`parse_criteria()`, so collapsing
+        the scanned text lets `"hello world"` match `"Hello  world"` and phrases broken
+        across folded lines, like Gmail does.  The parts of `text` stay on separate lines,
+        so a phrase never spans two parts of the message.
+
+        Parameters
+        ----------
+        message_field : str
+            `"sender"`, `"subject"` or `"text"`
+
+        Returns
+        -------
+        str
+            Whitespace-normalized part of the message
+        """
+        if message_field == "text":
+            return "\n".join(" ".join(part.split()) for part in (self.sender, self.to, self.subject, self.body))
+        return " ".join(getattr(self, message_field).split())
+
+
+@dataclass
+class Classification:
+    """Result of evaluating a :obj:`Rule_Collection` against a :obj:`Message`
+
+    Attributes
+    ----------
+    rules : `list`
+        Names (`str`) of the rules that matched the message
+    labels : `list`
+        Labels (`str`) that the matching rules apply, without duplicates
+    archive : `bool`
+        Whether any matching rule archives the message (`shouldArchive`)
+    never_spam : `bool`
+        Whether any matching rule prevents the message from being sent to spam (`shouldNeverSpam`)
+    """
+    rules: list[str] = field(default_factory=list)
+    labels: list[str] = field(default_factory=list)
+    archive: bool = False
+    never_spam: bool = False
+
+
+def parse_criteria(criteria: str) -> tuple:
+    """Parses a Gmail search string (e.g. a `subject` or `hasTheWord` value) into an expression tree
+
+    Supports words, `"quoted phrases"`, `-negated` terms, `OR`, `(parentheses)` and
+    `{braces}` (any of the enclosed terms).  Terms next to each other must all match.
+    Search operators such as `has:attachment` are treated as plain words.
+
+    Parameters
+    ----------
+    criteria : str
+        Gmail search string
+
+    Returns
+    -------
+    tuple
+        Expression tree made of `("term", str)`, `("not", node)`, `("and", nodes)` and `("or", nodes)`
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(criteria):
+        if match["phrase"] is not None:
+            phrase = " ".join(match["phrase"].lower().split())
+            if phrase:
+                tokens.append(("term", phrase))
+        elif match["bracket"] is not None:
+            tokens.append((match["bracket"], None))
+        elif match["negate"] is not None:
+            tokens.append(("-", None))
+        elif match["word"] == "OR":
+            tokens.append(("OR", None))
+        elif match["word"] != "AND":
+            tokens.append(("term", match["word"].lower()))
+
+    position = 0
+
+    def parse_sequence(closing: str | None, combine: str) -> tuple:
+        nonlocal position
+        alternatives = []
+        terms = []
+
+        while position < len(tokens):
+            kind, _ = tokens[position]
+            if kind == closing:
+                position += 1
+                break
+            if kind == "OR":
+                position += 1
+                alternatives.append(terms)
+                terms = []
+                continue
+            if kind in (")", "}"):
+                position += 1
+                continue
+            terms.append(parse_unary())
+
+        alternatives.append(terms)
+        alternatives = [_simplify(combine, nodes) for nodes in alternatives if nodes]
+
+        return _simplify("or", alternatives)
+
+    def parse_unary() -> tuple:
+        nonlocal position
+        kind, value = tokens[position]
+        position += 1
+
+        if kind == "-":
+            if position >= len(tokens):
+                return ("and", ())
+            return ("not", parse_unary())
+        if kind == "(":
+            return parse_sequence(")", "and")
+        if kind == "{":
+            return parse_sequence("}", "or")
+        return ("term", value)
+
+    return parse_sequence(None, "and")
+
+
+def _simplify(combine: str, nodes: list) -> tuple:
+    """Collapses single-node groups so simple criteria stay simple"""
+    if len(nodes) == 1:
+        return nodes[0]
+    return (combine, tuple(nodes))
+
+
+def _evaluate(node: tuple, term_ids: set[int] | frozenset[int]) -> bool:
+    """Evaluates a compiled expression tree against the IDs of the matched terms"""
+    kind, value = node
+    if kind == "term":
+        return value in term_ids
+    if kind == "not":
+        return not _evaluate(value, term_ids)
+    if kind == "and":
+        return all(_evaluate(child, term_ids) for child in value)
+    return any(_evaluate(child, term_ids) for child in value)
+
+
+def _term_ids(node: tuple) -> set[int]:
+    """IDs of every term in a compiled expression tree"""
+    kind, value = node
+    if kind == "term":
+        return {value}
+    if kind == "not":
+        return _term_ids(value)
+    return set().union(*(_term_ids(child) for child in value))
+
+
+_NO_TERMS : frozenset = frozenset()
+
+
+class Matcher:
+    """Compiled form of a :obj:`Rule_Collection` that evaluates every rule against a message at once
+
+    The terms of every rule's `from`, `subject`, `hasTheWord` and `doesNotHaveTheWord`
+    criteria are compiled into one :obj:`AhoCorasick` automaton per part of the
+    message, so each part is scanned once no matter how many rules there are.
+    An index from each term to the rules that use it then selects the candidate
+    rules, and only those have their negated terms and `OR` groups resolved
+    against the matched terms.  Rules that can match without any of their terms
+    occurring (e.g. ones with only `doesNotHaveTheWord`) are always evaluated.
+    Senders of rules whose emails are an :obj:`AddressSet` are looked up in the
+    set instead.  Rules without any of these criteria never match.
+
+    Parameters
+    ----------
+    rules : :obj:`Rule_Collection` or iterable of :obj:`Rule`
+        Rules to compile
+    address_groups : Mapping[str, AddressGroup], optional
+        Address groups referenced by the rules, by default `None` (the groups registered on `rules`
+        when it is a :obj:`Rule_Collection`)
+    coverage : RuleCoverage, optional
+        Counters that every evaluated message is recorded in, by default `None` (nothing is recorded)
+    """
+
+    def __init__(self, rules: Iterable[_R.Rule], address_groups: Mapping[str, _AG.AddressGroup] | None = None, coverage: RuleCoverage | None = None) -> None:
+        if address_groups is None and hasattr(rules, "resolve_address_groups"):
+            address_groups = rules.resolve_address_groups()
+
+        self.address_groups: Mapping[str, _AG.AddressGroup] = address_groups or {}
+        """Address groups used to resolve the `from` criteria of rules with :obj:`AddressGroupRef`"""
+
+        self.rules: list[_R.Rule] = list(rules)
+        """`list` of the compiled rules, in evaluation order"""
+
+        self._terms: dict[str, dict[str, int]] = {message_field: {} for message_field in set(CRITERIA_FIELDS.values())}
+        """Term IDs for each part of the message"""
+
+        self._conditions: list[tuple[tuple[str, tuple, bool], ...]] = [self._compile_rule(rule) for rule in self.rules]
+        """For each rule, the `(message_field, expression, expected_result)` conditions that must all hold"""
+
+        self._rules_by_term: dict[str, dict[int, list[int]]] = {message_field: {} for message_field in self._terms}
+        """Indices of the rules that use each term ID, for each part of the message"""
+
+        self._unconditional: list[int] = []
+        """Indices of the rules that are evaluated for every message because they can match without any of their terms"""
+
+        for rule_index, conditions in enumerate(self._conditions):
+            self._index_rule(rule_index, conditions)
+
+        self._automata: dict[str, AhoCorasick] = {
+            message_field: AhoCorasick(terms)
+            for message_field, terms in self._terms.items()
+            if terms
+        }
+        """:obj:`AhoCorasick` automaton for every part of the message that has at least one term"""
+
+        self.coverage: RuleCoverage | None = coverage
+        """:obj:`RuleCoverage` that every evaluated message is recorded in, if any"""
+
+        if coverage is not None:
+            coverage.track(self.rules)
+
+
+    @classmethod
+    def from_collection(cls, collection: Iterable[_R.Rule]) -> "Matcher":
+        """Compiles every rule in a :obj:`Rule_Collection` (including child collections)
+
+        Parameters
+        ----------
+        collection : :obj:`Rule_Collection`
+            Collection to compile
+
+        Returns
+        -------
+        Matcher
+            Compiled matcher
+        """
+        return cls(collection)
+
+
+    def _compile_rule(self, rule: _R.Rule) -> tuple:
+        conditions = []
+
+        address_set = getattr(rule, "address_set", None)
+        if address_set is not None:
+            conditions.append(("sender", ("set", address_set), True))
+
+        criteria = rule.rule_attributes
+        if getattr(rule, "address_group_refs", ()):
+            from_criteria = rule.resolve_from(self.address_groups)
+            if from_criteria is None:
+                return (("sender", ("or", ()), True),)      ## EVERY GROUP IS EMPTY, SO THE RULE NEVER MATCHES
+            criteria = dict(criteria, **{"from": from_criteria})
+
+        for attribute_name, message_field in CRITERIA_FIELDS.items():
+            if attribute_name in criteria:
+                node = parse_criteria(criteria[attribute_name])
+                if attribute_name == "doesNotHaveTheWord" and node[0] == "and":
+                    node = ("or", node[1])      ## GMAIL READS THE VALUE AS -{...}, SO ANY OF THE WORDS EXCLUDES THE MESSAGE
+                expression = self._compile_expression(node, message_field)
+                conditions.append((message_field, expression, attribute_name != "doesNotHaveTheWord"))
+
+        return tuple(conditions)
+
+
+    def _index_rule(self, rule_index: int, conditions: tuple) -> None:
+        """Registers a rule under each of its terms, or as unconditional when it holds without any of them"""
+        if not conditions:
+            return
+
+        if all(
+            expression[0] == "set" or _evaluate(expression, _NO_TERMS) == expected
+            for _, expression, expected in conditions
+        ):
+            self._unconditional.append(rule_index)
+            return
+
+        for message_field, expression, _ in conditions:
+            if expression[0] != "set":
+                rules_by_term = self._rules_by_term[message_field]
+                for term_id in _term_ids(expression):
+                    rules_by_term.setdefault(term_id, []).append(rule_index)
+
+
+    def _compile_expression(self, node: tuple, message_field: str) -> tuple:
+        """Replaces the terms of an expression tree with their ID in `message_field`'s automaton"""
+        kind, value = node
+        if kind == "term":
+            term_ids = self._terms[message_field]
+            return ("term", term_ids.setdefault(value, len(term_ids)))
+        if kind == "not":
+            return ("not", self._compile_expression(value, message_field))
+        return (kind, tuple(self._compile_expression(child, message_field) for child in value))
+
+
+    def match_terms(self, message: Message) -> dict[str, set[int]]:
+        """Scans each part of `message` once and records which terms occur in it
+
+        Parameters
+        ----------
+        message : Message
+            Message to scan
+
+        Returns
+        -------
+        dict[str, set[int]]
+            IDs of the matched terms for each part of the message
+        """
+        return {
+            message_field: automaton.match_ids(message.scanned_text(message_field))
+            for message_field, automaton in self._automata.items()
+        }
+
+
+    def match(self, message: Message) -> list[_R.Rule]:
+        """Finds every rule that applies to `message`
+
+        Parameters
+        ----------
+        message : Message
+            Message to evaluate
+
+        Returns
+        -------
+        list[_R.Rule]
+            Rules whose criteria all hold for the message, in collection order
+        """
+        matched_terms = self.match_terms(message)
+
+        candidates = set(self._unconditional)
+        for message_field, term_ids in matched_terms.items():
+            rules_by_term = self._rules_by_term[message_field]
+            for term_id in term_ids:
+                candidates.update(rules_by_term.get(term_id, ()))
+
+        matched_rules = []
+        for rule_index in sorted(candidates):
+            if all(
+                (
+                    expression[1].contains_sender(message.sender) if expression[0] == "set"
+                    else _evaluate(expression, matched_terms.get(message_field, _NO_TERMS))
+                ) == expected
+                for message_field, expression, expected in self._conditions[rule_index]
+            ):
+                matched_rules.append(self.rules[rule_index])
+
+        if self.coverage is not None:
+            self.coverage.record(matched_rules, message.message_id)
+
+        return matched_rules
+
+
+    def classify(self, message: Message) -> Classification:
+        """Works out which labels and actions the rules would apply to `message`
+
+        Parameters
+        ----------
+        message : Message
+            Message to evaluate
+
+        Returns
+        -------
+        Classification
+            Matching rules, labels and actions
+        """
+        classification = Classification()
+
+        for rule in self.match(message):
+            classification.rules.append(rule.name)
+            for label in rule.labels:
+                if label not in classification.labels:
+                    classification.labels.append(label)
+            classification.archive |= rule.rule_attributes.get("shouldArchive") == "true"
+            classification.never_spam |= rule.rule_attributes.get("shouldNeverSpam") == "true"
+
+        return classification
@@ -0,0 +1,8 @@
+"""
+perf
+====
+"""
+
+from .history import BuildMeasurement, Comparison, PerfHistory, measure_build, compare_samples
+from .escaping import benchmark_escaping
+from .parsing import benchmark_parsing
@@ -0,0 +1,16 @@
+from ..perf.history import (
+    BuildMeasurement,
+    Comparison,
+    PerfHistory,
+    measure_build,
+    compare_samples
+)
+from ..perf.escaping import (
+    benchmark_escaping
+)
+from ..perf.parsing import (
+    benchmark_parsing
+)
+
+__all__: list[str]
+__path__: list[str]
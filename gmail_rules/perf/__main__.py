@@ -0,0 +1,172 @@
+"""Command line interface for the perf history
+
+Record a build::
+
+    python -m gmail_rules.perf record rules.py perf_history.jsonl --repeat 5
+
+Compare the latest two versions in the history (exits with `1` on a regression).
+Metrics are compared per rule, so a rule set that grew is not a regression; pass
+`--raw` to compare whole builds of rule sets with the same number of rules::
+
+    python -m gmail_rules.perf compare perf_history.jsonl
+
+Show how a metric changed across versions::
+
+    python -m gmail_rules.perf trend perf_history.jsonl --metric peak_rss
+
+Measure how much xml escaping adds to building a large collection::
+
+    python -m gmail_rules.perf escaping --entries 100000
+
+Measure how much faster the header scanner is than the standard library's parser::
+
+    python -m gmail_rules.perf parsing --messages 10000
+"""
+
+import argparse
+import sys
+
+from ..matching import daemon as _D
+from . import escaping as _PE
+from . import history as _PH
+from . import parsing as _PP
+
+
+def _record(arguments: argparse.Namespace) -> int:
+    perf_history = _PH.PerfHistory(arguments.history)
+
+    for _ in range(arguments.repeat):
+        ## RELOAD THE RULES SO EVERY REPEAT IS A COLD BUILD INSTEAD OF A RENDER CACHE LOOKUP
+        collection = _D.load_collection(arguments.rule_files, arguments.attribute)
+        _, measurement = _PH.measure_build(collection, arguments.label, arguments.version)
+        perf_history.append(measurement)
+        print(f"{measurement.label} {measurement.version}: {measurement.rules} rules, {measurement.entries} entries, "
+              f"{measurement.bytes} bytes in {measurement.wall_time:.4f}s")
+
+    return 0
+
+
+def _compare(arguments: argparse.Namespace) -> int:
+    perf_history = _PH.PerfHistory(arguments.history)
+    versions = perf_history.versions(arguments.label)
+
+    baseline = arguments.baseline or (versions[-2] if len(versions) >= 2 else None)
+    candidate = arguments.candidate or (versions[-1] if versions else None)
+    if baseline is None or candidate is None:
+        print("The history needs measurements of at least two versions to compare", file=sys.stderr)
+        return 2
+
+    if arguments.raw:
+        baseline_rules = perf_history.rule_counts(baseline, arguments.label)
+        candidate_rules = perf_history.rule_counts(candidate, arguments.label)
+        if baseline_rules != candidate_rules or len(baseline_rules) > 1:
+            print(f"Cannot compare raw {arguments.metric} of builds with different numbers of rules "
+                  f"({', '.join(map(str, sorted(baseline_rules)))} vs {', '.join(map(str, sorted(candidate_rules)))}); "
+                  f"compare per rule instead", file=sys.stderr)
+            return 2
+
+    comparison = _PH.compare_samples(
+        perf_history.samples(baseline, arguments.metric, arguments.label, per_rule=not arguments.raw),
+        perf_history.samples(candidate, arguments.metric, arguments.label, per_rule=not arguments.raw),
+        alpha=arguments.alpha,
+        threshold=arguments.threshold,
+    )
+
+    metric_name = arguments.metric if arguments.raw else f"{arguments.metric} per rule"
+    print(f"{metric_name}: {baseline} median {comparison.baseline_median:.6g} -> {candidate} median "
+          f"{comparison.candidate_median:.6g} ({comparison.ratio:.3f}x, p={comparison.p_value:.4f})")
+
+    if comparison.regression:
+        print(f"REGRESSION: {candidate} is significantly worse than {baseline}")
+        return 1
+
+    return 0
+
+
+def _trend(arguments: argparse.Namespace) -> int:
+    perf_history = _PH.PerfHistory(arguments.history)
+    previous_median = None
+
+    for point in perf_history.trend(arguments.metric, arguments.label):
+        if point["median"] is None:
+            print(f"{point['version']}: {point['runs']} runs, {point['rules']:g} rules, no {arguments.metric} recorded")
+            continue
+
+        ## CHANGES ARE PER RULE, SO A RULE SET THAT GREW DOES NOT LOOK SLOWER
+        per_rule = change = ""
+        if point["per_rule_median"] is not None:
+            per_rule = f" ({point['per_rule_median']:.6g} per rule)"
+            if previous_median:
+                change = f" ({point['per_rule_median'] / previous_median:.3f}x per rule)"
+        print(f"{point['version']}: {point['runs']} runs, {point['rules']:g} rules, median {arguments.metric} {point['median']:.6g}{per_rule}{change}")
+        previous_median = point["per_rule_median"]
+
+    return 0
+
+
+def _escaping(arguments: argparse.Namespace) -> int:
+    result = _PE.benchmark_escaping(arguments.entries, arguments.repeat)
+
+    print(f"{result['entries']} entries: {result['escaped']:.3f}s with escaping, {result['unescaped']:.3f}s without "
+          f"({result['overhead']:+.1%})")
+
+    return 0
+
+
+def _parsing(arguments: argparse.Namespace) -> int:
+    result = _PP.benchmark_parsing(arguments.messages, arguments.repeat)
+
+    for mode in ("headers", "body"):
+        timings = result[mode]
+        print(f"{result['messages']} messages ({mode}): {timings['scanned']:.3f}s scanned, {timings['stdlib']:.3f}s with the standard library "
+              f"({timings['speedup']:.1f}x faster)")
+
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m gmail_rules.perf", description="Record and compare build performance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="Measure builds of rule files and append them to a history")
+    record_parser.add_argument("rule_files", nargs="+", help="Python files that each define a Rule_Collection")
+    record_parser.add_argument("history", help="History file to append to")
+    record_parser.add_argument("--attribute", default="collection", help="Variable holding the collection in each file")
+    record_parser.add_argument("--label", default="default", help="Name of the rule set")
+    record_parser.add_argument("--version", default=None, help="Version to record (defaults to the installed version and git commit)")
+    record_parser.add_argument("--repeat", type=int, default=5, help="Number of builds to measure")
+    record_parser.set_defaults(handler=_record)
+
+    compare_parser = subparsers.add_parser("compare", help="Check whether a version is significantly slower than another")
+    compare_parser.add_argument("history", help="History file to read")
+    compare_parser.add_argument("--baseline", default=None, help="Baseline version (defaults to the second latest)")
+    compare_parser.add_argument("--candidate", default=None, help="Candidate version (defaults to the latest)")
+    compare_parser.add_argument("--metric", default="wall_time", choices=_PH.METRICS)
+    compare_parser.add_argument("--label", default=None, help="Only compare runs of this rule set")
+    compare_parser.add_argument("--alpha", type=float, default=0.05, help="Significance level")
+    compare_parser.add_argument("--threshold", type=float, default=0.05, help="Smallest relative slowdown that counts")
+    compare_parser.add_argument("--raw", action="store_true", help="Compare whole builds instead of per rule (only when the rule counts match)")
+    compare_parser.set_defaults(handler=_compare)
+
+    trend_parser = subparsers.add_parser("trend", help="Show the median of a metric for every version")
+    trend_parser.add_argument("history", help="History file to read")
+    trend_parser.add_argument("--metric", default="wall_time", choices=_PH.METRICS)
+    trend_parser.add_argument("--label", default=None, help="Only show runs of this rule set")
+    trend_parser.set_defaults(handler=_trend)
+
+    escaping_parser = subparsers.add_parser("escaping", help="Measure how much xml escaping adds to a build")
+    escaping_parser.add_argument("--entries", type=int, default=100_000, help="Number of rules in the collection")
+    escaping_parser.add_argument("--repeat", type=int, default=3, help="Number of builds with and without escaping")
+    escaping_parser.set_defaults(handler=_escaping)
+
+    parsing_parser = subparsers.add_parser("parsing", help="Compare parsing messages with the header scanner and the standard library")
+    parsing_parser.add_argument("--messages", type=int, default=10_000, help="Number of messages parsed by every run")
+    parsing_parser.add_argument("--repeat", type=int, default=5, help="Number of runs with each parser")
+    parsing_parser.set_defaults(handler=_parsing)
+
+    arguments = parser.parse_args(argv)
+    return arguments.handler(arguments)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
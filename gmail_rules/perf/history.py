@@ -0,0 +1,419 @@
+import errno
+import json
+import math
+import platform
+import statistics
+import subprocess
+import time
+from dataclasses import asdict, dataclass, field
+from importlib import metadata
+from pathlib import Path
+from typing import Iterable
+
+from ..actions import build_xmls as _BX
+from ..actions import rule_collection as _RC
+
+try:
+    import resource
+except ImportError:      ## NOT AVAILABLE ON WINDOWS
+    resource = None
+
+__all__ = ["BuildMeasurement", "Comparison", "PerfHistory", "measure_build", "compare_samples"]
+
+
+METRICS : tuple = ("wall_time", "peak_rss", "bytes", "entries")
+"""Measurements that can be compared between runs"""
+
+
+def _git_commit() -> str | None:
+    """Short hash of the commit the library is running from (`None` outside of a git checkout of the library)"""
+    source_root = Path(__file__).resolve().parents[2]
+    try:
+        output = subprocess.run(
+            ["git", "-C", str(source_root), "rev-parse", "--show-toplevel", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=10, check=True,
+        ).stdout.split()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    ## A LIBRARY INSTALLED INSIDE SOME OTHER REPOSITORY (E.G. IN ITS VIRTUAL ENVIRONMENT) HAS NO COMMIT OF ITS OWN
+    if len(output) != 2 or Path(output[0]).resolve() != source_root:
+        return None
+    return output[1]
+
+
+def _library_version() -> str:
+    """Version recorded when none is passed: the installed version plus the git commit it runs from, when there is one
+
+    Every commit of a checkout shares the installed version, so the commit is what
+    tells their measurements apart.
+    """
+    try:
+        version = metadata.version("email_rules")
+    except metadata.PackageNotFoundError:
+        version = None
+
+    commit = _git_commit()
+    if commit is None:
+        return version or "unknown"
+    return f"{version}+g{commit}" if version else commit
+
+
+def _reset_peak_rss() -> bool:
+    """Resets the peak resident set size of this process to its current size (Linux only)
+
+    Returns
+    -------
+    bool
+        Whether the peak was reset, so that `VmHWM` covers only what runs afterwards
+
+    Raises
+    ------
+    OSError
+        Raises an `OSError` if writing `/proc/self/clear_refs` fails for a reason other than the reset being unsupported
+    """
+    if platform.system() != "Linux":
+        return False
+
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except (FileNotFoundError, PermissionError):      ## /proc IS MISSING OR READ-ONLY (E.G. IN A SANDBOX)
+        return False
+    except OSError as error:
+        if error.errno == errno.EINVAL:      ## KERNELS OLDER THAN 4.0 CANNOT RESET THE PEAK
+            return False
+        raise
+    return True
+
+
+def _max_rss() -> int | None:
+    """Largest resident set size of this process since it started, in bytes (`None` when it cannot be measured)"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if platform.system() == "Darwin" else max_rss * 1024
+
+
+def _peak_rss(was_reset: bool, max_rss_before: int | None) -> int | None:
+    """Peak resident set size (in bytes) since :obj:`_reset_peak_rss()` or since `max_rss_before` was read
+
+    Without a reset, the lifetime maximum only describes the measured code when that
+    code raised it; otherwise the peak is unknown and `None` is returned.
+    """
+    if was_reset:
+        try:
+            with open("/proc/self/status", encoding="ascii") as status_file:
+                for line in status_file:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            pass
+
+    max_rss_after = _max_rss()
+    if max_rss_after is None or max_rss_before is None or max_rss_after <= max_rss_before:
+        return None
+    return max_rss_after
+
+
+@dataclass
+class BuildMeasurement:
+    """Measurements of one production build (:obj:`Rule_Collection.build_final_string()` plus :obj:`build_xml_text()`)
+
+    Attributes
+    ----------
+    label : `str`
+        Name of the rule set or build that was measured
+    version : `str`
+        Version of the library that ran the build
+    rules : `int`
+        Number of rules in the collection
+    entries : `int`
+        Number of `<entry>` elements in the xml
+    bytes : `int`
+        Size of the xml in bytes (UTF-8 encoded)
+    wall_time : `float`
+        Total time of the build in seconds
+    peak_rss : `int`
+        Peak resident set size of the process during the build in bytes, if it could be measured
+    phases : `dict`
+        Time (in seconds) spent in each phase of the build
+    timestamp : `float`
+        When the build was measured (seconds since the epoch)
+    python : `str`
+        Python version that ran the build
+    """
+    label: str
+    version: str
+    rules: int
+    entries: int
+    bytes: int
+    wall_time: float
+    peak_rss: int | None = None
+    phases: dict[str, float] = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+    python: str = field(default_factory=platform.python_version)
+
+
+def measure_build(collection: _RC.Rule_Collection, label: str = "default", version: str | None = None) -> tuple[str, BuildMeasurement]:
+    """Builds the final xml of a collection while measuring how long each phase takes
+
+    The collection's render caches are used as they are, so pass a freshly loaded
+    collection to measure a cold build.
+
+    Parameters
+    ----------
+    collection : :obj:`Rule_Collection`
+        Collection to build
+    label : str, optional
+        Name of the rule set, used to group runs, by default `"default"`
+    version : str, optional
+        Version to record, by default the installed version of the library and the git commit it runs from
+
+    Returns
+    -------
+    tuple[str, BuildMeasurement]
+        The built xml and its measurements
+    """
+    max_rss_before = _max_rss()
+    was_reset = _reset_peak_rss()
+
+    start_time = time.perf_counter()
+    final_string = collection.build_final_string()
+    final_string_time = time.perf_counter()
+    xml_text = _BX.build_xml_text(final_string)
+    end_time = time.perf_counter()
+
+    measurement = BuildMeasurement(
+        label=label,
+        version=version or _library_version(),
+        rules=len(collection),
+        entries=xml_text.count("<entry>"),
+        bytes=len(xml_text.encode("utf-8")),
+        wall_time=end_time - start_time,
+        peak_rss=_peak_rss(was_reset, max_rss_before),
+        phases={"build_final_string": final_string_time - start_time, "build_xml_text": end_time - final_string_time},
+    )
+
+    return xml_text, measurement
+
+
+class PerfHistory:
+    """Append-only history of :obj:`BuildMeasurement` stored as JSON lines in a local file
+
+    Parameters
+    ----------
+    file_path : str
+        Path of the history file (created on the first append)
+    """
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = str(file_path)
+
+
+    def append(self, measurement: BuildMeasurement) -> None:
+        """Adds a measurement to the end of the history
+
+        Parameters
+        ----------
+        measurement : BuildMeasurement
+            Measurement to record
+        """
+        with open(self.file_path, "a", encoding="utf-8") as history_file:
+            history_file.write(json.dumps(asdict(measurement), sort_keys=True) + "\n")
+
+
+    def load(self, label: str | None = None) -> list[BuildMeasurement]:
+        """Reads every measurement in the history
+
+        Parameters
+        ----------
+        label : str, optional
+            Only return measurements with this label, by default `None` (all measurements)
+
+        Returns
+        -------
+        list[BuildMeasurement]
+            Measurements in the order they were recorded
+        """
+        try:
+            with open(self.file_path, encoding="utf-8") as history_file:
+                measurements = [BuildMeasurement(**json.loads(line)) for line in history_file if line.strip()]
+        except FileNotFoundError:
+            return []
+
+        return [measurement for measurement in measurements if label is None or measurement.label == label]
+
+
+    def _by_version(self, label: str | None = None) -> dict[str, list[BuildMeasurement]]:
+        """Measurements grouped by version (read from the file once), in the order versions were first recorded"""
+        measurements_by_version: dict[str, list[BuildMeasurement]] = {}
+        for measurement in self.load(label):
+            measurements_by_version.setdefault(measurement.version, []).append(measurement)
+        return measurements_by_version
+
+
+    def versions(self, label: str | None = None) -> list[str]:
+        """Versions that appear in the history, in the order they were first recorded"""
+        return list(self._by_version(label))
+
+
+    def samples(self, version: str, metric: str = "wall_time", label: str | None = None, per_rule: bool = False) -> list[float]:
+        """Values of `metric` for every measurement of `version`
+
+        Parameters
+        ----------
+        version : str
+            Version whose measurements are returned
+        metric : str, optional
+            One of :obj:`METRICS`, by default `"wall_time"`
+        label : str, optional
+            Only use measurements with this label, by default `None` (all measurements)
+        per_rule : bool, optional
+            Whether each value is divided by the number of rules of its build, so rule
+            sets that grew between versions can be compared, by default `False`
+
+        Returns
+        -------
+        list[float]
+            Values of every measurement that recorded `metric`
+        """
+        return [
+            _metric_value(measurement, metric, per_rule)
+            for measurement in self._by_version(label).get(version, [])
+            if _metric_value(measurement, metric, per_rule) is not None
+        ]
+
+
+    def rule_counts(self, version: str, label: str | None = None) -> set[int]:
+        """Distinct numbers of rules in the builds of `version`"""
+        return {measurement.rules for measurement in self._by_version(label).get(version, [])}
+
+
+    def trend(self, metric: str = "wall_time", label: str | None = None) -> list[dict]:
+        """Median of `metric` (per build and per rule) and of the rule count for every version, in the order versions were recorded
+
+        Returns
+        -------
+        list[dict]
+            `version`, `runs`, `rules`, `median` and `per_rule_median` for every version
+        """
+        trend = []
+        for version, measurements in self._by_version(label).items():
+            values = [value for value in (_metric_value(measurement, metric, False) for measurement in measurements) if value is not None]
+            per_rule_values = [value for value in (_metric_value(measurement, metric, True) for measurement in measurements) if value is not None]
+            trend.append({
+                "version": version,
+                "runs": len(measurements),
+                "rules": statistics.median(measurement.rules for measurement in measurements),
+                "median": statistics.median(values) if values else None,
+                "per_rule_median": statistics.median(per_rule_values) if per_rule_values else None,
+            })
+        return trend
+
+
+def _metric_value(measurement: BuildMeasurement, metric: str, per_rule: bool) -> float | None:
+    """Value of `metric` in `measurement`, divided by its number of rules when `per_rule` is `True`"""
+    value = getattr(measurement, metric)
+    if value is None or not per_rule:
+        return value
+    return value / measurement.rules if measurement.rules else None
+
+
+@dataclass
+class Comparison:
+    """Result of comparing a metric between a baseline and a candidate
+
+    Attributes
+    ----------
+    baseline_median : `float`
+        Median of the baseline samples
+    candidate_median : `float`
+        Median of the candidate samples
+    ratio : `float`
+        `candidate_median / baseline_median`
+    p_value : `float`
+        One-sided Mann-Whitney U p-value that the candidate is larger than the baseline
+    regression : `bool`
+        Whether the candidate is significantly (and meaningfully) larger than the baseline
+    """
+    baseline_median: float
+    candidate_median: float
+    ratio: float
+    p_value: float
+    regression: bool
+
+
+def compare_samples(baseline: Iterable[float], candidate: Iterable[float], alpha: float = 0.05, threshold: float = 0.05) -> Comparison:
+    """Checks whether `candidate` is significantly larger (slower, bigger) than `baseline`
+
+    Uses a one-sided Mann-Whitney U test (normal approximation with tie correction),
+    which does not assume the timings are normally distributed.  A regression is
+    flagged only when the difference is both significant (`p_value < alpha`) and
+    larger than `threshold` (relative to the baseline median).
+
+    Parameters
+    ----------
+    baseline : Iterable[float]
+        Samples of the baseline
+    candidate : Iterable[float]
+        Samples of the candidate
+    alpha : float, optional
+        Significance level, by default `0.05`
+    threshold : float, optional
+        Smallest relative increase of the median that counts as a regression, by default `0.05`
+
+    Returns
+    -------
+    Comparison
+        Medians, ratio, p-value and whether it is a regression
+
+    Raises
+    ------
+    ValueError
+        Raises a `ValueError` when either side has no samples
+    """
+    baseline = list(baseline)
+    candidate = list(candidate)
+    if not baseline or not candidate:
+        raise ValueError("baseline and candidate both need at least one sample")
+
+    combined = sorted([(value, 0) for value in baseline] + [(value, 1) for value in candidate])
+
+    ranks = [0.0] * len(combined)
+    tie_correction = 0.0
+    index = 0
+    while index < len(combined):
+        tie_end = index
+        while tie_end + 1 < len(combined) and combined[tie_end + 1][0] == combined[index][0]:
+            tie_end += 1
+        for tied_index in range(index, tie_end + 1):
+            ranks[tied_index] = (index + tie_end) / 2 + 1
+        tied = tie_end - index + 1
+        tie_correction += tied ** 3 - tied
+        index = tie_end + 1
+
+    baseline_count, candidate_count = len(baseline), len(candidate)
+    total_count = baseline_count + candidate_count
+    candidate_u = sum(rank for rank, (_, group) in zip(ranks, combined) if group == 1) - candidate_count * (candidate_count + 1) / 2
+
+    mean_u = baseline_count * candidate_count / 2
+    variance_u = baseline_count * candidate_count / 12 * ((total_count + 1) - tie_correction / (total_count * (total_count - 1) if total_count > 1 else 1))
+
+    if variance_u > 0:
+        z_score = (candidate_u - mean_u - 0.5) / math.sqrt(variance_u)
+        p_value = 0.5 * math.erfc(z_score / math.sqrt(2))
+    else:
+        p_value = 1.0
+
+    baseline_median = statistics.median(baseline)
+    candidate_median = statistics.median(candidate)
+    ratio = candidate_median / baseline_median if baseline_median else math.inf
+
+    return Comparison(
+        baseline_median=baseline_median,
+        candidate_median=candidate_median,
+        ratio=ratio,
+        p_value=p_value,
+        regression=p_value < alpha and ratio > 1 + threshold,
+    )
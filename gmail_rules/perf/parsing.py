@@ -0,0 +1,98 @@
+import base64
+import gc
+import time
+from email import message_from_bytes, policy
+
+from ..matching import headers as _H
+
+__all__ = ["benchmark_parsing"]
+
+
+def _build_messages(messages: int) -> list[bytes]:
+    """Builds `messages` raw messages that mix plain, base64 and multipart bodies"""
+    received = b"".join(b"Received: from relay%d.example.com\r\n\tby mx.example.com; Mon, 1 Jan 2024 00:00:00 +0000\r\n" % hop for hop in range(6))
+    raw_messages = []
+
+    for index in range(messages):
+        header = (
+            received
+            + b"From: =?utf-8?q?J=C3=BCrgen?= <billing%d@example.com>\r\n" % index
+            + b"To: me@example.com\r\n"
+            + b"Subject: Invoice #%d is ready\r\n" % index
+            + b"Message-ID: <%d@example.com>\r\n" % index
+            + b"DKIM-Signature: v=1; a=rsa-sha256; d=example.com; b=" + b"a" * 300 + b"\r\n"
+        )
+        text = b"Your invoice %d is attached. " % index * 20
+
+        if index % 3 == 0:
+            body = b"Content-Type: text/plain; charset=utf-8\r\n\r\n" + text
+        elif index % 3 == 1:
+            body = b"Content-Type: text/plain; charset=utf-8\r\nContent-Transfer-Encoding: base64\r\n\r\n" + base64.encodebytes(text)
+        else:
+            body = (
+                b'Content-Type: multipart/alternative; boundary="b"\r\n\r\n'
+                b"--b\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n" + text + b"\r\n"
+                b"--b\r\nContent-Type: text/html; charset=utf-8\r\n\r\n<p>" + text + b"</p>\r\n--b--\r\n"
+            )
+        raw_messages.append(header + body)
+
+    return raw_messages
+
+
+def _parse_with_stdlib(raw: bytes, names: tuple[str, ...], include_body: bool) -> tuple[dict[str, str], str]:
+    """Extracts the same headers and body text as :obj:`parse_message()` with the standard library's parser"""
+    message = message_from_bytes(raw, policy=policy.default)
+    fields = {name: str(message[name]) for name in names if name in message}
+
+    body = ""
+    if include_body:
+        body = "\n".join(part.get_content() for part in message.walk() if part.get_content_maintype() == "text" and not part.is_attachment())
+
+    return fields, body
+
+
+def benchmark_parsing(messages: int = 10_000, repeat: int = 5) -> dict:
+    """Measures how much faster :obj:`parse_message()` is than the standard library's parser
+
+    Both parsers extract the same headers (`From`, `To`, `Subject` and `Message-ID`)
+    from the same mix of plain, base64 and multipart messages, once without and once
+    with the body.  The fastest of `repeat` runs of each kind is compared, since noise
+    only ever adds time.
+
+    Parameters
+    ----------
+    messages : int, optional
+        Number of messages parsed by every run, by default `10_000`
+    repeat : int, optional
+        Number of runs of each kind, by default `5`
+
+    Returns
+    -------
+    dict
+        Fastest run times of both parsers (in seconds) and the `speedup` of :obj:`parse_message()`,
+        for the `headers` alone and with the `body`
+    """
+    raw_messages = _build_messages(messages)
+    names = ("from", "to", "subject", "message-id")
+    result = {"messages": messages}
+
+    for mode, include_body in (("headers", False), ("body", True)):
+        timings = {"scanned": [], "stdlib": []}
+        for _ in range(repeat):
+            gc.collect()
+            start_time = time.perf_counter()
+            for raw in raw_messages:
+                _H.parse_message(raw, names, include_body)
+            timings["scanned"].append(time.perf_counter() - start_time)
+
+            gc.collect()
+            start_time = time.perf_counter()
+            for raw in raw_messages:
+                _parse_with_stdlib(raw, names, include_body)
+            timings["stdlib"].append(time.perf_counter() - start_time)
+
+        scanned_time = min(timings["scanned"])
+        stdlib_time = min(timings["stdlib"])
+        result[mode] = {"scanned": scanned_time, "stdlib": stdlib_time, "speedup": stdlib_time / scanned_time}
+
+    return result
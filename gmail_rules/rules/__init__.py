@@ -3,15 +3,22 @@ Initialize rules module
 """
 
 
+from .address_set import AddressSet
+from .address_group import AddressGroup, AddressGroupRef
 from .rule import Rule
 from .copy_to import Copy_To
 from .move_to import Move_To
+from .rule_spec import RuleSpec
 
 
 __all__ = [
+    "AddressSet",
+    "AddressGroup",
+    "AddressGroupRef",
     "Rule",
     "Copy_To",
     "Move_To",
+    "RuleSpec",
 ]
 
 # from . import rule_classes
@@ -1,3 +1,10 @@
+from gmail_rules.rules.address_set import (
+    AddressSet
+)
+from gmail_rules.rules.address_group import (
+    AddressGroup,
+    AddressGroupRef
+)
 from gmail_rules.rules.rule import (
     Rule
 )
@@ -7,6 +14,9 @@ from gmail_rules.rules.copy_to import (
 from gmail_rules.rules.move_to import (
     Move_To
 )
+from gmail_rules.rules.rule_spec import (
+    RuleSpec
+)
 
 __all__: list[str]
 __path__: list[str]
@@ -0,0 +1,103 @@
+import uuid
+from dataclasses import dataclass
+from typing import Iterable
+
+__all__ = ["AddressGroup", "AddressGroupRef"]
+
+
+@dataclass(frozen=True)
+class AddressGroupRef:
+    """Symbolic reference to an :obj:`AddressGroup` registered on a :obj:`Rule_Collection`
+
+    A reference can be used in a rule's `list_of_emails` in place of the addresses
+    themselves.  It is resolved (by name) when the rule is rendered, so the rule does
+    not store its own copy of the group's addresses.
+
+    Attributes
+    ----------
+    name : `str`
+        Name of the referenced group
+    """
+    name: str
+
+
+class AddressGroup:
+    """Named list of email addresses shared by many rules (e.g. a distribution list)
+
+    Register a group with :obj:`Rule_Collection.register_address_group()` and use
+    :obj:`AddressGroup.ref` (or `AddressGroupRef(name)`) in the `list_of_emails` of
+    a rule.  The group's addresses are concatenated once per change, no matter how
+    many rules reference it.
+
+    Parameters
+    ----------
+    name : str
+        Name of the group
+    addresses : Iterable[str], optional
+        Email addresses in the group, by default `()`
+    """
+
+    def __init__(self, name: str, addresses: Iterable[str] = ()) -> None:
+        self.name: str = name
+        """`str` name of the group"""
+
+        self.uid: str = uuid.uuid4().hex
+        """`str` that identifies this group (kept when pickled, unlike `id()`)"""
+
+        self.revision: int = 0
+        """`int` that is incremented every time the addresses of the group change"""
+
+        self.addresses: tuple[str, ...] = tuple(addresses)
+        """`tuple` of the email addresses (`str`) in the group"""
+
+        self._concatenated: tuple[int, str] | None = None
+        """Cached `(revision, concatenated addresses)` pair"""
+
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.name!r}, {len(self.addresses)} addresses)"
+
+
+    def __len__(self) -> int:
+        return len(self.addresses)
+
+
+    def __iter__(self):
+        return iter(self.addresses)
+
+
+    @property
+    def ref(self) -> AddressGroupRef:
+        """:obj:`AddressGroupRef` that refers to this group"""
+        return AddressGroupRef(self.name)
+
+
+    @property
+    def key(self) -> tuple[str, int]:
+        """`(uid, revision)` pair that changes whenever the group changes (used to key cached renders)"""
+        return (self.uid, self.revision)
+
+
+    @property
+    def concatenated_emails(self) -> str:
+        """`str` of the group's addresses joined with `" OR "` (built once per revision)"""
+        if self._concatenated is None or self._concatenated[0] != self.revision:
+            self._concatenated = (self.revision, " OR ".join(self.addresses))
+        return self._concatenated[1]
+
+
+    def update(self, addresses: Iterable[str]) -> None:
+        """Replaces the addresses of the group
+
+        Only the rendered entries of rules that reference this group are rebuilt
+        the next time their collection is built.
+
+        Parameters
+        ----------
+        addresses : Iterable[str]
+            New email addresses of the group
+        """
+        addresses = tuple(addresses)
+        if addresses != self.addresses:
+            self.addresses = addresses
+            self.revision += 1
@@ -0,0 +1,332 @@
+import hashlib
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from email.utils import getaddresses
+from itertools import accumulate
+from operator import itemgetter
+from typing import Iterable, Iterator
+
+__all__ = ["AddressSet"]
+
+
+CRITERIA_CHUNK_LENGTH : int = 1500
+"""Default maximum length of each `from` criteria string rendered from an :obj:`AddressSet`"""
+
+_MAGIC : bytes = b"GRADDR01"
+"""Identifies a file written by :obj:`AddressSet.save()`"""
+
+_HEADER = struct.Struct("<8sQQQQ")
+"""Magic, number of addresses, size of the address blob, number of bloom filter bits and number of bloom filter hashes"""
+
+
+def _normalize(address: str) -> bytes:
+    """Lowercases and strips an email address and encodes it as UTF-8"""
+    return address.strip().lower().encode("utf-8")
+
+
+def _hash(address: bytes) -> int:
+    """64-bit hash of a normalized email address"""
+    return int.from_bytes(hashlib.blake2b(address, digest_size=8).digest(), "little")
+
+
+def _as_uint64(buffer: memoryview) -> memoryview | array:
+    """Views little-endian bytes as unsigned 64-bit integers (copying only on big-endian machines)"""
+    if sys.byteorder == "little":
+        return buffer.cast("Q")
+    values = array("Q", bytes(buffer))
+    values.byteswap()
+    return values
+
+
+class AddressSet:
+    """Compact, read-only set of email addresses for rules that apply to very large sender lists
+
+    Addresses are stored once, UTF-8 encoded, in a single blob ordered by a 64-bit
+    hash of the address, next to a sorted array of those hashes.  Membership is a
+    binary search over the hashes, optionally preceded by a Bloom filter so most
+    addresses that are not in the set are rejected without searching.  A saved set
+    can be loaded with :obj:`mmap`, so millions of addresses do not need to be read
+    into Python strings.
+
+    An :obj:`AddressSet` can be passed to a :obj:`Rule` as its `list_of_emails`; the
+    `from` criteria are then only rendered (in chunks) when xml is built.
+
+    Parameters
+    ----------
+    addresses : Iterable[str], optional
+        Email addresses in the set (case and surrounding whitespace are ignored), by default `()`
+    bloom_bits_per_address : int, optional
+        Size of the Bloom filter in bits per address, by default `10`.  `0` disables the filter
+    """
+
+    def __init__(self, addresses: Iterable[str] = (), bloom_bits_per_address: int = 10) -> None:
+        unique_addresses = {address for address in map(_normalize, addresses) if address}
+        normalized = sorted(zip(map(_hash, unique_addresses), unique_addresses), key=itemgetter(0))
+
+        hashes = array("Q", map(itemgetter(0), normalized))
+        offsets = array("Q", accumulate((len(address) for _, address in normalized), initial=0))
+        blob = b"".join(map(itemgetter(1), normalized))
+
+        bloom_bits = max(len(normalized) * bloom_bits_per_address, 64) if bloom_bits_per_address else 0
+        bloom_bits += -bloom_bits % 64
+        bloom_hashes = max(round(bloom_bits_per_address * 0.69), 1) if bloom_bits else 0
+        bloom = bytearray(bloom_bits // 8)
+
+        self._set_buffers(hashes, offsets, blob, bloom, bloom_hashes)
+
+        for address_hash in hashes:
+            first_hash = address_hash & 0xFFFFFFFF
+            second_hash = (address_hash >> 32) | 1
+            for index in range(bloom_hashes):
+                position = (first_hash + index * second_hash) % bloom_bits
+                bloom[position >> 3] |= 1 << (position & 7)
+
+
+    def _set_buffers(self, hashes, offsets, blob, bloom, bloom_hashes: int) -> None:
+        self._hashes = hashes
+        self._offsets = offsets
+        self._blob = blob
+        self._bloom = bloom
+        self._bloom_bits = len(bloom) * 8
+        self._bloom_hashes = bloom_hashes
+        self._digest: str | None = None
+        self._mmap: mmap.mmap | None = None
+
+
+    def _address_at(self, index: int) -> bytes:
+        return bytes(self._blob[self._offsets[index]:self._offsets[index + 1]])
+
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+
+    def __contains__(self, address: object) -> bool:
+        if not isinstance(address, str):
+            return False
+
+        normalized = _normalize(address)
+        address_hash = _hash(normalized)
+
+        if self._bloom_bits:
+            bloom = self._bloom
+            bloom_bits = self._bloom_bits
+            first_hash = address_hash & 0xFFFFFFFF
+            second_hash = (address_hash >> 32) | 1
+            for index in range(self._bloom_hashes):
+                position = (first_hash + index * second_hash) % bloom_bits
+                if not bloom[position >> 3] & (1 << (position & 7)):
+                    return False
+
+        index = bisect_left(self._hashes, address_hash)
+        while index < len(self._hashes) and self._hashes[index] == address_hash:
+            if self._address_at(index) == normalized:
+                return True
+            index += 1
+
+        return False
+
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(len(self)):
+            yield self._address_at(index).decode("utf-8")
+
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, AddressSet):
+            return NotImplemented
+        return self.digest == other.digest
+
+
+    def __hash__(self) -> int:
+        return hash(self.digest)
+
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({len(self)} addresses)"
+
+
+    def __reduce__(self) -> tuple:
+        return (AddressSet.from_bytes, (self.to_bytes(),))
+
+
+    @property
+    def digest(self) -> str:
+        """SHA-256 of the addresses in the set, used for equality and hashing"""
+        if self._digest is None:
+            self._digest = hashlib.sha256(bytes(self._blob) + memoryview(self._offsets).cast("B").tobytes()).hexdigest()
+        return self._digest
+
+
+    def contains_sender(self, header_value: str) -> bool:
+        """Checks whether any address in a header value (e.g. `"Name <a@b.com>"`) is in the set
+
+        Parameters
+        ----------
+        header_value : str
+            Value of a `From` (or similar) header
+
+        Returns
+        -------
+        bool
+            `True` when one of the addresses in the header is in the set
+        """
+        return any(address in self for _, address in getaddresses([header_value]) if address)
+
+
+    def chunks(self, max_length: int = CRITERIA_CHUNK_LENGTH, separator: str = " OR ") -> Iterator[str]:
+        """Renders the addresses into `from` criteria strings that are each at most `max_length` long
+
+        Parameters
+        ----------
+        max_length : int, optional
+            Maximum length of each criteria string, by default `CRITERIA_CHUNK_LENGTH`.
+            An address longer than this is rendered on its own
+        separator : str, optional
+            String placed between addresses, by default `" OR "`
+
+        Yields
+        ------
+        str
+            Criteria strings, in the set's (hash) order
+        """
+        current_addresses: list[str] = []
+        current_length = 0
+
+        for address in self:
+            added_length = len(address) + (len(separator) if current_addresses else 0)
+            if current_addresses and current_length + added_length > max_length:
+                yield separator.join(current_addresses)
+                current_addresses, current_length = [], 0
+                added_length = len(address)
+
+            current_addresses.append(address)
+            current_length += added_length
+
+        if current_addresses:
+            yield separator.join(current_addresses)
+
+
+    def to_bytes(self) -> bytes:
+        """Serializes the set into the format read by :obj:`AddressSet.from_bytes()` and :obj:`AddressSet.load()`
+
+        Returns
+        -------
+        bytes
+            Serialized set
+        """
+        def little_endian(values) -> bytes:
+            if sys.byteorder == "little":
+                return memoryview(values).cast("B").tobytes()
+            swapped = array("Q", values)
+            swapped.byteswap()
+            return swapped.tobytes()
+
+        return b"".join((
+            _HEADER.pack(_MAGIC, len(self), len(self._blob), self._bloom_bits, self._bloom_hashes),
+            little_endian(self._hashes),
+            little_endian(self._offsets),
+            bytes(self._bloom),
+            bytes(self._blob),
+        ))
+
+
+    @classmethod
+    def from_bytes(cls, data: bytes | bytearray | memoryview | mmap.mmap) -> "AddressSet":
+        """Creates a set that reads directly from serialized data (without copying it)
+
+        Parameters
+        ----------
+        data : bytes or bytearray or memoryview or mmap
+            Data written by :obj:`AddressSet.to_bytes()`
+
+        Returns
+        -------
+        AddressSet
+            Set backed by `data`
+
+        Raises
+        ------
+        ValueError
+            Raises a `ValueError` if `data` is not a serialized :obj:`AddressSet`
+        """
+        buffer = memoryview(data)
+        if len(buffer) < _HEADER.size:
+            raise ValueError("data is too short to be a serialized AddressSet")
+
+        magic, count, blob_length, bloom_bits, bloom_hashes = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC:
+            raise ValueError("data is not a serialized AddressSet")
+
+        position = _HEADER.size
+        hashes = _as_uint64(buffer[position:position + 8 * count])
+        position += 8 * count
+        offsets = _as_uint64(buffer[position:position + 8 * (count + 1)])
+        position += 8 * (count + 1)
+        bloom = buffer[position:position + bloom_bits // 8]
+        position += bloom_bits // 8
+        blob = buffer[position:position + blob_length]
+
+        if position + blob_length > len(buffer):
+            raise ValueError("data is truncated")
+
+        address_set = cls.__new__(cls)
+        address_set._set_buffers(hashes, offsets, blob, bloom, bloom_hashes)
+        return address_set
+
+
+    def save(self, file_path: str) -> None:
+        """Writes the set to a file that can be loaded with :obj:`AddressSet.load()`
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the file to write
+        """
+        with open(file_path, "wb") as address_file:
+            address_file.write(self.to_bytes())
+
+
+    @classmethod
+    def load(cls, file_path: str) -> "AddressSet":
+        """Memory-maps a file written by :obj:`AddressSet.save()`
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the file to load
+
+        Returns
+        -------
+        AddressSet
+            Set that reads the addresses from the memory-mapped file
+        """
+        with open(file_path, "rb") as address_file:
+            mapped_file = mmap.mmap(address_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        address_set = cls.from_bytes(mapped_file)
+        address_set._mmap = mapped_file
+        return address_set
+
+
+    @classmethod
+    def from_text_file(cls, file_path: str, bloom_bits_per_address: int = 10) -> "AddressSet":
+        """Builds a set from a text file with one email address per line (blank lines and `#` comments are ignored)
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the text file
+        bloom_bits_per_address : int, optional
+            Size of the Bloom filter in bits per address, by default `10`
+
+        Returns
+        -------
+        AddressSet
+            Set of the addresses in the file
+        """
+        with open(file_path, encoding="utf-8") as address_file:
+            return cls((line for line in address_file if line.strip() and not line.lstrip().startswith("#")), bloom_bits_per_address)
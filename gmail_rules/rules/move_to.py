@@ -1,5 +1,4 @@
 
-from ..utils import helpers as _hp
 from ..rules.rule import Rule as _Rule
 
 __all__ = ["Move_To"]
@@ -8,7 +7,9 @@ class Move_To(_Rule):
     """:obj:`Move_To` rule object which is a sub-class of :obj:`Rule`
     """
 
-    def __init__(self, rule_label: str | list, list_of_emails: list = [], rule_defaults: dict = {}, rule_name: str = "") -> None:
+    _NAME_PREFIX = "MOVE TO: "
+
+    def __init__(self, rule_label: str | list, list_of_emails: list | None = None, rule_defaults: dict | None = None, rule_name: str = "") -> None:
         """Initialize a :obj:`Move_To` rule object which is a subclass of :obj:`Rule`
 
         Parameters
@@ -16,7 +17,7 @@ class Move_To(_Rule):
         rule_label : `str` or `list`
             This is the label that should be applied to emails that meet
             this rule's criteria
-        list_of_emails : `list`, optional
+        list_of_emails : `list` or :obj:`AddressSet`, optional
             This is a list of email addresses that the mail rule should be
             applied to
         rule_defaults : `dict`, optional
@@ -25,17 +26,9 @@ class Move_To(_Rule):
             This is the name of the specific rule
         """
         if rule_name == "":
-            rule_name = "MOVE TO: "
-
-            if isinstance(rule_label, str):
-                rule_name += f"{rule_label}"
-
-            elif type(rule_label) in _hp.ITERABLE_DATA_TYPES:
-                for label in rule_label:
-                    rule_name += f"{label} | "
-                rule_name = rule_name[:-3]
+            rule_name = self._default_name(rule_label)
 
-        rule_defaults.update(shouldNeverSpam = "true", shouldArchive = "true")
+        rule_defaults = dict(rule_defaults or {}, shouldNeverSpam = "true", shouldArchive = "true")
         ## Add rule-type specific flags to the flags dictionary
 
         super().__init__(list_of_emails, rule_defaults, rule_name)
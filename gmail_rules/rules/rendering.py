@@ -0,0 +1,311 @@
+from typing import Callable, Iterable, Mapping
+
+from ..utils import helpers as _hp
+from . import address_group as _AG
+from . import address_set as _AS
+
+__all__ = [
+    "format_attribute",
+    "format_header",
+    "render_attributes",
+    "join_attributes",
+    "build_entries",
+    "address_group_keys",
+    "resolve_from",
+    "build_rule_parts",
+]
+
+
+RULE_FOOTER : str = "\n</entry>"
+"""`str` representing how each mail rule will end"""
+
+SAFE_ATTRIBUTE_NAMES : frozenset = frozenset(("label", "from", "subject", "hasTheWord", "doesNotHaveTheWord", "shouldNeverSpam", "shouldArchive", "sizeOperator", "sizeUnit"))
+"""Attribute names that never need to be escaped (custom attribute names are escaped)"""
+
+SAFE_ATTRIBUTE_VALUES : frozenset = frozenset(("true", "false"))
+"""Fixed attribute values (e.g. of `shouldNeverSpam` and `shouldArchive`) that never need to be escaped"""
+
+
+def format_attribute(name: str, value: str) -> str:
+    """Formats one rule attribute as an `<apps:property>` line, escaping its name and value
+
+    Parameters
+    ----------
+    name : str
+        Name of the attribute (defined by Google's docs)
+    value : str
+        Value of the attribute
+
+    Returns
+    -------
+    str
+        The properly formatted attribute
+
+    Raises
+    ------
+    ValueError
+        Raises a `ValueError` if the name or value contains a character that is not allowed in xml
+    """
+    if name not in SAFE_ATTRIBUTE_NAMES:
+        name = _hp.escape_xml(name)
+    if value not in SAFE_ATTRIBUTE_VALUES:
+        value = _hp.escape_xml(value)
+
+    return f"\n\t<apps:property name='{name}' value='{value}'/>"
+
+
+def format_header(rule_name: str) -> str:
+    """Builds the top section of a mail rule (the `<entry>` up to its properties)
+
+    Parameters
+    ----------
+    rule_name : str
+        Name of the rule, used as the entry's title
+
+    Returns
+    -------
+    str
+        Header of the rule's entries
+    """
+    return f"<entry>\n\t<category term='filter'></category>\n\t<title>{_hp.escape_xml(rule_name)}</title>\n\t<content></content>"
+
+
+def render_attributes(
+    rule_attributes: Mapping[str, str],
+    rendered_attributes: dict | None = None,
+    format_attribute: Callable[[str, str], str] = format_attribute,
+) -> dict[str, str]:
+    """Formats every rule attribute, reusing previously formatted attributes
+
+    Parameters
+    ----------
+    rule_attributes : Mapping[str, str]
+        Attributes of the rule
+    rendered_attributes : dict, optional
+        Cache of formatted attributes keyed by `(name, value)`, by default `None` (no cache)
+    format_attribute : Callable[[str, str], str], optional
+        Function that formats one attribute, by default :obj:`format_attribute()`
+
+    Returns
+    -------
+    dict[str, str]
+        Formatted xml of every attribute, by attribute name
+    """
+    if rendered_attributes is None:
+        return {attribute_name: format_attribute(attribute_name, attribute_value) for attribute_name, attribute_value in rule_attributes.items()}
+
+    return {
+        attribute_name: _render_attribute(attribute_name, attribute_value, rendered_attributes, format_attribute)
+        for attribute_name, attribute_value in rule_attributes.items()
+    }
+
+
+def _render_attribute(name: str, value: str, rendered_attributes: dict | None, format_attribute: Callable[[str, str], str]) -> str:
+    """Formats one attribute, reusing (and filling) the `(name, value)` cache when one is given"""
+    if rendered_attributes is None:
+        return format_attribute(name, value)
+
+    attribute_xml = rendered_attributes.get((name, value))
+    if attribute_xml is None:
+        attribute_xml = rendered_attributes[(name, value)] = format_attribute(name, value)
+    return attribute_xml
+
+
+def join_attributes(attribute_xmls: Mapping[str, str], attribute_order: Iterable[str]) -> str:
+    """Joins formatted attributes in `attribute_order`
+
+    Parameters
+    ----------
+    attribute_xmls : Mapping[str, str]
+        Formatted xml of every attribute, by attribute name
+    attribute_order : Iterable[str]
+        Order that the attributes should appear in
+
+    Returns
+    -------
+    str
+        Ordered xml of the attributes
+    """
+    return "".join(attribute_xmls[attribute_name] for attribute_name in attribute_order if attribute_name in attribute_xmls)
+
+
+def build_entries(
+    rule_name: str,
+    labels: Iterable[str],
+    rule_header: str,
+    attributes_xml: str,
+    rule_footer: str = RULE_FOOTER,
+    format_attribute: Callable[[str, str], str] = format_attribute,
+    rendered_attributes: dict | None = None,
+) -> str:
+    """Builds the `<entry>` (one for each label) of a rule
+
+    Parameters
+    ----------
+    rule_name : str
+        Name used in the xml comments above the entries
+    labels : Iterable[str]
+        Labels applied by the rule (a single entry without a label is built when there are none)
+    rule_header : str
+        Top section of each entry (see :obj:`format_header()`)
+    attributes_xml : str
+        Ordered xml of every attribute except the label
+    rule_footer : str, optional
+        End of each entry, by default `RULE_FOOTER`
+    format_attribute : Callable[[str, str], str], optional
+        Function that formats the label attribute, by default :obj:`format_attribute()`
+    rendered_attributes : dict, optional
+        Cache of formatted attributes keyed by `(name, value)`, used for the labels, by default `None`
+
+    Returns
+    -------
+    str
+        `str` representing the entries in xml format
+    """
+    labels = list(labels)
+    final_rule = ""
+
+    if not labels:
+        final_rule += f"{_hp.add_xml_comment(rule_name)}\n{rule_header}{attributes_xml}{rule_footer}"
+
+    else:
+        for label in labels:
+            rule_comment = _hp.add_xml_comment(rule_name if len(labels) == 1 else f'{rule_name} ({label})')
+            label_xml = _render_attribute("label", label, rendered_attributes, format_attribute)
+            final_rule += f"{rule_comment}\n{rule_header}{label_xml}{attributes_xml}{rule_footer}\n"
+
+        final_rule = final_rule[:-1]
+
+        if len(labels) > 1:
+            starting_comment = f"{_hp.add_xml_comment(f'START: {rule_name}')}\n"
+            ending_comment = f"\n{_hp.add_xml_comment(f'END: {rule_name}')}"
+            final_rule = f"{starting_comment}{final_rule}{ending_comment}"
+
+    return final_rule.expandtabs(_hp.TAB_SPACING)
+
+
+def address_group_keys(address_group_refs: Iterable[_AG.AddressGroupRef], address_groups: Mapping[str, _AG.AddressGroup] | None) -> tuple:
+    """`(uid, revision)` of every referenced address group (`None` for groups that are not registered)"""
+    return tuple(
+        address_groups[address_group_ref.name].key if address_groups and address_group_ref.name in address_groups else None
+        for address_group_ref in address_group_refs
+    )
+
+
+def resolve_from(
+    rule_name: str,
+    rule_attributes: Mapping[str, str],
+    address_group_refs: Iterable[_AG.AddressGroupRef],
+    address_groups: Mapping[str, _AG.AddressGroup] | None = None,
+) -> str | None:
+    """Builds the `from` criteria of a rule, including the addresses of its address groups
+
+    Parameters
+    ----------
+    rule_name : str
+        Name of the rule (used in error messages)
+    rule_attributes : Mapping[str, str]
+        Attributes of the rule (its own `from` criteria are added after the groups)
+    address_group_refs : Iterable[AddressGroupRef]
+        Address groups referenced by the rule
+    address_groups : Mapping[str, AddressGroup], optional
+        Registered address groups by name, by default `None`
+
+    Returns
+    -------
+    str | None
+        `from` criteria of the rule, or `None` when the rule has no senders
+
+    Raises
+    ------
+    KeyError
+        Raises a `KeyError` if the rule references an address group that is not in `address_groups`
+    """
+    from_values = []
+    for address_group_ref in address_group_refs:
+        address_group = (address_groups or {}).get(address_group_ref.name)
+        if address_group is None:
+            raise KeyError(f"{rule_name} uses the address group {address_group_ref.name}, which is not registered.  Consider calling Rule_Collection.register_address_group()")
+        if address_group.addresses:
+            from_values.append(address_group.concatenated_emails)
+
+    if "from" in rule_attributes:
+        from_values.append(rule_attributes["from"])
+
+    return " OR ".join(from_values) or None
+
+
+def build_rule_parts(
+    rule_name: str,
+    labels: Iterable[str],
+    rule_attributes: Mapping[str, str],
+    attribute_order: Iterable[str],
+    rule_header: str,
+    rule_footer: str = RULE_FOOTER,
+    address_set: _AS.AddressSet | None = None,
+    address_group_refs: tuple[_AG.AddressGroupRef, ...] = (),
+    address_groups: Mapping[str, _AG.AddressGroup] | None = None,
+    rendered_attributes: dict | None = None,
+    format_attribute: Callable[[str, str], str] = format_attribute,
+) -> list[str]:
+    """Builds the xml of a rule as one or more independent parts
+
+    A rule normally has a single part.  A rule whose emails are an :obj:`AddressSet`
+    has one part for every chunk of its `from` criteria (see :obj:`AddressSet.chunks()`),
+    and no parts when the set is empty.  A rule that references address groups has
+    no parts when every group is empty and it has no other senders.
+
+    Parameters
+    ----------
+    rule_name : str
+        Name of the rule
+    labels : Iterable[str]
+        Labels applied by the rule
+    rule_attributes : Mapping[str, str]
+        Attributes of the rule (except the labels)
+    attribute_order : Iterable[str]
+        Order that the attributes should appear in
+    rule_header : str
+        Top section of each entry (see :obj:`format_header()`)
+    rule_footer : str, optional
+        End of each entry, by default `RULE_FOOTER`
+    address_set : AddressSet, optional
+        Senders the rule applies to (instead of its `from` attribute), by default `None`
+    address_group_refs : tuple[AddressGroupRef, ...], optional
+        Address groups whose addresses are added to the `from` criteria, by default `()`
+    address_groups : Mapping[str, AddressGroup], optional
+        Registered address groups used to resolve `address_group_refs`, by default `None`
+    rendered_attributes : dict, optional
+        Cache of formatted attributes keyed by `(name, value)`, by default `None`
+    format_attribute : Callable[[str, str], str], optional
+        Function that formats one attribute, by default :obj:`format_attribute()`
+
+    Returns
+    -------
+    list[str]
+        `list` of `str` that each contain complete entries in xml format
+    """
+    ## ESCAPE EACH LABEL ONCE PER RULE, EVEN WHEN IT IS REPEATED IN EVERY CHUNK OF AN ADDRESS SET
+    if rendered_attributes is None:
+        rendered_attributes = {}
+
+    attribute_xmls = render_attributes(rule_attributes, rendered_attributes, format_attribute)
+
+    if address_group_refs:
+        from_value = resolve_from(rule_name, rule_attributes, address_group_refs, address_groups)
+        if from_value is None:
+            return []
+        attribute_xmls["from"] = format_attribute("from", from_value)
+
+    if address_set is None:
+        return [build_entries(rule_name, labels, rule_header, join_attributes(attribute_xmls, attribute_order), rule_footer, format_attribute)]
+
+    sender_chunks = list(address_set.chunks())
+
+    rule_parts = []
+    for index, sender_chunk in enumerate(sender_chunks, start=1):
+        attribute_xmls["from"] = format_attribute("from", sender_chunk)
+        part_name = rule_name if len(sender_chunks) == 1 else f"{rule_name} [{index}/{len(sender_chunks)}]"
+        rule_parts.append(build_entries(part_name, labels, rule_header, join_attributes(attribute_xmls, attribute_order), rule_footer, format_attribute, rendered_attributes))
+
+    return rule_parts
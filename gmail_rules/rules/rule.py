@@ -1,9 +1,22 @@
+import copy
+from typing import TYPE_CHECKING, Mapping
 
 from ..utils import helpers as _hp
+from . import address_group as _AG
+from . import address_set as _AS
+from . import rendering as _RD
+
+if TYPE_CHECKING:
+    from . import rule_spec as _RS
 
 __all__ = ["Rule"]
 
 
+ATTRIBUTE_ORDER : tuple = ("label", "from", "subject", "hasTheWord", "doesNotHaveTheWord", "shouldNeverSpam", "shouldArchive", "sizeOperator", "sizeUnit")
+"""Hard-coded order that the rule attributes should appear in"""
+
+
+
 class Rule:
     """Defines an individual mail rule and its necessary attributes
 
@@ -28,26 +41,38 @@ class Rule:
         Generic string that appends the unique section of mail rules
     """
 
+    _NAME_PREFIX : str | None = None
+    """Prefix of the name a subclass gives a rule from its labels when no name is passed (`None` when names do not depend on labels)"""
 
-    def __init__(self, list_of_emails: list = [], rule_defaults: dict = {}, rule_name: str = "Mail Filter") -> None:
+
+    def __init__(self, list_of_emails: list | None = None, rule_defaults: dict | None = None, rule_name: str = "Mail Filter") -> None:
         """Initialize a new Rule object
 
         Parameters
         ----------
-        list_of_emails : `list`, optional
+        list_of_emails : `list` or :obj:`AddressSet`, optional
             list of email address to apply rule to, by default `None`
         rule_defaults : `dict`, optional
-            dictionary containing default rule attributes, by default `{}`
+            dictionary containing default rule attributes, by default `None`
         rule_name : `str`, optional
             name of the mail rule, by default `"Mail Filter"`
         """
+        self._revision: int = 0
+        """`int` that is incremented every time this rule is modified (used to invalidate cached renders)"""
+
+        self._shared: set = set()
+        """Names of the containers (`labels`, `rule_attributes`, `emails_list`) shared with rules made by :obj:`Rule.derive()`"""
+
+        self._rendered_attributes: dict = {}
+        """Cache of rendered attribute xml keyed by `(name, value)`, shared with rules made by :obj:`Rule.derive()`"""
+
         self.labels: list = []
         """This is a `list` containing all of the labels that should be applied to this rule"""
 
         self.name: str = rule_name
         """This `str` is the title of the rule"""
 
-        self._attribute_order: tuple = ("label", "from", "subject", "hasTheWord", "doesNotHaveTheWord", "shouldNeverSpam", "shouldArchive", "sizeOperator", "sizeUnit")
+        self._attribute_order: tuple = ATTRIBUTE_ORDER
         """Hard-coded order that the rule attributes should appear in"""
 
         self._possible_attributes: frozenset = frozenset(self._attribute_order)
@@ -56,27 +81,42 @@ class Rule:
         self.rule_attributes: dict[str, str] = {}
         """This is a `dict` of all of the rule attributes that should be applied"""
 
-        for default_attribute_name, default_attribute_value in rule_defaults.items():
+        for default_attribute_name, default_attribute_value in (rule_defaults or {}).items():
             self.add_attribute(default_attribute_name, default_attribute_value)
 
         ###### CHECK WHETHER RULE RELIES ON SPECIFIC EMAIL ADDRESSES ######
-        self.emails_list: list = self.flatten_list(list_of_emails)
+        self.address_set: _AS.AddressSet | None = None
+        """:obj:`AddressSet` of senders this rule applies to (instead of `emails_list`), rendered only when xml is built"""
+
+        if isinstance(list_of_emails, _AS.AddressSet):
+            self.address_set = list_of_emails
+            list_of_emails = None
+
+        address_group_refs, emails_list = self._split_address_groups(self.flatten_list(list_of_emails or []))
+
+        self.address_group_refs: tuple = address_group_refs
+        """`tuple` of :obj:`AddressGroupRef` whose addresses are added to the `from` criteria when the rule is rendered"""
+
+        self.emails_list: list = emails_list
         """Flattened `list` of emails that will be included in the mail rule"""
 
         self.concatenated_emails: str = self.concatenate(self.emails_list)
         """A `str` of the concatenated email addresses that this rule applies to"""
 
-        if list_of_emails != []:
+        if self.emails_list:
             # THIS IS THE CASE WHEN SPECIFIC EMAILS ARE PARSED INTO THE FUNCTION
             self.add_attribute("from", self.concatenated_emails)
         ###### CHECK WHETHER RULE RELIES ON SPECIFIC EMAIL ADDRESSES ######
 
-        self.rule_header: str = f"<entry>\n\t<category term='filter'></category>\n\t<title>{self.name}</title>\n\t<content></content>"
+        self.rule_header: str = _RD.format_header(self.name)
         """This is a `str` representing the top section of a mail rule that remains constant"""
 
-        self.rule_footer: str = "\n</entry>"
+        self.rule_footer: str = _RD.RULE_FOOTER
         """This is a `str` representing how each mail rule will end"""
 
+        self._group_renders: dict = {}
+        """Cached parts of a rule with address groups, keyed by the rule's render key and the `(uid, revision)` of each group"""
+
 
     @property
     def rule_attributes_xmls(self) -> dict:
@@ -87,11 +127,7 @@ class Rule:
         rule_attribute_xmls : `dict`
             Dictionary where keys are the attribute and values are the xml representation of the attribute
         """
-        rule_attributes_xmls = {}
-        for attribute_name, attribute_value in self.rule_attributes.items():
-            rule_attributes_xmls[attribute_name] = f"{self.xml_format_rule_attribute(attribute_name, attribute_value)}"
-
-        return rule_attributes_xmls
+        return _RD.render_attributes(self.rule_attributes, self._rendered_attributes, self.xml_format_rule_attribute)
 
 
     @property
@@ -103,14 +139,7 @@ class Rule:
         rule_attribute_xmls_str : `str`
             :obj:`str` representing this :obj:`Rule` as an xml
         """
-        rule_attributes_xmls_str = ""
-        current_rule_xmls = self.rule_attributes_xmls
-
-        for attribute_name in self._attribute_order:
-            if attribute_name in current_rule_xmls:
-                rule_attributes_xmls_str += current_rule_xmls[attribute_name]
-
-        return rule_attributes_xmls_str
+        return _RD.join_attributes(self.rule_attributes_xmls, self._attribute_order)
 
 
     @property
@@ -125,6 +154,30 @@ class Rule:
         return self.build_rule()
 
 
+    def _render_key(self) -> tuple:
+        """Snapshot of everything the rendered xml of this rule depends on
+
+        Cached renders are reused only while this key is unchanged, so rules modified
+        directly through their public containers (e.g. `rule.labels.append()` or
+        `rule.rule_attributes[name] = value`) are still rendered again.
+
+        Returns
+        -------
+        tuple
+            `tuple` that compares equal as long as the rendered xml would not change
+        """
+        return (
+            self.name,
+            self.rule_header,
+            self.rule_footer,
+            tuple(self.labels),
+            tuple(self.rule_attributes.items()),
+            self._attribute_order,
+            self.address_set,
+            self.address_group_refs,
+        )
+
+
     def _modify_possible_attributes(self, new_attribute: str) -> None:
         """Modify the order of the hard-coded attributes arrays
 
@@ -135,6 +188,20 @@ class Rule:
         """
         self._attribute_order = self._attribute_order + (new_attribute,)
         self._possible_attributes = frozenset(self._attribute_order)
+        self._revision += 1
+
+
+    def _unshare(self, container_name: str) -> None:
+        """Copies a container shared with a derived (or parent) rule before it is modified
+
+        Parameters
+        ----------
+        container_name : str
+            Name of the container (`"labels"`, `"rule_attributes"` or `"emails_list"`)
+        """
+        if container_name in self._shared:
+            setattr(self, container_name, copy.copy(getattr(self, container_name)))
+            self._shared.discard(container_name)
 
 
     def flatten_list(self, list_to_flatten: list) -> list:
@@ -155,7 +222,7 @@ class Rule:
             Returns a final flat list that does not contain any nested lists
         """
         if list_to_flatten == []:
-            return list_to_flatten
+            return []
 
         if isinstance(list_to_flatten[0], list):
             return self.flatten_list(list_to_flatten[0]) + self.flatten_list(list_to_flatten[1:])
@@ -163,6 +230,58 @@ class Rule:
         return list_to_flatten[:1] + self.flatten_list(list_to_flatten[1:])
 
 
+    @staticmethod
+    def _split_address_groups(flat_emails: list) -> tuple[tuple, list]:
+        """Separates address group references from plain email addresses
+
+        Parameters
+        ----------
+        flat_emails : list
+            Flattened `list` of email addresses, :obj:`AddressGroupRef` and :obj:`AddressGroup`
+
+        Returns
+        -------
+        tuple[tuple, list]
+            `tuple` of :obj:`AddressGroupRef` and `list` of the remaining email addresses
+        """
+        address_group_types = (_AG.AddressGroupRef, _AG.AddressGroup)
+        for email in flat_emails:
+            if isinstance(email, address_group_types):
+                break
+        else:
+            return (), flat_emails
+
+        address_group_refs = tuple(
+            email.ref if isinstance(email, _AG.AddressGroup) else email
+            for email in flat_emails
+            if isinstance(email, address_group_types)
+        )
+        emails_list = [email for email in flat_emails if not isinstance(email, address_group_types)]
+
+        return address_group_refs, emails_list
+
+
+    def resolve_from(self, address_groups: Mapping[str, _AG.AddressGroup] | None = None) -> str | None:
+        """Builds the `from` criteria of the rule, including the addresses of its address groups
+
+        Parameters
+        ----------
+        address_groups : Mapping[str, AddressGroup], optional
+            Registered address groups by name, by default `None`
+
+        Returns
+        -------
+        str | None
+            `from` criteria of the rule, or `None` when the rule has no senders
+
+        Raises
+        ------
+        KeyError
+            Raises a `KeyError` if the rule references an address group that is not in `address_groups`
+        """
+        return _RD.resolve_from(self.name, self.rule_attributes, self.address_group_refs, address_groups)
+
+
     def concatenate(self, elements_input: list, separator: str = " OR ") -> str:
         """
         Given a list of elements `elements`, this returns the concatenation of the elements with a
@@ -213,11 +332,14 @@ class Rule:
         Returns
         -------
         rule_line : `str`
-            Returns the properly formatted attribute
-        """
-        rule_line = f"\n\t<apps:property name='{name}' value='{value}'/>"
+            Returns the properly formatted attribute, with the name and value escaped by :obj:`escape_xml()`
 
-        return rule_line
+        Raises
+        ------
+        ValueError
+            Raises a `ValueError` if the name or value contains a character that is not allowed in xml
+        """
+        return _RD.format_attribute(name, value)
 
 
     def add_attribute(self, name: str, value: str, is_custom_attribute: bool = False) -> None:
@@ -261,7 +383,34 @@ class Rule:
             self.add_labels(value)
             return
 
+        self._unshare("rule_attributes")
         self.rule_attributes[name] = value
+        self._revision += 1
+
+
+    def update_attribute(self, name: str, value: str) -> None:
+        """Update the value of an attribute of the mail rule (the attribute is added if it is not defined yet)
+
+        Parameters
+        ----------
+        name : str
+            Name of the attribute to update
+        value : str
+            New value of the attribute
+
+        Raises
+        ------
+        KeyError
+            Raises a `KeyError` if an attribute is not valid
+        """
+        if name not in self.rule_attributes:
+            self.add_attribute(name, value)
+            return
+
+        if self.rule_attributes[name] != value:
+            self._unshare("rule_attributes")
+            self.rule_attributes[name] = value
+            self._revision += 1
 
     def add_attributes(self, attributes_to_add: dict) -> None:
         """Add multiple attributes to a `Rule`
@@ -299,7 +448,9 @@ class Rule:
             Raises a `TypeError` if the label is not a valid type
         """
         if isinstance(labels, str):
+            self._unshare("labels")
             self.labels.append(labels)
+            self._revision += 1
 
         elif type(labels) in _hp.ITERABLE_DATA_TYPES:
             for label in labels:
@@ -325,30 +476,158 @@ class Rule:
         self.add_labels(label)
 
 
-    def build_rule(self) -> str:
+    @classmethod
+    def _default_name(cls, rule_label: str | list) -> str | None:
+        """Builds the name a rule with `rule_label` gets when no name is passed (`None` when names do not depend on labels)"""
+        if cls._NAME_PREFIX is None:
+            return None
+
+        if isinstance(rule_label, str):
+            return cls._NAME_PREFIX + rule_label
+        if type(rule_label) in _hp.ITERABLE_DATA_TYPES:
+            return cls._NAME_PREFIX + " | ".join(f"{label}" for label in rule_label)
+        return cls._NAME_PREFIX
+
+
+    def freeze(self) -> "_RS.RuleSpec":
+        """Creates an immutable, hashable snapshot of this rule
+
+        Returns
+        -------
+        RuleSpec
+            :obj:`RuleSpec` with the same name, labels, attributes and email addresses as this rule
         """
-        After all of the details of a rule are defined, this function is run
-        to actually build the desired mail rule.  It takes an optional argument
-        `rule_name` which is a `str` representing the name of the mail rule,
-        but when the rule is parsed into Gmail, this gets ignored.
+        ## IMPORTED HERE SINCE rule_spec IMPORTS THIS MODULE
+        from . import rule_spec as _RS
+
+        return _RS.RuleSpec.from_rule(self)
+
+
+    def derive(self, rule_name: str | None = None, labels: str | list | None = None, list_of_emails: list | None = None, **attributes: str) -> "Rule":
+        """Creates a variant of this rule that shares everything it does not change
+
+        The new rule (of the same class) shares this rule's labels, attributes, flattened
+        email addresses and rendered attribute xml by reference.  A shared container is
+        only copied the first time either rule modifies it (copy-on-write), so deriving
+        many variants of one template rule is cheap.
+
+        Parameters
+        ----------
+        rule_name : str, optional
+            Name of the new rule, by default `None` (same name as this rule, or when
+            `labels` is passed, the name the rule's class gives a rule with those labels)
+        labels : str | list, optional
+            Labels of the new rule (replacing this rule's labels), by default `None` (same labels)
+        list_of_emails : `list` or :obj:`AddressSet`, optional
+            Email addresses of the new rule, by default `None` (same email addresses)
+        **attributes : str
+            Attributes to add to (or update in) the new rule, e.g. `subject="Invoice"`
+
+        Returns
+        -------
+        Rule
+            New rule with the changes applied
+
+        Raises
+        ------
+        KeyError
+            Raises a `KeyError` if an attribute is not valid
         """
-        final_rule = ""
+        derived_rule = copy.copy(self)
+        derived_rule._group_renders = {}
 
-        if not self.labels:
-            final_rule += f"{_hp.add_xml_comment(self.name)}\n{self.rule_header}{self.rule_attributes_xmls_str}{self.rule_footer}"
+        shared_containers = {"labels", "rule_attributes", "emails_list"}
+        self._shared |= shared_containers
+        derived_rule._shared = set(shared_containers)
 
-        else:
-            for label in self.labels:
-                rule_comment = _hp.add_xml_comment(self.name if len(self.labels) == 1 else f'{self.name} ({label})')
-                final_rule += f"{rule_comment}\n{self.rule_header}{self.xml_format_rule_attribute('label', label)}{self.rule_attributes_xmls_str}{self.rule_footer}\n"
+        if rule_name is None and labels is not None:
+            rule_name = self._default_name(labels)
+
+        if rule_name is not None:
+            derived_rule.name = rule_name
+            derived_rule.rule_header = _RD.format_header(rule_name)
+
+        if labels is not None:
+            derived_rule.labels = []
+            derived_rule._shared.discard("labels")
+            derived_rule.add_labels(labels)
+
+        if list_of_emails is not None:
+            derived_rule._unshare("rule_attributes")
+            derived_rule.rule_attributes.pop("from", None)
 
-            final_rule = final_rule[:-1]
+            if isinstance(list_of_emails, _AS.AddressSet):
+                derived_rule.address_set = list_of_emails
+                list_of_emails = []
+            else:
+                derived_rule.address_set = None
 
-            if len(self.labels) > 1:
-                starting_comment = f"{_hp.add_xml_comment(f'START --- {self.name} --- START')}\n"
-                ending_comment = f"\n{_hp.add_xml_comment(f'END --- {self.name} --- END')}"
-                final_rule = f"{starting_comment}{final_rule}{ending_comment}"
+            derived_rule.address_group_refs, derived_rule.emails_list = derived_rule._split_address_groups(derived_rule.flatten_list(list_of_emails))
+            derived_rule._shared.discard("emails_list")
+            derived_rule.concatenated_emails = derived_rule.concatenate(derived_rule.emails_list)
 
-        final_rule = final_rule.expandtabs(_hp.TAB_SPACING)
+            if derived_rule.emails_list:
+                derived_rule.rule_attributes["from"] = derived_rule.concatenated_emails
+            derived_rule._revision += 1
 
-        return final_rule
+        for attribute_name, attribute_value in attributes.items():
+            derived_rule.update_attribute(attribute_name, attribute_value)
+
+        return derived_rule
+
+
+    def build_rule_parts(self, address_groups: Mapping[str, _AG.AddressGroup] | None = None) -> list[str]:
+        """Builds the xml of the rule as one or more independent parts
+
+        A rule normally has a single part.  A rule whose emails are an :obj:`AddressSet`
+        has one part for every chunk of its `from` criteria (see :obj:`AddressSet.chunks()`),
+        and no parts when the set is empty.  A rule that references address groups has
+        no parts when every group is empty and it has no other senders.
+
+        Parameters
+        ----------
+        address_groups : Mapping[str, AddressGroup], optional
+            Registered address groups used to resolve the rule's :obj:`AddressGroupRef`, by default `None`
+
+        Returns
+        -------
+        list[str]
+            `list` of `str` that each contain complete entries in xml format
+        """
+        if not self.address_group_refs:
+            return self._render_parts(address_groups)
+
+        render_key = (self._render_key(), _RD.address_group_keys(self.address_group_refs, address_groups))
+        rule_parts = self._group_renders.get(render_key)
+        if rule_parts is None:
+            rule_parts = self._render_parts(address_groups)
+            self._group_renders.clear()
+            self._group_renders[render_key] = rule_parts
+
+        return list(rule_parts)
+
+
+    def _render_parts(self, address_groups: Mapping[str, _AG.AddressGroup] | None) -> list[str]:
+        """Renders the parts of this rule with :obj:`rendering.build_rule_parts()`"""
+        return _RD.build_rule_parts(
+            self.name,
+            self.labels,
+            self.rule_attributes,
+            self._attribute_order,
+            self.rule_header,
+            self.rule_footer,
+            address_set=self.address_set,
+            address_group_refs=self.address_group_refs,
+            address_groups=address_groups,
+            rendered_attributes=self._rendered_attributes,
+            format_attribute=self.xml_format_rule_attribute,
+        )
+
+
+    def build_rule(self, address_groups: Mapping[str, _AG.AddressGroup] | None = None) -> str:
+        """
+        After all of the details of a rule are defined, this function is run
+        to actually build the desired mail rule.  Rules that reference address
+        groups need the registered `address_groups` (see :obj:`Rule_Collection.register_address_group()`).
+        """
+        return "\n\n".join(self.build_rule_parts(address_groups))
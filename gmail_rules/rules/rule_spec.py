@@ -0,0 +1,260 @@
+from dataclasses import dataclass
+from functools import cached_property
+from types import MappingProxyType
+from typing import ClassVar, Mapping
+
+from ..rules import address_group as _AG
+from ..rules import address_set as _AS
+from ..rules import rendering as _RD
+from ..rules import rule as _R
+
+__all__ = ["RuleSpec"]
+
+
+@dataclass(frozen=True)
+class RuleSpec:
+    """Immutable, hashable form of a :obj:`Rule`
+
+    A :obj:`RuleSpec` is created with :obj:`Rule.freeze()` and can be used anywhere
+    a :obj:`Rule` is read (collections, matchers, uploaders).  Because it cannot be
+    modified it can be shared between threads, cached, used as a `dict` key and
+    deduplicated with a `set`.  Its xml is built once and then reused.
+
+    Attributes
+    ----------
+    name : `str`
+        Name of the mail rule
+    labels : `tuple`
+        Labels (`str`) applied by the rule
+    attributes : `tuple`
+        `(name, value)` pairs of the rule's attributes, in `attribute_order`
+    emails : `tuple`
+        Email addresses (`str`) that the rule applies to
+    attribute_order : `tuple`
+        Order that the rule attributes appear in
+    address_set : :obj:`AddressSet`
+        Set of senders the rule applies to (instead of `emails`), if any
+    address_group_refs : `tuple`
+        :obj:`AddressGroupRef` whose addresses are added to the `from` criteria when the rule is rendered
+    """
+    name: str = "Mail Filter"
+    labels: tuple[str, ...] = ()
+    attributes: tuple[tuple[str, str], ...] = ()
+    emails: tuple[str, ...] = ()
+    attribute_order: tuple[str, ...] = _R.ATTRIBUTE_ORDER
+    address_set: _AS.AddressSet | None = None
+    address_group_refs: tuple[_AG.AddressGroupRef, ...] = ()
+
+    _revision: ClassVar[int] = 0
+    """Frozen rules never change, so their revision is constant"""
+
+    rule_footer: ClassVar[str] = _RD.RULE_FOOTER
+    """This is a `str` representing how each mail rule will end"""
+
+
+    def __post_init__(self) -> None:
+        attributes = dict(self.attributes) if not isinstance(self.attributes, Mapping) else self.attributes
+        unknown_attributes = set(attributes) - set(self.attribute_order)
+        if unknown_attributes:
+            raise KeyError(f"{', '.join(sorted(unknown_attributes))} are not valid filter attributes.  Check for typos")
+
+        object.__setattr__(self, "labels", tuple(self.labels))
+        object.__setattr__(self, "emails", tuple(self.emails))
+        object.__setattr__(self, "address_group_refs", tuple(self.address_group_refs))
+        object.__setattr__(self, "attribute_order", tuple(self.attribute_order))
+        object.__setattr__(self, "attributes", tuple(
+            (attribute_name, attributes[attribute_name])
+            for attribute_name in self.attribute_order
+            if attribute_name in attributes
+        ))
+
+
+    @classmethod
+    def from_rule(cls, rule: _R.Rule) -> "RuleSpec":
+        """Creates a :obj:`RuleSpec` from a (mutable) :obj:`Rule`
+
+        Parameters
+        ----------
+        rule : :obj:`Rule`
+            Rule to take a snapshot of
+
+        Returns
+        -------
+        RuleSpec
+            Frozen copy of the rule
+        """
+        return cls(
+            name=rule.name,
+            labels=tuple(rule.labels),
+            attributes=dict(rule.rule_attributes),
+            emails=tuple(rule.emails_list),
+            attribute_order=rule._attribute_order,
+            address_set=rule.address_set,
+            address_group_refs=rule.address_group_refs,
+        )
+
+
+    def __copy__(self) -> "RuleSpec":
+        return self
+
+
+    def __deepcopy__(self, memo: dict) -> "RuleSpec":
+        return self
+
+
+    @cached_property
+    def rule_attributes(self) -> Mapping[str, str]:
+        """Read-only `dict` of all of the rule attributes that should be applied"""
+        return MappingProxyType(dict(self.attributes))
+
+
+    @cached_property
+    def _rendered_attributes(self) -> dict:
+        """Cache of rendered attribute xml keyed by `(name, value)`"""
+        return {}
+
+
+    def _render_key(self) -> tuple:
+        """A :obj:`RuleSpec` never changes, so its renders never need to be rebuilt"""
+        return ()
+
+
+    @cached_property
+    def _group_renders(self) -> dict:
+        """Cached parts of a rule with address groups, keyed by the `(uid, revision)` of each group"""
+        return {}
+
+
+    @property
+    def emails_list(self) -> list:
+        """`list` of emails that will be included in the mail rule"""
+        return list(self.emails)
+
+
+    @property
+    def concatenated_emails(self) -> str:
+        """A `str` of the concatenated email addresses that this rule applies to"""
+        return " OR ".join(self.emails)
+
+
+    @property
+    def rule_header(self) -> str:
+        """This is a `str` representing the top section of a mail rule that remains constant"""
+        return _RD.format_header(self.name)
+
+
+    @property
+    def rule_attributes_xmls(self) -> dict:
+        """`dict` where keys are the attribute and values are the xml representation of the attribute"""
+        return _RD.render_attributes(self.rule_attributes, self._rendered_attributes)
+
+
+    @property
+    def rule_attributes_xmls_str(self) -> str:
+        """Ordered xml of every attribute except the labels"""
+        return _RD.join_attributes(self.rule_attributes_xmls, self.attribute_order)
+
+
+    def xml_format_rule_attribute(self, name: str, value: str) -> str:
+        """Formats one attribute (see :obj:`rendering.format_attribute()`)"""
+        return _RD.format_attribute(name, value)
+
+
+    def resolve_from(self, address_groups: Mapping[str, _AG.AddressGroup] | None = None) -> str | None:
+        """Builds the `from` criteria of the rule, including the addresses of its address groups (see :obj:`Rule.resolve_from()`)"""
+        return _RD.resolve_from(self.name, self.rule_attributes, self.address_group_refs, address_groups)
+
+
+    def build_rule_parts(self, address_groups: Mapping[str, _AG.AddressGroup] | None = None) -> list[str]:
+        """Builds the xml of the rule as one or more independent parts (see :obj:`Rule.build_rule_parts()`)
+
+        Parameters
+        ----------
+        address_groups : Mapping[str, AddressGroup], optional
+            Registered address groups used to resolve the rule's :obj:`AddressGroupRef`, by default `None`
+
+        Returns
+        -------
+        list[str]
+            `list` of `str` that each contain complete entries in xml format
+        """
+        if self.address_group_refs:
+            render_key = _RD.address_group_keys(self.address_group_refs, address_groups)
+            rule_parts = self._group_renders.get(render_key)
+            if rule_parts is None:
+                rule_parts = self._render_parts(address_groups)
+                self._group_renders.clear()
+                self._group_renders[render_key] = rule_parts
+            return list(rule_parts)
+
+        return self._render_parts(address_groups)
+
+
+    def _render_parts(self, address_groups: Mapping[str, _AG.AddressGroup] | None) -> list[str]:
+        """Renders the parts of this rule with :obj:`rendering.build_rule_parts()`"""
+        return _RD.build_rule_parts(
+            self.name,
+            self.labels,
+            self.rule_attributes,
+            self.attribute_order,
+            self.rule_header,
+            self.rule_footer,
+            address_set=self.address_set,
+            address_group_refs=self.address_group_refs,
+            address_groups=address_groups,
+            rendered_attributes=self._rendered_attributes,
+        )
+
+
+    @cached_property
+    def final_rule_str(self) -> str:
+        """This is the final `str` that can be copied and pasted into an xml to define the rule"""
+        return "\n\n".join(self.build_rule_parts())
+
+
+    def build_rule(self, address_groups: Mapping[str, _AG.AddressGroup] | None = None) -> str:
+        """Builds the xml of this rule (built once and then reused)
+
+        Parameters
+        ----------
+        address_groups : Mapping[str, AddressGroup], optional
+            Registered address groups used to resolve the rule's :obj:`AddressGroupRef`, by default `None`
+
+        Returns
+        -------
+        str
+            `str` representing the entire rule in xml format
+        """
+        if self.address_group_refs:
+            return "\n\n".join(self.build_rule_parts(address_groups))
+
+        return self.final_rule_str
+
+
+    def freeze(self) -> "RuleSpec":
+        """A :obj:`RuleSpec` is already frozen, so this returns itself"""
+        return self
+
+
+    def thaw(self) -> _R.Rule:
+        """Creates a mutable :obj:`Rule` with the same name, labels, attributes and email addresses
+
+        Returns
+        -------
+        _R.Rule
+            New :obj:`Rule` that can be modified
+        """
+        rule = _R.Rule(rule_name=self.name)
+
+        for attribute_name in self.attribute_order:
+            if attribute_name not in rule._possible_attributes:
+                rule._modify_possible_attributes(attribute_name)
+
+        rule.rule_attributes.update(self.attributes)
+        rule.emails_list = list(self.emails)
+        rule.concatenated_emails = self.concatenated_emails
+        rule.address_set = self.address_set
+        rule.address_group_refs = self.address_group_refs
+        rule.add_labels(list(self.labels))
+
+        return rule
@@ -1,15 +1,61 @@
+import os
+import re
+import tempfile
 import textwrap
 
 TAB_SPACING : int = 4
 """Default amount of spaces used instead of a tab (`"\\t"`)"""
 
+AUTHOR_NAME : str = "Email Rules"
+"""Name written in the `<author>` section of the generated xml feeds (override before building)"""
+
+AUTHOR_EMAIL : str = ""
+"""Email address written in the `<author>` section of the generated xml feeds (override before building)"""
+
 ITERABLE_DATA_TYPES : set = {list, tuple, set, frozenset, dict}
 """Iterable data types that can store multiple instances of other objects\n\nContains: `list`, `tuple`, `set`, `frozenset`, `dict`"""
 
+_XML_ESCAPE_TABLE : dict = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", "'": "&apos;", '"': "&quot;"})
+"""Translate table that escapes the characters with a special meaning in xml text and attribute values"""
+
+_XML_INVALID_CHARACTER = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+"""Finds characters that cannot appear in an xml document, even when escaped"""
+
+_XML_COMMENT_HYPHENS = re.compile(r"-(?=-|$)")
+"""Finds hyphens that are followed by another hyphen or end the text, which xml comments cannot contain"""
+
+_XML_ESCAPED_REFERENCE = re.compile(r"&amp;(amp|lt|gt|apos|quot|#([0-9]+)|#x([0-9a-fA-F]+));")
+"""Finds entity and character references that were escaped a second time by `_XML_ESCAPE_TABLE`"""
+
+
+def _is_xml_character(code_point: int) -> bool:
+    """Whether `code_point` is a character that is allowed in an xml document"""
+    return (
+        code_point in (0x9, 0xA, 0xD)
+        or 0x20 <= code_point <= 0xD7FF
+        or 0xE000 <= code_point <= 0xFFFD
+        or 0x10000 <= code_point <= 0x10FFFF
+    )
+
+
+def _restore_reference(reference: re.Match) -> str:
+    """Keeps an escaped reference as it was, unless it refers to a character that is not allowed in xml"""
+    if reference.group(2) is not None:
+        code_point = int(reference.group(2))
+    elif reference.group(3) is not None:
+        code_point = int(reference.group(3), 16)
+    else:
+        return f"&{reference.group(1)};"
+    return f"&{reference.group(1)};" if _is_xml_character(code_point) else reference.group()
+
 
 def add_xml_comment(comment_text: str) -> str:
     """Add an xml comment to a string (does not include for newlines `"\\n"`)
 
+    xml comments cannot contain `--` or end with `-`, so a space is added after every
+    hyphen that is followed by another hyphen or ends the text, e.g. `"Alerts -- urgent"`
+    becomes `"Alerts - - urgent"`
+
     Parameters
     ----------
     comment_text : str
@@ -20,6 +66,8 @@ def add_xml_comment(comment_text: str) -> str:
     str
         xml comment of `comment_text`
     """
+    if "--" in comment_text or comment_text.endswith("-"):
+        comment_text = _XML_COMMENT_HYPHENS.sub("- ", comment_text)
     return f'<!-- {comment_text} -->'
 
 
@@ -45,6 +93,49 @@ def indent(multiline_text: str, amount: int = 1, indent_character: str = "\t") -
     return textwrap.indent(multiline_text, amount * indent_character)
 
 
+def escape_xml(text: str, keep_references: bool = False) -> str:
+    """Escapes `text` so it can be used in xml text and (single or double quoted) attribute values
+
+    `&`, `<`, `>`, `'` and `"` are replaced by entity references, so `text` is always
+    read back exactly as it was (a subject searching for `&amp;` stays `&amp;`).  Text
+    that was escaped beforehand can pass `keep_references=True` to keep its entity and
+    character references (e.g. `&amp;` or `&#39;`) instead of escaping them twice;
+    character references to characters that are not allowed in xml (e.g. `&#0;`) still
+    have their `&` escaped.  Printable strings without any of these characters (the
+    common case) are returned unchanged without a regex scan.
+
+    Parameters
+    ----------
+    text : str
+        Text to escape
+    keep_references : bool, optional
+        Whether entity and character references already in `text` are kept, by default `False`
+
+    Returns
+    -------
+    str
+        Escaped text
+
+    Raises
+    ------
+    ValueError
+        Raises a `ValueError` if `text` contains a character that is not allowed in xml (e.g. a control character)
+    """
+    ## NON-PRINTABLE TEXT MAY CONTAIN CHARACTERS THAT ARE NOT ALLOWED IN XML, SO ONLY PRINTABLE TEXT TAKES THE FAST PATH
+    if text.isprintable() and "&" not in text and "<" not in text and ">" not in text and "'" not in text and '"' not in text:
+        return text
+
+    invalid_character = _XML_INVALID_CHARACTER.search(text)
+    if invalid_character is not None:
+        raise ValueError(f"{text!r} contains {invalid_character.group()!r}, which is not allowed in xml")
+
+    escaped_text = text.translate(_XML_ESCAPE_TABLE)
+    if keep_references and "&" in text:
+        escaped_text = _XML_ESCAPED_REFERENCE.sub(_restore_reference, escaped_text)
+
+    return escaped_text
+
+
 def convert_to_parseable_string(string_to_parse: str) -> str:
     """Converts a rich-text string into a parseable string containing tabs and newlines
 
@@ -64,3 +155,32 @@ def convert_to_parseable_string(string_to_parse: str) -> str:
     final_string = string_to_parse
     final_string = final_string.replace("\n", "\\n").replace("\t", "\\t").replace("    ", "\\t")
     return final_string
+
+
+def atomic_write(file_path: str, data: bytes) -> None:
+    """Writes `data` to `file_path` so readers never see a partially written file
+
+    The data is written to a temporary file in the same directory, flushed to disk
+    and then renamed over `file_path`
+
+    Parameters
+    ----------
+    file_path : str
+        Path of the file to write
+    data : bytes
+        Contents of the file
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(file_path))
+
+    try:
+        with os.fdopen(file_descriptor, "wb") as temporary_file:
+            temporary_file.write(data)
+            temporary_file.flush()
+            os.fsync(temporary_file.fileno())
+        os.replace(temporary_path, file_path)
+
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
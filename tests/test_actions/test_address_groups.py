@@ -0,0 +1,94 @@
+import pickle
+
+import pytest
+
+import gmail_rules.rules as _R
+from gmail_rules.actions.build_xmls import shard_xml_texts
+from gmail_rules.actions.rule_collection import Rule_Collection
+from gmail_rules.api.filters import collection_to_filters
+from gmail_rules.matching import Matcher, Message
+
+
+TEAM = ["alice@team.com", "bob@team.com"]
+
+
+def make_collection() -> tuple[Rule_Collection, _R.Rule, _R.Rule]:
+    collection = Rule_Collection()
+    team = collection.register_address_group("team", TEAM)
+
+    team_rule = _R.Move_To("Team", [team.ref, "boss@team.com"])
+    news_rule = _R.Copy_To("News", ["news@paper.com"])
+    collection.add_rules([team_rule, news_rule])
+
+    return collection, team_rule, news_rule
+
+
+class TestAddressGroups:
+
+    def test_group_is_resolved_when_rendered(self):
+        """Test that a referenced group renders like the addresses written out in full
+        """
+        collection, team_rule, _ = make_collection()
+
+        expected_rule = _R.Move_To("Team", TEAM + ["boss@team.com"])
+        assert team_rule.emails_list == ["boss@team.com"]
+        assert team_rule.build_rule(collection.address_groups) == expected_rule.final_rule_str
+        assert expected_rule.final_rule_str in collection.build_final_string()
+
+        with pytest.raises(KeyError):
+            team_rule.build_rule()
+
+        with pytest.raises(KeyError):
+            collection.register_address_group("team")
+
+    def test_update_only_rebuilds_rules_using_the_group(self, monkeypatch):
+        """Test that changing a group re-renders only the rules that reference it
+        """
+        collection, team_rule, news_rule = make_collection()
+        collection.build_final_string()
+
+        built_rules = []
+        for rule in (team_rule, news_rule):
+            original_build_rule_parts = rule.build_rule_parts
+            monkeypatch.setattr(rule, "build_rule_parts", lambda *args, rule=rule, build_rule_parts=original_build_rule_parts: built_rules.append(rule.name) or build_rule_parts(*args))
+
+        collection.update_address_group("team", ["carol@team.com"])
+        final_string = collection.build_final_string()
+
+        assert built_rules == ["MOVE TO: Team"]
+        assert "carol@team.com OR boss@team.com" in final_string
+        assert "alice@team.com" not in final_string
+
+    def test_child_collections_and_pickling(self):
+        """Test that rules of child collections see their parent's groups and survive pickling
+        """
+        parent = Rule_Collection("Parent")
+        parent.register_address_group("team", TEAM)
+
+        child = Rule_Collection("Child")
+        child.add_rule(_R.Copy_To("Team", [_R.AddressGroupRef("team")]))
+        parent.add_collection(child)
+
+        restored_parent = pickle.loads(pickle.dumps(parent))
+        assert restored_parent.build_final_string() == parent.build_final_string()
+        assert "alice@team.com OR bob@team.com" in parent.build_final_string()
+
+        parent.update_address_group("team", [])
+        assert "<entry>" not in parent.build_final_string()
+        assert shard_xml_texts(parent) == []
+
+    def test_matcher_and_filters_resolve_groups(self):
+        """Test that local evaluation and the Gmail API filters use the group's addresses
+        """
+        collection, _, _ = make_collection()
+
+        matcher = Matcher(collection)
+        assert [rule.name for rule in matcher.match(Message(sender="Bob <bob@team.com>"))] == ["MOVE TO: Team"]
+        assert matcher.match(Message(sender="eve@team.com")) == []
+
+        filters = collection_to_filters(collection)
+        assert filters[0]["criteria"]["from"] == "alice@team.com OR bob@team.com OR boss@team.com"
+
+        frozen_rule = collection["MOVE TO: Team"].freeze()
+        assert frozen_rule.address_group_refs == (_R.AddressGroupRef("team"),)
+        assert frozen_rule.build_rule(collection.address_groups) == collection["MOVE TO: Team"].build_rule(collection.address_groups)
@@ -0,0 +1,106 @@
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import gmail_rules.rules as _R
+from gmail_rules.actions.build_xmls import build_xml_text, shard_xml_texts, write_sharded_feeds
+from gmail_rules.actions.rule_collection import Rule_Collection
+import gmail_rules.utils.helpers as _hp
+
+
+def build_collection(number_of_rules: int) -> Rule_Collection:
+    collection = Rule_Collection()
+    for index in range(number_of_rules):
+        collection.add_rule(_R.Copy_To(f"label_{index}", [f"sender_{index}@gmail.com"]))
+    return collection
+
+
+class TestShardedFeeds:
+
+    def test_single_shard_matches_build_xml_text(self):
+        """Test that a collection within the limits produces the same feed as build_xml_text
+        """
+        collection = build_collection(5)
+        shards = shard_xml_texts(collection)
+
+        assert shards == [(build_xml_text(collection.final_string), 5)]
+
+    def test_shards_respect_limits(self):
+        """Test that every shard is a valid feed within the byte and entry limits
+        """
+        shards = shard_xml_texts(build_collection(50), max_bytes=4_000, max_entries=7)
+
+        assert len(shards) > 1
+        assert sum(entries for _, entries in shards) == 50
+        for feed_text, entries in shards:
+            assert len(feed_text.encode("utf-8")) <= 4_000
+            assert entries <= 7
+            feed = ET.fromstring(feed_text.encode("utf-8"))
+            assert len(feed.findall("{http://www.w3.org/2005/Atom}entry")) == entries
+            assert f"<name>{_hp.AUTHOR_NAME}</name>" in feed_text
+
+    def test_rule_with_multiple_labels_kept_together(self):
+        """Test that all of the entries of a rule with several labels stay in one shard
+        """
+        collection = build_collection(4)
+        collection.add_rule(_R.Copy_To(["a", "b", "c"], ["multi@gmail.com"]))
+
+        shards = shard_xml_texts(collection, max_entries=4)
+
+        assert [entries for _, entries in shards] == [4, 3]
+        assert [feed_text.count("<entry>") for feed_text, _ in shards] == [4, 3]
+
+    def test_rule_too_large_raises(self):
+        """Ensure a ValueError is raised when a single rule cannot fit in a shard
+        """
+        with pytest.raises(ValueError):
+            shard_xml_texts(build_collection(1), max_bytes=100)
+
+    def test_write_sharded_feeds_skips_unchanged(self, tmp_path):
+        """Test that unchanged shards are skipped and stale shards removed on the next run
+        """
+        collection = build_collection(30)
+        first_run = write_sharded_feeds(collection, tmp_path, max_entries=10)
+
+        assert [shard.filename for shard in first_run] == ["mailFilters-0001.xml", "mailFilters-0002.xml", "mailFilters-0003.xml"]
+        assert all(shard.written for shard in first_run)
+        assert os.path.exists(tmp_path / "manifest.json")
+
+        second_run = write_sharded_feeds(collection, tmp_path, max_entries=10)
+        assert not any(shard.written for shard in second_run)
+
+        third_run = write_sharded_feeds(build_collection(15), tmp_path, max_entries=10)
+        assert len(third_run) == 2
+        assert not os.path.exists(tmp_path / "mailFilters-0003.xml")
+        assert sorted(os.listdir(tmp_path)) == ["mailFilters-0001.xml", "mailFilters-0002.xml", "manifest.json"]
+
+    def test_shards_reuse_collection_render_cache(self, monkeypatch):
+        """Test that sharding a collection that was already built does not render its rules again
+        """
+        collection = build_collection(6)
+        collection.build_final_string()
+
+        calls = []
+        for rule in collection:
+            monkeypatch.setattr(rule, "build_rule_parts", lambda *args: calls.append(1) or [])
+
+        shards = shard_xml_texts(collection, max_entries=4)
+
+        assert not calls
+        assert [entries for _, entries in shards] == [4, 2]
+
+
+class TestBuildXmlText:
+
+    def test_author_is_escaped(self, monkeypatch):
+        """Test that the author name and email are escaped like every other text field
+        """
+        monkeypatch.setattr(_hp, "AUTHOR_NAME", "Smith & <Sons>")
+        monkeypatch.setattr(_hp, "AUTHOR_EMAIL", "a&b@example.com")
+
+        namespaces = {"atom": "http://www.w3.org/2005/Atom"}
+        author = ET.fromstring(build_xml_text("")).find("atom:author", namespaces)
+
+        assert author.find("atom:name", namespaces).text == "Smith & <Sons>"
+        assert author.find("atom:email", namespaces).text == "a&b@example.com"
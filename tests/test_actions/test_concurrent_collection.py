@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import gmail_rules.rules as _R
+from gmail_rules.actions.concurrent_collection import ConcurrentCollectionBuilder
+from gmail_rules.actions.rule_collection import Rule_Collection
+
+
+def load_source(builder: ConcurrentCollectionBuilder, source: str, count: int) -> None:
+    for index in range(count):
+        builder.add_rule(_R.Copy_To(f"{source}-{index}", [f"{index}@{source}.com"]), source)
+
+
+class TestConcurrentCollectionBuilder:
+
+    def test_threads_produce_deterministic_collection(self):
+        """Test that rules added from many threads are ordered by source and position
+        """
+        sources = [f"source-{number}" for number in range(8)]
+
+        builder = ConcurrentCollectionBuilder(stripes=4)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda source: load_source(builder, source, 200), sources))
+
+        collection = builder.freeze()
+        assert isinstance(collection, Rule_Collection)
+        assert len(builder) == len(collection) == 1600
+        assert [rule.labels[0] for rule in collection] == [f"{source}-{index}" for source in sources for index in range(200)]
+
+        reordered = builder.freeze(sources=["source-7"])
+        assert [rule.labels[0] for rule in reordered][:2] == ["source-7-0", "source-7-1"]
+        assert [rule.labels[0] for rule in reordered][200] == "source-0-0"
+
+    def test_duplicate_names_are_rejected_once(self):
+        """Test that exactly one of several threads adding the same rule name succeeds
+        """
+        builder = ConcurrentCollectionBuilder()
+
+        def add_duplicate(source: str) -> bool:
+            try:
+                builder.add_rule(_R.Move_To("Bank", ["alerts@bank.com"]), source)
+                return True
+            except KeyError:
+                return False
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(add_duplicate, [f"source-{number}" for number in range(32)]))
+
+        assert results.count(True) == 1
+        assert "MOVE TO: Bank" in builder
+        assert len(builder.freeze()) == 1
+
+        with pytest.raises(TypeError):
+            builder.add_rules("not a rule")
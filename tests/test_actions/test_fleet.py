@@ -0,0 +1,130 @@
+import json
+
+import pytest
+
+import gmail_rules.rules as _R
+from gmail_rules.actions.build_xmls import build_xml_text
+from gmail_rules.actions.fleet import SUMMARY_FILENAME, Account, build_fleet
+from gmail_rules.actions.rule_collection import Rule_Collection
+
+
+def make_fragments() -> dict[str, Rule_Collection]:
+    banking = Rule_Collection("Banking")
+    banking.add_rules([_R.Move_To("Bank", ["alerts@bank.com"]), _R.Copy_To("Cards", ["cards@bank.com"])])
+
+    news = Rule_Collection("News")
+    news.register_address_group("papers", ["daily@paper.com", "weekly@paper.com"])
+    news.add_rule(_R.Copy_To("News", [_R.AddressGroupRef("papers")]))
+
+    return {"banking": banking, "news": news}
+
+
+class TestBuildFleet:
+
+    def test_feeds_match_single_collection_builds(self, tmp_path):
+        """Test that each account's feed is the same as building its collection directly
+        """
+        fragments = make_fragments()
+        accounts = [
+            Account("alice", ["banking", "news"], [_R.Move_To("Family", ["mom@home.com"])], additional_comment="Alice"),
+            Account("bob", ["news"]),
+            Account("carol", [], [_R.Copy_To("Work", ["boss@work.com"])], filename="carol-filters.xml"),
+        ]
+
+        account_builds = build_fleet(accounts, fragments, tmp_path, max_workers=2, chunksize=1)
+        assert [account_build.filename for account_build in account_builds] == ["alice.xml", "bob.xml", "carol-filters.xml"]
+
+        for account, account_build in zip(accounts, account_builds):
+            expected_collection = Rule_Collection(account.name)
+            for fragment_name in account.fragments:
+                expected_collection.add_collection(fragments[fragment_name])
+            expected_collection.add_rules(account.rules)
+            expected_text = build_xml_text(expected_collection.build_final_string(account.additional_comment))
+
+            assert (tmp_path / account_build.filename).read_text(encoding="utf-8") == expected_text
+            assert account_build.bytes == len(expected_text.encode("utf-8"))
+            assert account_build.entries == expected_text.count("<entry>")
+
+        summary = json.loads((tmp_path / SUMMARY_FILENAME).read_text())
+        assert [account["name"] for account in summary["accounts"]] == ["alice", "bob", "carol"]
+        assert summary["total_bytes"] == sum(account_build.bytes for account_build in account_builds)
+
+    def test_overrides_replace_and_drop_fragment_rules(self, tmp_path):
+        """Test that an account can replace or drop fragment rules by name without changing other accounts
+        """
+        fragments = make_fragments()
+        bank = fragments["banking"]["MOVE TO: Bank"]
+        replacement = _R.Move_To("Bank", ["alerts@bank.com", "fraud@bank.com"])
+        accounts = [
+            Account("alice", ["banking", "news"], overrides={bank.name: replacement, "COPY TO: News": None}),
+            Account("bob", ["banking"]),
+        ]
+
+        alice_build, bob_build = build_fleet(accounts, fragments, tmp_path, max_workers=1)
+
+        expected_banking = Rule_Collection("Banking")
+        expected_banking.add_rules([replacement, fragments["banking"]["COPY TO: Cards"]])
+        expected_collection = Rule_Collection("alice")
+        expected_collection.add_collection(expected_banking)
+        expected_collection.add_collection(Rule_Collection("News"))
+        assert (tmp_path / alice_build.filename).read_text(encoding="utf-8") == build_xml_text(expected_collection.build_final_string())
+
+        expected_collection = Rule_Collection("bob")
+        expected_collection.add_collection(fragments["banking"])
+        assert (tmp_path / bob_build.filename).read_text(encoding="utf-8") == build_xml_text(expected_collection.build_final_string())
+
+    def test_account_address_groups(self, tmp_path):
+        """Test that account address groups reach the account's rules and replace fragment groups of the same name
+        """
+        fragments = make_fragments()
+        accounts = [
+            Account("alice", ["banking", "news"], [_R.Copy_To("Team", [_R.AddressGroupRef("team")])], address_groups={"team": ["amy@work.com"], "papers": ["local@paper.com"]}),
+            Account("bob", ["news"]),
+        ]
+
+        account_builds = build_fleet(accounts, fragments, tmp_path, max_workers=1)
+
+        for account, account_build in zip(accounts, account_builds):
+            expected_collection = Rule_Collection(account.name)
+            for group_name, addresses in account.address_groups.items():
+                expected_collection.register_address_group(group_name, addresses)
+            for fragment_name in account.fragments:
+                expected_collection.add_collection(fragments[fragment_name])
+            expected_collection.add_rules(account.rules)
+
+            assert (tmp_path / account_build.filename).read_text(encoding="utf-8") == build_xml_text(expected_collection.build_final_string())
+
+        alice_feed = (tmp_path / "alice.xml").read_text(encoding="utf-8")
+        assert "amy@work.com" in alice_feed and "local@paper.com" in alice_feed and "daily@paper.com" not in alice_feed
+        assert "daily@paper.com" in (tmp_path / "bob.xml").read_text(encoding="utf-8")
+
+    def test_name_collisions_rejected(self, tmp_path):
+        """Test that rules with the same name as a fragment rule are rejected unless that rule is overridden
+        """
+        fragments = make_fragments()
+        fragments["more banking"] = Rule_Collection("More Banking")
+        fragments["more banking"].add_rule(_R.Move_To("Bank", ["other@bank.com"]))
+
+        with pytest.raises(KeyError):
+            build_fleet([Account("alice", ["banking"], [_R.Move_To("Bank", ["mine@bank.com"])])], fragments, tmp_path)
+
+        with pytest.raises(KeyError):
+            build_fleet([Account("alice", ["banking", "more banking"])], fragments, tmp_path)
+
+        with pytest.raises(KeyError):
+            build_fleet([Account("alice", ["banking"], overrides={"MOVE TO: Missing": None})], fragments, tmp_path)
+
+        with pytest.raises(KeyError):
+            build_fleet([Account("alice", ["banking"], overrides={"COPY TO: Cards": _R.Move_To("Bank", ["mine@bank.com"])})], fragments, tmp_path)
+
+    def test_invalid_accounts(self, tmp_path):
+        """Test that unknown fragments, clashing filenames and paths are rejected
+        """
+        with pytest.raises(KeyError):
+            build_fleet([Account("alice", ["missing"])], make_fragments(), tmp_path)
+
+        with pytest.raises(ValueError):
+            build_fleet([Account("alice"), Account("bob", filename="alice.xml")], make_fragments(), tmp_path)
+
+        with pytest.raises(ValueError):
+            Account("alice", filename="../alice.xml")
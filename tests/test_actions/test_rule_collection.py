@@ -90,3 +90,110 @@ class TestRuleCollection:
 
         with pytest.raises(TypeError):
             self.collection_1.add_rules([new_rule_1, new_rule_2, not_a_rule])
+
+
+class TestNestedRuleCollection:
+
+    def test_child_collection_rendered_in_parent(self):
+        """Test that a child collection's rules appear in the parent's final string
+        """
+        shared = Rule_Collection("Shared")
+        shared.add_rule(_R.Copy_To("security", ["alerts@bank.com"]))
+
+        parent = Rule_Collection("Parent")
+        parent.add_rule(_R.Copy_To("family", ["mom@gmail.com"]))
+        parent.add_collection(shared)
+
+        flat = Rule_Collection("Flat")
+        flat.add_rule(_R.Copy_To("family", ["mom@gmail.com"]))
+        flat.add_rule(_R.Copy_To("security", ["alerts@bank.com"]))
+
+        assert parent.final_string == flat.final_string
+        assert [rule.name for rule in parent] == ["COPY TO: family", "COPY TO: security"]
+        assert len(parent) == 2
+        assert parent["COPY TO: security"] is shared["COPY TO: security"]
+
+    def test_child_collection_render_is_cached(self, monkeypatch):
+        """Test that a shared child collection is only rendered once for many parents
+        """
+        shared = Rule_Collection("Shared")
+        shared_rule = _R.Copy_To("billing", ["invoices@vendor.com"])
+        shared.add_rule(shared_rule)
+
+        calls = []
+        original_build_rule_parts = shared_rule.build_rule_parts
+        monkeypatch.setattr(shared_rule, "build_rule_parts", lambda: calls.append(1) or original_build_rule_parts())
+
+        parents = []
+        for index in range(5):
+            parent = Rule_Collection(f"User {index}")
+            parent.add_rules([_R.Copy_To(f"user_{index}", [f"user_{index}@gmail.com"]), shared])
+            parents.append(parent)
+
+        outputs = [parent.final_string for parent in parents]
+
+        assert len(calls) == 1
+        assert all("invoices@vendor.com" in output for output in outputs)
+
+    def test_child_collection_cache_invalidated(self):
+        """Test that modifying a rule in a child collection changes the parent's output
+        """
+        shared = Rule_Collection("Shared")
+        shared_rule = _R.Copy_To("hr", ["hr@company.com"])
+        shared.add_rule(shared_rule)
+
+        parent = Rule_Collection("Parent")
+        parent.add_collection(shared)
+        first_output = parent.final_string
+
+        shared_rule.add_attribute("subject", "Benefits")
+        assert parent.final_string != first_output
+        assert "Benefits" in parent.final_string
+
+        shared.add_rule(_R.Copy_To("payroll", ["payroll@company.com"]))
+        assert "payroll@company.com" in parent.final_string
+
+    def test_collection_cycle_raises(self):
+        """Ensure a ValueError is raised when collections would include each other
+        """
+        collection_a = Rule_Collection("A")
+        collection_b = Rule_Collection("B")
+        collection_a.add_collection(collection_b)
+
+        with pytest.raises(ValueError):
+            collection_b.add_collection(collection_a)
+        with pytest.raises(ValueError):
+            collection_a.add_collection(collection_a)
+
+    def test_duplicate_names_across_child_collections(self):
+        """Ensure rule names must be unique across a collection and its child collections
+        """
+        shared = Rule_Collection("Shared")
+        shared.add_rule(_R.Copy_To("security", ["alerts@bank.com"]))
+
+        parent = Rule_Collection("Parent")
+        parent.add_collection(shared)
+
+        with pytest.raises(KeyError):
+            parent.add_rule(_R.Copy_To("security", ["other@bank.com"]))
+
+        other = Rule_Collection("Other")
+        other.add_rule(_R.Copy_To("security", ["other@bank.com"]))
+        with pytest.raises(KeyError):
+            parent.add_collection(other)
+        assert len(parent) == 1
+
+    def test_direct_container_changes_invalidate_cache(self):
+        """Test that changing a rule's public containers directly changes the output
+        """
+        rule = _R.Copy_To("hr", ["hr@company.com"])
+        collection = Rule_Collection()
+        collection.add_rule(rule)
+        first_output = collection.final_string
+
+        rule.rule_attributes["subject"] = "hello"
+        assert "hello" in collection.final_string
+
+        rule.labels.append("payroll")
+        assert "payroll" in collection.final_string
+        assert collection.final_string != first_output
@@ -0,0 +1,196 @@
+import asyncio
+import socket
+
+import pytest
+
+import gmail_rules.rules as _R
+from gmail_rules.actions.rule_collection import Rule_Collection
+from gmail_rules.api import (
+    FakeGmailServer,
+    FilterDiff,
+    GmailFilterUploader,
+    TokenBucket,
+    diff_filters,
+    rule_to_filters,
+)
+
+
+def build_collection(number_of_rules: int) -> Rule_Collection:
+    collection = Rule_Collection()
+    for index in range(number_of_rules):
+        collection.add_rule(_R.Move_To(f"label_{index}", [f"sender_{index}@gmail.com"]))
+    return collection
+
+
+class TestRuleToFilters:
+
+    def test_move_to_rule_converted(self):
+        """Test converting a :obj:`Move_To` rule with two labels into Gmail API filters
+        """
+        rule = _R.Move_To(["apple", "banana"], ["fruit@gmail.com"])
+        rule.add_attribute("subject", "Sale")
+
+        filters = rule_to_filters(rule, label_ids={"apple": "Label_1"})
+
+        assert filters == [
+            {"criteria": {"from": "fruit@gmail.com", "subject": "Sale"}, "action": {"addLabelIds": ["Label_1"], "removeLabelIds": ["INBOX", "SPAM"]}},
+            {"criteria": {"from": "fruit@gmail.com", "subject": "Sale"}, "action": {"addLabelIds": ["banana"], "removeLabelIds": ["INBOX", "SPAM"]}},
+        ]
+
+    def test_diff_filters(self):
+        """Test that only changed filters are created or deleted
+        """
+        keep = {"criteria": {"from": "a@gmail.com"}, "action": {"addLabelIds": ["a"]}}
+        new = {"criteria": {"from": "b@gmail.com"}, "action": {"addLabelIds": ["b"]}}
+        existing = [{"id": "1", **keep}, {"id": "2", "criteria": {"from": "old@gmail.com"}, "action": {}}]
+
+        diff = diff_filters(existing, [keep, new])
+
+        assert diff.create == [new]
+        assert diff.delete == ["2"]
+
+
+class TestGmailFilterUploader:
+
+    def test_upload_collection(self):
+        """Test uploading a collection concurrently to the fake server
+        """
+        async def run():
+            async with FakeGmailServer(access_token="token") as server:
+                async with GmailFilterUploader("token", base_url=server.base_url, connections=4, batch_size=5, requests_per_second=None) as uploader:
+                    stats = await uploader.upload(build_collection(40))
+                return server, stats
+
+        server, stats = asyncio.run(run())
+
+        assert len(stats.created) == 40
+        assert not stats.failures
+        assert len(server.filters["me"]) == 40
+        assert server.connection_count <= 4
+        assert stats.operations_per_second > 0
+
+    def test_upload_retries_failures(self):
+        """Test that failing requests are retried with backoff
+        """
+        async def run():
+            async with FakeGmailServer(fail_first=3) as server:
+                async with GmailFilterUploader(base_url=server.base_url, batch_size=2, requests_per_second=None, backoff_base=0.01) as uploader:
+                    stats = await uploader.upload(build_collection(6))
+                return server, stats
+
+        server, stats = asyncio.run(run())
+
+        assert stats.retries >= 3
+        assert len(server.filters["me"]) == 6
+        assert not stats.failures
+
+    def test_upload_gives_up_after_max_retries(self):
+        """Test that operations are recorded as failures once retries are exhausted
+        """
+        async def run():
+            async with FakeGmailServer(fail_first=100) as server:
+                async with GmailFilterUploader(base_url=server.base_url, requests_per_second=None, max_retries=2, backoff_base=0.001) as uploader:
+                    return await uploader.upload(build_collection(2))
+
+        stats = asyncio.run(run())
+
+        assert len(stats.failures) == 2
+        assert not stats.created
+
+    def test_lost_responses_do_not_duplicate_filters(self):
+        """Test that creations whose response was lost are only re-sent when the server did not apply them
+        """
+        async def run():
+            async with FakeGmailServer(drop_responses=2) as server:
+                async with GmailFilterUploader(base_url=server.base_url, connections=1, batch_size=5, requests_per_second=None, backoff_base=0.001) as uploader:
+                    stats = await uploader.upload(build_collection(10))
+                return server, stats
+
+        server, stats = asyncio.run(run())
+
+        assert not stats.failures
+        assert len(server.filters["me"]) == 10
+        assert sorted(stats.created) == sorted(server.filters["me"])
+
+    def test_connect_failures_keep_connection_limit(self):
+        """Ensure failed connects release the connection limit exactly once
+        """
+        async def run():
+            uploader = GmailFilterUploader(base_url="http://127.0.0.1:9", connections=2, timeout=1.0)
+            uploader._ensure_started()
+            for _ in range(3):
+                with pytest.raises(OSError):
+                    await uploader.list_filters()
+            return uploader._pool._semaphore._value
+
+        assert asyncio.run(run()) == 2
+
+    def test_unresponsive_server_times_out(self):
+        """Test that a server that never answers does not block the upload forever
+        """
+        async def run():
+            async with FakeGmailServer(latency=5.0) as server:
+                async with GmailFilterUploader(base_url=server.base_url, requests_per_second=None, max_retries=1, backoff_base=0.001, timeout=0.05) as uploader:
+                    return await uploader.upload(build_collection(2))
+
+        stats = asyncio.run(run())
+
+        assert len(stats.failures) == 2
+        assert not stats.created
+
+    def test_uploader_reusable_after_close(self):
+        """Test that a closed uploader can be used again from a new event loop
+        """
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        uploader = GmailFilterUploader(base_url=f"http://127.0.0.1:{port}", requests_per_second=5.0)
+
+        async def run():
+            async with FakeGmailServer(port=port):
+                async with uploader:
+                    return await uploader.upload(build_collection(2))
+
+        for _ in range(2):
+            stats = asyncio.run(run())
+            assert len(stats.created) == 2
+            assert not stats.failures
+            assert uploader._bucket is None
+
+    def test_sync_deletes_and_creates(self):
+        """Test that syncing only creates new filters and deletes stale ones
+        """
+        async def run():
+            async with FakeGmailServer() as server:
+                async with GmailFilterUploader(base_url=server.base_url, requests_per_second=None) as uploader:
+                    await uploader.upload(build_collection(3))
+                    await uploader.upload(FilterDiff(create=[{"criteria": {"from": "stale@gmail.com"}, "action": {}}]))
+
+                    stats = await uploader.sync(build_collection(4))
+                    remaining = await uploader.list_filters()
+                return stats, remaining
+
+        stats, remaining = asyncio.run(run())
+
+        assert len(stats.created) == 1
+        assert stats.deleted == 1
+        assert len(remaining) == 4
+
+    def test_token_bucket_limits_rate(self):
+        """Test that the token bucket spaces out requests beyond the burst
+        """
+        async def run():
+            bucket = TokenBucket(rate=100, capacity=1)
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            for _ in range(6):
+                await bucket.acquire()
+            return loop.time() - start
+
+        assert asyncio.run(run()) >= 0.04
+
+    def test_upload_rejects_invalid_source(self):
+        """Ensure a TypeError is raised for inputs that are not collections or diffs
+        """
+        with pytest.raises(TypeError):
+            asyncio.run(GmailFilterUploader().upload(["not", "a", "collection"]))
@@ -0,0 +1,215 @@
+import imaplib
+
+import pytest
+
+import gmail_rules.rules as _R
+from gmail_rules.actions.rule_collection import Rule_Collection
+from gmail_rules.imap import PROCESSED_KEYWORD, FakeImapServer, ImapConnectionPool, ImapRunner
+
+
+def build_message(sender: str, subject: str, body: str = "Hello") -> bytes:
+    return f"From: {sender}\r\nTo: me@example.com\r\nSubject: {subject}\r\nMessage-ID: <{subject}@example.com>\r\n\r\n{body}\r\n".encode()
+
+
+def build_server() -> FakeImapServer:
+    server = FakeImapServer()
+    server.add_message("INBOX", build_message("Bank <alerts@bank.com>", "Statement"))
+    server.add_message("INBOX", build_message("friend@gmail.com", "Dinner"))
+    server.add_message("INBOX", build_message("shop@store.com", "Your receipt"))
+    server.add_message("Old", build_message("alerts@bank.com", "Old statement"))
+    return server
+
+
+class TestImapRunner:
+
+    def test_run_applies_labels_and_archives(self):
+        """Test that matching messages are copied to their labels and archived messages removed
+        """
+        collection = Rule_Collection()
+        collection.add_rule(_R.Move_To("Bank", ["alerts@bank.com"]))
+        receipts = _R.Copy_To("Receipts")
+        receipts.add_attribute("subject", "receipt")
+        collection.add_rule(receipts)
+
+        with build_server() as server, ImapConnectionPool(server.host, server.username, server.password, port=server.port, use_ssl=False, size=2) as pool:
+            stats = ImapRunner(collection, pool, batch_size=2).run(["INBOX", "Old"])
+
+            assert stats.messages == 4
+            assert stats.matched == 3
+            assert stats.labels == {"Bank": 2, "Receipts": 1}
+            assert stats.archived == 2
+            assert stats.folders == {"INBOX": 3, "Old": 1}
+            assert stats.messages_per_second > 0
+
+            assert len(server.messages("INBOX")) == 2
+            assert server.messages("Old") == []
+            assert len(server.messages("Bank")) == 2
+            assert len(server.messages("Receipts")) == 1
+            assert server.connection_count <= 2
+
+    def test_only_needed_sections_fetched(self):
+        """Test that message bodies are only fetched when a rule searches the whole message
+        """
+        header_only = ImapRunner([_R.Copy_To("Bank", ["alerts@bank.com"])], pool=None)
+        assert header_only.fetch_body is False
+        assert header_only.header_names == ("FROM", "MESSAGE-ID")
+
+        words_rule = _R.Copy_To("Travel")
+        words_rule.add_attribute("hasTheWord", "boarding pass")
+        with_body = ImapRunner([words_rule], pool=None)
+        assert with_body.fetch_body is True
+
+    def test_dry_run_does_not_change_mailboxes(self):
+        """Test that a dry run evaluates messages without copying or removing them
+        """
+        with build_server() as server, ImapConnectionPool(server.host, server.username, server.password, port=server.port, use_ssl=False) as pool:
+            runner = ImapRunner([_R.Move_To("Bank", ["alerts@bank.com"])], pool, dry_run=True)
+            classifications = runner.classify_folder("INBOX")
+            stats = runner.run()
+
+            assert [classification.labels for classification in classifications.values()] == [["Bank"], [], []]
+            assert stats.matched == 1
+            assert len(server.messages("INBOX")) == 3
+            assert "Bank" not in server.mailboxes
+
+    def test_repeated_runs_do_not_copy_messages_again(self):
+        """Test that messages handled by an earlier run are skipped by later runs
+        """
+        receipts = _R.Copy_To("Receipts")
+        receipts.add_attribute("subject", "receipt")
+
+        with build_server() as server, ImapConnectionPool(server.host, server.username, server.password, port=server.port, use_ssl=False) as pool:
+            runner = ImapRunner([receipts], pool)
+            first_stats = runner.run()
+            later_stats = [runner.run() for _ in range(2)]
+
+            assert first_stats.messages == 3
+            assert first_stats.labels == {"Receipts": 1}
+            assert all(stats.messages == 0 and stats.labels == {} for stats in later_stats)
+            assert len(server.messages("Receipts")) == 1
+            assert all(PROCESSED_KEYWORD in flags for flags in server.flags("INBOX"))
+
+            server.add_message("INBOX", build_message("shop@store.com", "Another receipt"))
+            stats = runner.run()
+
+            assert stats.messages == 1
+            assert len(server.messages("Receipts")) == 2
+
+    def test_archive_with_move_without_uidplus(self):
+        """Test that archived messages are moved into their label's folder when the server lacks UIDPLUS but supports MOVE
+        """
+        server = FakeImapServer(capabilities=("IMAP4rev1", "MOVE"))
+        server.add_message("INBOX", build_message("alerts@bank.com", "Statement"))
+        server.add_message("INBOX", build_message("friend@gmail.com", "Dinner"), flags={"\\Deleted"})
+
+        with server, ImapConnectionPool(server.host, server.username, server.password, port=server.port, use_ssl=False) as pool:
+            stats = ImapRunner([_R.Move_To("Bank", ["alerts@bank.com"])], pool).run()
+
+            assert stats.archived == 1
+            assert len(server.messages("INBOX")) == 1
+            assert len(server.messages("Bank")) == 1
+            assert PROCESSED_KEYWORD in server.flags("Bank")[0]
+
+    def test_archive_without_uidplus_or_move_only_flags(self):
+        """Test that archived messages are only flagged, never expunged, when the server supports neither UIDPLUS nor MOVE
+        """
+        server = FakeImapServer(capabilities=("IMAP4rev1",))
+        server.add_message("INBOX", build_message("alerts@bank.com", "Statement"))
+        server.add_message("INBOX", build_message("friend@gmail.com", "Dinner"), flags={"\\Deleted"})
+
+        with server, ImapConnectionPool(server.host, server.username, server.password, port=server.port, use_ssl=False) as pool:
+            stats = ImapRunner([_R.Move_To("Bank", ["alerts@bank.com"])], pool).run()
+
+            assert stats.archived == 0
+            assert stats.flagged == 1
+            assert len(server.messages("INBOX")) == 2
+            assert len(server.messages("Bank")) == 1
+
+    def test_other_deleted_messages_are_kept(self):
+        """Ensure messages the user flagged `\\Deleted` are not expunged when archiving with UIDPLUS
+        """
+        with build_server() as server, ImapConnectionPool(server.host, server.username, server.password, port=server.port, use_ssl=False) as pool:
+            server.add_message("INBOX", build_message("friend@gmail.com", "Trash"), flags={"\\Deleted"})
+            stats = ImapRunner([_R.Move_To("Bank", ["alerts@bank.com"])], pool).run()
+
+            assert stats.archived == 1
+            assert len(server.messages("INBOX")) == 3
+
+    def test_uid_after_sections(self):
+        """Test that sections are assigned to the right messages when the server sends UID after them
+        """
+        server = FakeImapServer(uid_last=True)
+        server.add_message("INBOX", build_message("friend@gmail.com", "Dinner"))
+        server.add_message("INBOX", build_message("alerts@bank.com", "Statement"))
+        server.add_message("INBOX", build_message("friend@gmail.com", "Lunch"))
+
+        with server, ImapConnectionPool(server.host, server.username, server.password, port=server.port, use_ssl=False) as pool:
+            classifications = ImapRunner([_R.Copy_To("Bank", ["alerts@bank.com"])], pool).classify_folder("INBOX")
+
+            assert {uid: classification.labels for uid, classification in classifications.items()} == {1: [], 2: ["Bank"], 3: []}
+
+    def test_only_text_parts_fetched_and_decoded(self):
+        """Test that bodies are decoded part by part and attachments are never fetched
+        """
+        attachment = b"QUJD" * 5000
+        server = FakeImapServer()
+        server.add_message("INBOX", (
+            b"From: shop@store.com\r\n"
+            b"Subject: Order\r\n"
+            b"Content-Type: multipart/mixed; boundary=\"b\"\r\n"
+            b"\r\n"
+            b"--b\r\n"
+            b"Content-Type: text/plain; charset=iso-8859-1\r\n"
+            b"Content-Transfer-Encoding: base64\r\n"
+            b"\r\n"
+            b"WW91ciBy6WNlcHQgaXMgcmVhZHk=\r\n"
+            b"--b\r\n"
+            b"Content-Type: application/pdf\r\n"
+            b"Content-Transfer-Encoding: base64\r\n"
+            b"Content-Disposition: attachment; filename=\"receipt.pdf\"\r\n"
+            b"\r\n" + attachment + b"\r\n"
+            b"--b--\r\n"
+        ))
+        server.add_message("INBOX", build_message("friend@gmail.com", "Dinner", "Your récept is in the mail"))
+
+        words_rule = _R.Copy_To("Receipts")
+        words_rule.add_attribute("hasTheWord", "récept")
+
+        with server, ImapConnectionPool(server.host, server.username, server.password, port=server.port, use_ssl=False) as pool:
+            classifications = ImapRunner([words_rule], pool).classify_folder("INBOX")
+
+            assert {uid: classification.labels for uid, classification in classifications.items()} == {1: ["Receipts"], 2: ["Receipts"]}
+            assert server.fetched_bytes < len(attachment)
+
+    def test_failed_copy_leaves_messages_unprocessed(self, monkeypatch):
+        """Test that messages are unmarked again when the connection fails during COPY
+        """
+        original_uid = imaplib.IMAP4.uid
+        failures = {"COPY": OSError("connection reset"), "-FLAGS.SILENT": imaplib.IMAP4.abort("socket error")}
+
+        def failing_uid(connection, command, *arguments):
+            failure = failures.pop(command if command == "COPY" else arguments[1] if len(arguments) > 1 else None, None)
+            if failure is not None:
+                raise failure
+            return original_uid(connection, command, *arguments)
+
+        with build_server() as server, ImapConnectionPool(server.host, server.username, server.password, port=server.port, use_ssl=False) as pool:
+            monkeypatch.setattr(imaplib.IMAP4, "uid", failing_uid)
+            with pytest.raises(OSError):
+                ImapRunner([_R.Copy_To("Bank", ["alerts@bank.com"])], pool).run()
+
+            assert not failures
+            assert all(PROCESSED_KEYWORD not in flags for flags in server.flags("INBOX"))
+
+    def test_nested_labels_use_server_delimiter(self):
+        """Test that nested labels are created with the hierarchy delimiter reported by LIST
+        """
+        server = FakeImapServer(delimiter=".")
+        server.add_message("INBOX", build_message("alerts@bank.com", "Statement"))
+
+        with server, ImapConnectionPool(server.host, server.username, server.password, port=server.port, use_ssl=False) as pool:
+            stats = ImapRunner([_R.Copy_To("Finance/Bank", ["alerts@bank.com"])], pool).run()
+
+            assert stats.labels == {"Finance/Bank": 1}
+            assert len(server.messages("Finance.Bank")) == 1
+            assert "Finance/Bank" not in server.mailboxes
@@ -0,0 +1,64 @@
+import json
+import pickle
+
+import gmail_rules.rules as _R
+from gmail_rules.actions.rule_collection import Rule_Collection
+from gmail_rules.matching import Matcher, Message, RuleCoverage
+
+
+def make_collection() -> Rule_Collection:
+    collection = Rule_Collection()
+    collection.add_rules([
+        _R.Move_To("Bank", ["alerts@bank.com"]),
+        _R.Copy_To(["Bank", "Statements"], ["statements@bank.com"]),
+        _R.Copy_To("Unused", ["nobody@nowhere.com"]),
+    ])
+    return collection
+
+
+class TestRuleCoverage:
+
+    def test_counts_from_matcher(self):
+        """Test that evaluating messages counts rule and label hits and samples message IDs
+        """
+        coverage = RuleCoverage(samples_per_rule=3, seed=1)
+        matcher = Matcher(make_collection(), coverage=coverage)
+
+        for index in range(10):
+            matcher.classify(Message(sender="alerts@bank.com", message_id=f"<alert-{index}>"))
+        matcher.classify(Message(sender="statements@bank.com", message_id="<statement>"))
+        matcher.classify(Message(sender="friend@gmail.com"))
+
+        assert coverage.messages == 12
+        assert coverage.rule_hits == {"MOVE TO: Bank": 10, "COPY TO: Bank | Statements": 1, "COPY TO: Unused": 0}
+        assert coverage.label_hits == {"Bank": 11, "Statements": 1, "Unused": 0}
+        assert len(coverage.samples["MOVE TO: Bank"]) == 3
+        assert set(coverage.samples["MOVE TO: Bank"]) <= {f"<alert-{index}>" for index in range(10)}
+        assert coverage.unused_rules() == ["COPY TO: Unused"]
+        assert coverage.unused_rules(make_collection()) == ["COPY TO: Unused"]
+
+    def test_merge_and_export(self):
+        """Test merging counters from several workers and exporting them
+        """
+        worker_counters = []
+        for worker in range(3):
+            coverage = RuleCoverage(samples_per_rule=4, seed=worker)
+            matcher = Matcher(make_collection(), coverage=coverage)
+            for index in range(5):
+                matcher.match(Message(sender="alerts@bank.com", message_id=f"<{worker}-{index}>"))
+            worker_counters.append(pickle.loads(pickle.dumps(coverage)))
+
+        merged = RuleCoverage(samples_per_rule=4, seed=0)
+        for coverage in worker_counters:
+            merged.merge(RuleCoverage.from_dict(json.loads(coverage.to_json())))
+
+        assert merged.messages == 15
+        assert merged.rule_hits["MOVE TO: Bank"] == 15
+        assert merged.unused_rules() == ["COPY TO: Bank | Statements", "COPY TO: Unused"]
+        assert len(merged.samples["MOVE TO: Bank"]) == 4
+        assert len(set(merged.samples["MOVE TO: Bank"])) == 4
+
+        prometheus_text = merged.to_prometheus()
+        assert 'gmail_rules_rule_hits_total{rule="MOVE TO: Bank"} 15' in prometheus_text
+        assert 'gmail_rules_label_hits_total{label="Unused"} 0' in prometheus_text
+        assert "gmail_rules_messages_total 15" in prometheus_text
@@ -0,0 +1,164 @@
+import threading
+import time
+
+import pytest
+
+from gmail_rules.matching import ClassificationDaemon, DaemonClient, LatencyHistogram
+
+
+RULE_FILE = '''
+import gmail_rules.rules as _R
+from gmail_rules.actions.rule_collection import Rule_Collection
+
+collection = Rule_Collection()
+collection.add_rule(_R.Move_To("{label}", ["alerts@bank.com"]))
+'''
+
+
+def write_rules(rule_path, label: str) -> None:
+    rule_path.write_text(RULE_FILE.format(label=label))
+
+
+class TestClassificationDaemon:
+
+    def test_classify_and_hot_reload(self, tmp_path):
+        """Test classifying over the socket and swapping in changed rule files
+        """
+        rule_path = tmp_path / "rules.py"
+        write_rules(rule_path, "Bank")
+
+        with ClassificationDaemon([rule_path], tmp_path / "daemon.sock", poll_interval=0.05) as daemon:
+            with DaemonClient(daemon.socket_path) as client:
+                results = client.classify([
+                    {"sender": "Bank <alerts@bank.com>", "subject": "Statement"},
+                    {"raw": "From: friend@gmail.com\r\nSubject: Hi\r\n\r\nHello"},
+                ])
+                assert results == [
+                    {"rules": ["MOVE TO: Bank"], "labels": ["Bank"], "archive": True, "never_spam": True},
+                    {"rules": [], "labels": [], "archive": False, "never_spam": False},
+                ]
+
+                write_rules(rule_path, "Finance")
+                deadline = time.monotonic() + 5
+                while daemon.generation == 1 and time.monotonic() < deadline:
+                    time.sleep(0.02)
+
+                assert daemon.generation == 2
+                assert client.classify([{"sender": "alerts@bank.com"}])[0]["labels"] == ["Finance"]
+
+                stats = client.stats()
+                assert stats["message_latency"]["count"] == 3
+                assert stats["last_error"] is None
+
+    def test_failed_reload_keeps_previous_rules(self, tmp_path):
+        """Test that a broken rule file does not replace the working matcher
+        """
+        rule_path = tmp_path / "rules.py"
+        write_rules(rule_path, "Bank")
+
+        with ClassificationDaemon([rule_path], tmp_path / "daemon.sock", poll_interval=60) as daemon:
+            rule_path.write_text("collection = 'not a collection'")
+
+            with DaemonClient(daemon.socket_path) as client:
+                response = client.request({"op": "reload"})
+                assert response["reloaded"] is False
+                assert "TypeError" in response["last_error"]
+                assert client.classify([{"sender": "alerts@bank.com"}])[0]["labels"] == ["Bank"]
+                assert "error" in client.request({"op": "unknown"})
+
+    def test_start_fails_when_path_is_not_a_socket(self, tmp_path):
+        """Test that an existing regular file at the socket path is kept and the error reaches start()
+        """
+        rule_path = tmp_path / "rules.py"
+        write_rules(rule_path, "Bank")
+        socket_path = tmp_path / "daemon.sock"
+        socket_path.write_text("keep me")
+
+        daemon = ClassificationDaemon([rule_path], socket_path, poll_interval=60)
+        with pytest.raises(FileExistsError):
+            daemon.start()
+
+        assert socket_path.read_text() == "keep me"
+        daemon.stop()
+
+    def test_live_socket_is_not_taken_over(self, tmp_path):
+        """Test that a second daemon on the same path fails instead of replacing the running daemon's socket
+        """
+        rule_path = tmp_path / "rules.py"
+        write_rules(rule_path, "Bank")
+        socket_path = tmp_path / "daemon.sock"
+
+        with ClassificationDaemon([rule_path], socket_path, poll_interval=60):
+            second_daemon = ClassificationDaemon([rule_path], socket_path, poll_interval=60)
+            with pytest.raises(FileExistsError):
+                second_daemon.start()
+            second_daemon.stop()
+
+            with DaemonClient(socket_path) as client:
+                assert client.classify([{"sender": "alerts@bank.com"}])[0]["labels"] == ["Bank"]
+
+    def test_large_and_oversized_requests(self, tmp_path):
+        """Test that messages over 64 KiB are classified and requests over the limit get an error response
+        """
+        rule_path = tmp_path / "rules.py"
+        write_rules(rule_path, "Bank")
+        raw_message = "From: alerts@bank.com\r\nSubject: Statement\r\n\r\n" + "x" * 70_000
+
+        with ClassificationDaemon([rule_path], tmp_path / "daemon.sock", poll_interval=60, max_request_bytes=100_000) as daemon:
+            with DaemonClient(daemon.socket_path) as client:
+                assert client.classify([{"raw": raw_message}])[0]["labels"] == ["Bank"]
+
+            with DaemonClient(daemon.socket_path) as client:
+                response = client.request({"messages": [{"raw": raw_message}, {"raw": raw_message}]})
+                assert "longer than 100000 bytes" in response["error"]
+
+    def test_reload_does_not_block_requests(self, tmp_path):
+        """Test that reload requests run off the event loop and one at a time
+        """
+        rule_path = tmp_path / "rules.py"
+        write_rules(rule_path, "Bank")
+
+        with ClassificationDaemon([rule_path], tmp_path / "daemon.sock", poll_interval=60) as daemon:
+            rule_path.write_text("import time\ntime.sleep(0.3)\n" + RULE_FILE.format(label="Finance"))
+
+            responses = []
+            def request_reload():
+                with DaemonClient(daemon.socket_path) as client:
+                    responses.append(client.request({"op": "reload"}))
+
+            reload_threads = [threading.Thread(target=request_reload) for _ in range(2)]
+            reload_start = time.perf_counter()
+            for reload_thread in reload_threads:
+                reload_thread.start()
+            time.sleep(0.05)
+
+            with DaemonClient(daemon.socket_path) as client:
+                start_time = time.perf_counter()
+                stats = client.stats()
+                assert time.perf_counter() - start_time < 0.2
+                assert stats["generation"] == 1
+
+            for reload_thread in reload_threads:
+                reload_thread.join()
+
+            ## EACH RELOAD SLEEPS 0.3 SECONDS, SO SERIALIZED RELOADS TAKE AT LEAST 0.6
+            assert time.perf_counter() - reload_start >= 0.55
+
+            assert sorted(response["generation"] for response in responses) == [2, 3]
+            assert daemon.generation == 3
+
+
+class TestLatencyHistogram:
+
+    def test_percentiles(self):
+        """Test recording samples and reading percentiles
+        """
+        histogram = LatencyHistogram()
+        for _ in range(99):
+            histogram.record(0.000_010)
+        histogram.record(0.5)
+
+        assert histogram.count == 100
+        assert histogram.percentile(50) == 0.000_016
+        assert histogram.percentile(100) == 0.5
+        assert histogram.to_dict()["buckets_us"] == {"16": 99, "524288": 1}
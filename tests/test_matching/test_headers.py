@@ -0,0 +1,109 @@
+from email import message_from_bytes, policy
+
+import gmail_rules.rules as _R
+from gmail_rules.matching import Matcher, decode_body, needed_headers, needs_body, parse_message, scan_headers
+
+
+RAW_MESSAGE = (
+    b"Received: from mail.example.com\r\n"
+    b"\tby mx.example.com; Mon, 1 Jan 2024 00:00:00 +0000\r\n"
+    b"From: =?utf-8?q?J=C3=BCrgen?= <jurgen@example.com>\r\n"
+    b"To: me@example.com,\r\n"
+    b" you@example.com\r\n"
+    b"Subject: Your =?utf-8?b?UmVjZWlwdA==?= is ready\r\n"
+    b"Message-ID: <abc@example.com>\r\n"
+    b"\r\n"
+    b"Subject: not a header\r\n"
+    b"Body text\r\n"
+)
+
+
+class TestScanHeaders:
+
+    def test_matches_stdlib_parser(self):
+        """Test that unfolded and decoded values match the standard library's parser
+        """
+        fields = scan_headers(RAW_MESSAGE, ["from", "to", "subject"])
+        parsed = message_from_bytes(RAW_MESSAGE, policy=policy.default)
+
+        assert fields == {
+            "from": str(parsed["From"]),
+            "to": str(parsed["To"]),
+            "subject": str(parsed["Subject"]),
+        }
+        assert fields["subject"] == "Your Receipt is ready"
+
+    def test_memoryview_and_body_boundary(self):
+        """Test scanning a memoryview and that headers after the blank line are ignored
+        """
+        fields = scan_headers(memoryview(b"X-Padding: " + b"a" * 10_000 + b"\r\n" + RAW_MESSAGE))
+
+        assert fields["message-id"] == "<abc@example.com>"
+        assert fields["subject"] == "Your Receipt is ready"
+        assert "not a header" not in fields.values()
+
+    def test_parse_message_for_collection(self):
+        """Test building messages with only the headers a collection needs
+        """
+        rule = _R.Copy_To("Receipts")
+        rule.add_attribute("subject", "receipt")
+
+        assert needed_headers([rule]) == {"subject"}
+        assert not needs_body([rule])
+
+        message = parse_message(RAW_MESSAGE, needed_headers([rule]), include_body=False)
+
+        assert message.sender == ""
+        assert message.body == ""
+        assert message.message_id == "<abc@example.com>"
+        assert Matcher([rule]).classify(message).labels == ["Receipts"]
+
+        assert parse_message(memoryview(RAW_MESSAGE)).body == "Subject: not a header\r\nBody text\r\n"
+
+    def test_message_without_body(self):
+        """Test scanning a header that is not followed by a blank line
+        """
+        assert scan_headers(b"From: a@example.com\nSubject: Hi") == {"from": "a@example.com", "subject": "Hi"}
+
+    def test_parse_message_decodes_base64_body(self):
+        """Test that base64 bodies are decoded with their charset before rules search them
+        """
+        raw = (
+            b"From: shop@example.com\r\n"
+            b"Content-Type: text/plain; charset=\"iso-8859-1\"\r\n"
+            b"Content-Transfer-Encoding: base64\r\n"
+            b"\r\n"
+            b"WW91ciBy6WNlcHQgaXMgcmVhZHk=\r\n"
+        )
+        rule = _R.Copy_To("Receipts")
+        rule.add_attribute("hasTheWord", "récept")
+
+        message = parse_message(raw, needed_headers([rule]))
+
+        assert message.body == "Your récept is ready"
+        assert Matcher([rule]).classify(message).labels == ["Receipts"]
+
+    def test_decode_body_matches_stdlib_parser(self):
+        """Test that quoted-printable and multipart bodies decode to the text of their parts
+        """
+        assert decode_body(b"caf=C3=A9 =\r\nmenu", "text/plain; charset=utf-8", "quoted-printable") == "café menu"
+        assert decode_body(b"\x89PNG", "image/png", "binary") == ""
+
+        raw = (
+            b"Content-Type: multipart/mixed; boundary=\"b\"\r\n"
+            b"\r\n"
+            b"--b\r\n"
+            b"Content-Type: text/plain; charset=utf-8\r\n"
+            b"Content-Transfer-Encoding: base64\r\n"
+            b"\r\n"
+            b"SW52b2ljZSBhdHRhY2hlZA==\r\n"
+            b"--b\r\n"
+            b"Content-Type: text/plain\r\n"
+            b"Content-Disposition: attachment; filename=\"notes.txt\"\r\n"
+            b"\r\n"
+            b"attachment text\r\n"
+            b"--b--\r\n"
+        )
+        parsed = message_from_bytes(raw, policy=policy.default)
+
+        assert parse_message(raw).body == parsed.get_body(("plain",)).get_content() == "Invoice attached"
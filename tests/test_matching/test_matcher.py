@@ -0,0 +1,117 @@
+import gmail_rules.rules as _R
+from gmail_rules.actions.rule_collection import Rule_Collection
+from gmail_rules.matching import AhoCorasick, Matcher, Message, parse_criteria
+
+
+class TestAhoCorasick:
+
+    def test_finds_all_patterns_in_one_pass(self):
+        """Test that overlapping patterns are all found
+        """
+        automaton = AhoCorasick(["he", "she", "his", "hers"])
+        matches = sorted(automaton.iter_matches("ushers"))
+
+        assert matches == []
+        assert automaton.match_bits("she said hers is his") == 0b1110
+
+    def test_word_boundaries(self):
+        """Test that word patterns only match whole words but address fragments match anywhere
+        """
+        automaton = AhoCorasick(["sale", "@gmail.com"])
+
+        assert automaton.match_bits("Wholesale prices") == 0
+        assert automaton.match_bits("SALE today") == 0b01
+        assert automaton.match_bits("someone@gmail.com") == 0b10
+
+
+class TestParseCriteria:
+
+    def test_parse_or_negation_and_phrases(self):
+        """Test parsing a search string with every supported construct
+        """
+        assert parse_criteria('invoice -draft OR "Payment Due"') == (
+            "or", (("and", (("term", "invoice"), ("not", ("term", "draft")))), ("term", "payment due"))
+        )
+        assert parse_criteria("{alpha beta}") == ("or", (("term", "alpha"), ("term", "beta")))
+
+
+class TestMatcher:
+
+    def build_collection(self) -> Rule_Collection:
+        collection = Rule_Collection()
+
+        bank = _R.Move_To("bank", ["alerts@bank.com", "@statements.bank.com"])
+        collection.add_rule(bank)
+
+        invoices = _R.Copy_To("invoices")
+        invoices.add_attribute("subject", "invoice OR receipt")
+        invoices.add_attribute("doesNotHaveTheWord", "draft")
+        collection.add_rule(invoices)
+
+        travel = _R.Copy_To(["travel", "important"])
+        travel.add_attribute("hasTheWord", '"boarding pass" -cancelled')
+        collection.add_rule(travel)
+
+        return collection
+
+    def test_match_from_criteria(self):
+        """Test matching a rule on its sender addresses
+        """
+        matcher = Matcher.from_collection(self.build_collection())
+
+        classification = matcher.classify(Message(sender="Bank <no-reply@statements.bank.com>", subject="Statement"))
+
+        assert classification.rules == ["MOVE TO: bank"]
+        assert classification.labels == ["bank"]
+        assert classification.archive and classification.never_spam
+
+    def test_match_subject_and_negated_words(self):
+        """Test that `doesNotHaveTheWord` excludes messages containing the word
+        """
+        matcher = Matcher(self.build_collection())
+
+        assert [rule.name for rule in matcher.match(Message(subject="Your receipt", body="Thanks"))] == ["COPY TO: invoices"]
+        assert matcher.match(Message(subject="Invoice", body="This is a draft")) == []
+
+    def test_does_not_have_the_word_excludes_any_word(self):
+        """Test that every word of `doesNotHaveTheWord` excludes a message on its own, like Gmail's `-{a b}`
+        """
+        matcher = Matcher([_R.Copy_To("newsletters", rule_defaults={"subject": "Weekly", "doesNotHaveTheWord": "unsubscribe advert"})])
+
+        assert len(matcher.match(Message(subject="Weekly", body="News of the week"))) == 1
+        assert matcher.match(Message(subject="Weekly", body="Click to unsubscribe")) == []
+        assert matcher.match(Message(subject="Weekly", body="unsubscribe from this advert")) == []
+
+    def test_match_phrase_with_negation(self):
+        """Test phrases and negated terms in `hasTheWord`
+        """
+        matcher = Matcher(self.build_collection())
+
+        classification = matcher.classify(Message(subject="Trip", body="Your Boarding Pass is attached"))
+        assert classification.labels == ["travel", "important"]
+        assert not classification.archive
+
+        assert matcher.match(Message(body="boarding pass cancelled")) == []
+
+    def test_rule_without_criteria_never_matches(self):
+        """Test that a rule without any criteria does not match every message
+        """
+        matcher = Matcher([_R.Copy_To("everything")])
+
+        assert matcher.match(Message(subject="Anything")) == []
+
+    def test_phrases_ignore_whitespace_differences(self):
+        """Test that quoted phrases match text with repeated whitespace or folded lines
+        """
+        matcher = Matcher([_R.Copy_To("greeting", rule_defaults={"subject": '"hello world"', "hasTheWord": '"boarding pass"'})])
+
+        assert len(matcher.match(Message(subject="Hello  world", body="Your boarding\r\n pass"))) == 1
+        assert matcher.match(Message(subject="Hello", body="world boarding pass")) == []
+
+    def test_only_negations_in_has_the_word(self):
+        """Test that a `hasTheWord` made only of negations matches messages without those words
+        """
+        matcher = Matcher([_R.Copy_To("not spam", rule_defaults={"subject": "Report", "hasTheWord": "-spam -lottery"})])
+
+        assert len(matcher.match(Message(subject="Report", body="Quarterly numbers"))) == 1
+        assert matcher.match(Message(subject="Report", body="You won the lottery")) == []
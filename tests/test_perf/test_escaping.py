@@ -0,0 +1,19 @@
+from gmail_rules.perf import benchmark_escaping
+from gmail_rules.perf.__main__ import main
+from gmail_rules.utils import helpers as _hp
+
+
+class TestBenchmarkEscaping:
+
+    def test_benchmark_escaping(self, capsys):
+        """Test that the benchmark measures both builds and restores escaping afterwards
+        """
+        escape_xml = _hp.escape_xml
+        result = benchmark_escaping(entries=200, repeat=1)
+
+        assert result["entries"] == 200
+        assert result["escaped"] > 0 and result["unescaped"] > 0
+        assert _hp.escape_xml is escape_xml
+
+        assert main(["escaping", "--entries", "50", "--repeat", "1"]) == 0
+        assert "50 entries" in capsys.readouterr().out
@@ -0,0 +1,171 @@
+import gmail_rules.rules as _R
+from gmail_rules.actions.rule_collection import Rule_Collection
+from gmail_rules.perf import BuildMeasurement, PerfHistory, compare_samples, measure_build
+from gmail_rules.perf import history
+from gmail_rules.perf.__main__ import main
+
+
+RULE_FILE = '''
+import gmail_rules.rules as _R
+from gmail_rules.actions.rule_collection import Rule_Collection
+
+collection = Rule_Collection()
+collection.add_rule(_R.Move_To("Bank", ["alerts@bank.com"]))
+collection.add_rule(_R.Copy_To(["News", "Reading"], ["news@paper.com"]))
+'''
+
+
+def make_measurement(version: str, wall_time: float, rules: int = 2) -> BuildMeasurement:
+    return BuildMeasurement(label="test", version=version, rules=rules, entries=3, bytes=1000, wall_time=wall_time)
+
+
+class TestMeasureBuild:
+
+    def test_measure_build(self):
+        """Test that measuring a build returns the xml and its sizes
+        """
+        collection = Rule_Collection()
+        collection.add_rule(_R.Move_To("Bank", ["alerts@bank.com"]))
+        collection.add_rule(_R.Copy_To(["News", "Reading"], ["news@paper.com"]))
+
+        xml_text, measurement = measure_build(collection, label="test", version="1.0")
+
+        assert measurement.rules == 2
+        assert measurement.entries == 3
+        assert measurement.bytes == len(xml_text.encode("utf-8"))
+        assert set(measurement.phases) == {"build_final_string", "build_xml_text"}
+
+    def test_peak_rss_covers_only_the_build(self):
+        """Test that the peak resident set size is not the maximum of everything before the build
+        """
+        collection = Rule_Collection()
+        collection.add_rule(_R.Move_To("Bank", ["alerts@bank.com"]))
+
+        large_buffer = bytearray(200 * 1024 * 1024)
+        large_buffer[::4096] = b"x" * len(large_buffer[::4096])
+        del large_buffer
+
+        _, measurement = measure_build(collection, label="test", version="1.0")
+
+        assert measurement.peak_rss is None or measurement.peak_rss < 200 * 1024 * 1024
+        assert measurement.wall_time >= sum(measurement.phases.values()) * 0.99
+
+    def test_default_version_and_unsupported_peak_reset(self, monkeypatch):
+        """Test that the recorded version tells commits apart and that peaks are only reset on Linux
+        """
+        def missing_version(name):
+            raise history.metadata.PackageNotFoundError(name)
+
+        monkeypatch.setattr(history, "_git_commit", lambda: "abc1234")
+        monkeypatch.setattr(history.metadata, "version", lambda name: "1.2.0")
+        assert history._library_version() == "1.2.0+gabc1234"
+
+        monkeypatch.setattr(history.metadata, "version", missing_version)
+        assert history._library_version() == "abc1234"
+
+        monkeypatch.setattr(history, "_git_commit", lambda: None)
+        assert history._library_version() == "unknown"
+
+        monkeypatch.setattr(history.platform, "system", lambda: "Darwin")
+        assert history._reset_peak_rss() is False
+
+
+class TestPerfHistory:
+
+    def test_append_and_trend(self, tmp_path):
+        """Test that measurements round trip through the history file
+        """
+        perf_history = PerfHistory(tmp_path / "history.jsonl")
+        assert perf_history.load() == []
+
+        for version, wall_time in [("1.0", 1.0), ("1.0", 3.0), ("1.1", 2.0)]:
+            perf_history.append(make_measurement(version, wall_time))
+
+        assert [measurement.wall_time for measurement in perf_history.load(label="test")] == [1.0, 3.0, 2.0]
+        assert perf_history.load(label="other") == []
+        assert perf_history.versions() == ["1.0", "1.1"]
+        assert perf_history.samples("1.0") == [1.0, 3.0]
+        assert [point["median"] for point in perf_history.trend()] == [2.0, 2.0]
+        assert [point["per_rule_median"] for point in perf_history.trend()] == [1.0, 1.0]
+        assert perf_history.samples("1.0", per_rule=True) == [0.5, 1.5]
+
+
+class TestCompareSamples:
+
+    def test_detects_regression(self):
+        """Test that a clearly slower candidate is flagged
+        """
+        baseline = [1.00, 1.02, 0.98, 1.01, 0.99, 1.03, 0.97, 1.00]
+        candidate = [value * 1.3 for value in baseline]
+
+        comparison = compare_samples(baseline, candidate)
+        assert comparison.regression
+        assert comparison.p_value < 0.01
+        assert 1.29 < comparison.ratio < 1.31
+
+        assert not compare_samples(candidate, baseline).regression
+
+    def test_ignores_noise_and_small_changes(self):
+        """Test that overlapping samples and tiny slowdowns are not flagged
+        """
+        assert not compare_samples([1.0, 1.2, 0.9, 1.1], [1.05, 0.95, 1.15, 1.0]).regression
+        assert not compare_samples([1.0] * 10, [1.01] * 10, threshold=0.05).regression
+        assert compare_samples([1.0] * 10, [1.01] * 10, threshold=0.0).regression
+
+
+class TestCommandLine:
+
+    def test_record_and_compare(self, tmp_path, capsys):
+        """Test recording builds and comparing versions from the command line
+        """
+        rule_path = tmp_path / "rules.py"
+        rule_path.write_text(RULE_FILE)
+        history_path = tmp_path / "history.jsonl"
+
+        assert main(["record", str(rule_path), str(history_path), "--version", "1.0", "--repeat", "3"]) == 0
+        assert len(PerfHistory(history_path).load()) == 3
+
+        assert main(["compare", str(history_path)]) == 2
+
+        perf_history = PerfHistory(history_path)
+        for wall_time in [10.0, 10.1, 10.2]:
+            perf_history.append(make_measurement("1.1", wall_time))
+
+        assert main(["compare", str(history_path), "--metric", "wall_time"]) == 1
+        assert "REGRESSION" in capsys.readouterr().out
+        assert main(["compare", str(history_path), "--baseline", "1.1", "--candidate", "1.0"]) == 0
+        assert main(["trend", str(history_path)]) == 0
+
+    def test_grown_rule_set_is_not_a_regression(self, tmp_path, capsys):
+        """Test that a version whose rule set grew is compared per rule, and raw comparisons need equal rule counts
+        """
+        history_path = tmp_path / "history.jsonl"
+        perf_history = PerfHistory(history_path)
+        for wall_time in [1.0, 1.01, 0.99]:
+            perf_history.append(make_measurement("1.0", wall_time, rules=100))
+        for wall_time in [2.0, 2.02, 1.98]:
+            perf_history.append(make_measurement("1.1", wall_time, rules=200))
+
+        assert main(["compare", str(history_path)]) == 0
+        assert "per rule" in capsys.readouterr().out
+        assert main(["compare", str(history_path), "--raw"]) == 2
+        assert main(["trend", str(history_path)]) == 0
+        assert "1.000x per rule" in capsys.readouterr().out
+
+    def test_record_repeats_cold_builds(self, tmp_path, monkeypatch):
+        """Test that every recorded repeat builds a freshly loaded collection instead of reusing the render cache
+        """
+        rule_path = tmp_path / "rules.py"
+        rule_path.write_text(RULE_FILE)
+        measured_collections = []
+        measure = history.measure_build
+
+        def record_collection(collection, *args):
+            measured_collections.append(collection)
+            assert collection._render_cache is None
+            return measure(collection, *args)
+
+        monkeypatch.setattr(history, "measure_build", record_collection)
+
+        assert main(["record", str(rule_path), str(tmp_path / "history.jsonl"), "--repeat", "3"]) == 0
+        assert len({id(collection) for collection in measured_collections}) == 3
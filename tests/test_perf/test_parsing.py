@@ -0,0 +1,18 @@
+from gmail_rules.perf import benchmark_parsing
+from gmail_rules.perf.__main__ import main
+
+
+class TestBenchmarkParsing:
+
+    def test_benchmark_parsing(self, capsys):
+        """Test that the benchmark times both parsers with and without the body
+        """
+        result = benchmark_parsing(messages=30, repeat=1)
+
+        assert result["messages"] == 30
+        for mode in ("headers", "body"):
+            assert result[mode]["scanned"] > 0 and result[mode]["stdlib"] > 0
+            assert result[mode]["speedup"] > 0
+
+        assert main(["parsing", "--messages", "10", "--repeat", "1"]) == 0
+        assert "10 messages (body)" in capsys.readouterr().out
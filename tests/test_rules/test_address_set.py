@@ -0,0 +1,69 @@
+import pickle
+
+from gmail_rules.actions.build_xmls import shard_xml_texts
+from gmail_rules.matching import Matcher, Message
+from gmail_rules.rules.address_set import AddressSet
+from gmail_rules.rules.move_to import Move_To
+
+
+ADDRESSES = [f"spammer_{index}@abuse.example" for index in range(2_000)]
+
+
+class TestAddressSet:
+
+    def test_membership(self):
+        """Test membership checks with and without the Bloom filter
+        """
+        for bloom_bits_per_address in (10, 0):
+            address_set = AddressSet(ADDRESSES + ["  Mixed.Case@Example.com "], bloom_bits_per_address=bloom_bits_per_address)
+
+            assert len(address_set) == 2_001
+            assert "spammer_1999@abuse.example" in address_set
+            assert "mixed.case@example.com" in address_set
+            assert "SPAMMER_7@ABUSE.EXAMPLE" in address_set
+            assert "friend@gmail.com" not in address_set
+            assert address_set.contains_sender("Spammer <spammer_5@abuse.example>")
+
+    def test_save_and_load_with_mmap(self, tmp_path):
+        """Test that a saved set is memory-mapped and equal to the original
+        """
+        address_set = AddressSet(ADDRESSES)
+        address_set.save(tmp_path / "blocklist.bin")
+
+        loaded = AddressSet.load(tmp_path / "blocklist.bin")
+
+        assert loaded == address_set
+        assert hash(loaded) == hash(address_set)
+        assert "spammer_42@abuse.example" in loaded
+        assert sorted(loaded) == sorted(ADDRESSES)
+        assert pickle.loads(pickle.dumps(loaded)) == address_set
+
+    def test_chunks_respect_length(self):
+        """Test that every chunk of `from` criteria fits the length limit and covers every address
+        """
+        chunks = list(AddressSet(ADDRESSES).chunks(max_length=500))
+
+        assert all(len(chunk) <= 500 for chunk in chunks)
+        assert sorted(address for chunk in chunks for address in chunk.split(" OR ")) == sorted(ADDRESSES)
+
+    def test_address_set_as_rule_criteria(self):
+        """Test a rule whose senders are an AddressSet when building xml, sharding and matching
+        """
+        rule = Move_To("Quarantine", AddressSet(ADDRESSES))
+
+        assert rule.emails_list == []
+        assert "from" not in rule.rule_attributes
+
+        rule_parts = rule.build_rule_parts()
+        assert len(rule_parts) > 1
+        assert rule.build_rule().count("<entry>") == len(rule_parts)
+        assert "spammer_0@abuse.example" in rule.build_rule()
+
+        shards = shard_xml_texts([rule], max_bytes=20_000)
+        assert sum(entries for _, entries in shards) == len(rule_parts)
+
+        matcher = Matcher([rule])
+        assert matcher.classify(Message(sender="<spammer_3@abuse.example>")).labels == ["Quarantine"]
+        assert matcher.match(Message(sender="friend@gmail.com")) == []
+
+        assert rule.freeze().build_rule() == rule.build_rule()
@@ -1,3 +1,5 @@
+import xml.etree.ElementTree as ElementTree
+
 import pytest
 
 from gmail_rules.rules.rule import Rule
@@ -5,6 +7,8 @@ import gmail_rules.utils.helpers as _hp
 
 from gmail_rules.rules.copy_to import Copy_To
 from gmail_rules.rules.move_to import Move_To
+from gmail_rules.actions.build_xmls import build_xml_text
+from gmail_rules.actions.rule_collection import Rule_Collection
 
 
 class TestRule:
@@ -59,7 +63,7 @@ class TestRule:
     def test_rule_with_multiple_labels(self):
         """Test whether a rule with multiple labels corretly builds
         """
-        correct_rule = "<!-- START --- Mail Filter --- START -->\n<!-- Mail Filter (apple) -->\n<entry>\n\t<category term='filter'></category>\n\t<title>Mail Filter</title>\n\t<content></content>\n\t<apps:property name='label' value='apple'/>\n\t<apps:property name='from' value='test1@test.com OR test2@test.com'/>\n\t<apps:property name='subject' value='Meow'/>\n\t<apps:property name='hasTheWord' value='Bla bla'/>\n\t<apps:property name='doesNotHaveTheWord' value='Three'/>\n\t<apps:property name='shouldNeverSpam' value='false'/>\n</entry>\n<!-- Mail Filter (banana) -->\n<entry>\n\t<category term='filter'></category>\n\t<title>Mail Filter</title>\n\t<content></content>\n\t<apps:property name='label' value='banana'/>\n\t<apps:property name='from' value='test1@test.com OR test2@test.com'/>\n\t<apps:property name='subject' value='Meow'/>\n\t<apps:property name='hasTheWord' value='Bla bla'/>\n\t<apps:property name='doesNotHaveTheWord' value='Three'/>\n\t<apps:property name='shouldNeverSpam' value='false'/>\n</entry>\n<!-- Mail Filter (mango) -->\n<entry>\n\t<category term='filter'></category>\n\t<title>Mail Filter</title>\n\t<content></content>\n\t<apps:property name='label' value='mango'/>\n\t<apps:property name='from' value='test1@test.com OR test2@test.com'/>\n\t<apps:property name='subject' value='Meow'/>\n\t<apps:property name='hasTheWord' value='Bla bla'/>\n\t<apps:property name='doesNotHaveTheWord' value='Three'/>\n\t<apps:property name='shouldNeverSpam' value='false'/>\n</entry>\n<!-- END --- Mail Filter --- END -->".expandtabs(_hp.TAB_SPACING)
+        correct_rule = "<!-- START: Mail Filter -->\n<!-- Mail Filter (apple) -->\n<entry>\n\t<category term='filter'></category>\n\t<title>Mail Filter</title>\n\t<content></content>\n\t<apps:property name='label' value='apple'/>\n\t<apps:property name='from' value='test1@test.com OR test2@test.com'/>\n\t<apps:property name='subject' value='Meow'/>\n\t<apps:property name='hasTheWord' value='Bla bla'/>\n\t<apps:property name='doesNotHaveTheWord' value='Three'/>\n\t<apps:property name='shouldNeverSpam' value='false'/>\n</entry>\n<!-- Mail Filter (banana) -->\n<entry>\n\t<category term='filter'></category>\n\t<title>Mail Filter</title>\n\t<content></content>\n\t<apps:property name='label' value='banana'/>\n\t<apps:property name='from' value='test1@test.com OR test2@test.com'/>\n\t<apps:property name='subject' value='Meow'/>\n\t<apps:property name='hasTheWord' value='Bla bla'/>\n\t<apps:property name='doesNotHaveTheWord' value='Three'/>\n\t<apps:property name='shouldNeverSpam' value='false'/>\n</entry>\n<!-- Mail Filter (mango) -->\n<entry>\n\t<category term='filter'></category>\n\t<title>Mail Filter</title>\n\t<content></content>\n\t<apps:property name='label' value='mango'/>\n\t<apps:property name='from' value='test1@test.com OR test2@test.com'/>\n\t<apps:property name='subject' value='Meow'/>\n\t<apps:property name='hasTheWord' value='Bla bla'/>\n\t<apps:property name='doesNotHaveTheWord' value='Three'/>\n\t<apps:property name='shouldNeverSpam' value='false'/>\n</entry>\n<!-- END: Mail Filter -->".expandtabs(_hp.TAB_SPACING)
 
         new_rule = Rule(list_of_emails=["test1@test.com", "test2@test.com"])
         new_rule.add_attribute("label", ["apple", "banana", "mango"])
@@ -69,3 +73,114 @@ class TestRule:
         new_rule.add_attribute("doesNotHaveTheWord", "Three")
 
         assert new_rule.final_rule_str == correct_rule
+
+
+class TestDeriveRule:
+
+    def test_derive_shares_until_modified(self):
+        """Test that a derived rule shares its parent's containers until either of them changes
+        """
+        base_rule = Move_To("Bank", ["alerts@bank.com", ["statements@bank.com"]])
+        derived_rule = base_rule.derive(labels="Finance", subject="Statement")
+
+        assert type(derived_rule) is Move_To
+        assert derived_rule.emails_list is base_rule.emails_list
+        assert derived_rule._rendered_attributes is base_rule._rendered_attributes
+        assert derived_rule.labels == ["Finance"]
+        assert derived_rule.rule_attributes["subject"] == "Statement"
+        assert "subject" not in base_rule.rule_attributes
+        assert base_rule.labels == ["Bank"]
+
+        untouched_rule = base_rule.derive()
+        assert untouched_rule.rule_attributes is base_rule.rule_attributes
+        assert untouched_rule.final_rule_str == base_rule.final_rule_str
+
+        base_rule.add_label("Money")
+        base_rule.update_attribute("shouldArchive", "false")
+        assert untouched_rule.labels == ["Bank"]
+        assert untouched_rule.rule_attributes["shouldArchive"] == "true"
+        assert base_rule.rule_attributes["shouldArchive"] == "false"
+
+    def test_derive_name_and_emails(self):
+        """Test deriving a rule with a different name and email addresses
+        """
+        base_rule = Copy_To("News", ["news@paper.com"])
+        derived_rule = base_rule.derive(rule_name="Other News", list_of_emails=["daily@paper.com", "weekly@paper.com"])
+
+        assert derived_rule.final_rule_str == Copy_To("News", ["daily@paper.com", "weekly@paper.com"], rule_name="Other News").final_rule_str
+        assert base_rule.rule_attributes["from"] == "news@paper.com"
+
+        with pytest.raises(KeyError):
+            base_rule.derive(notAnAttribute="value")
+
+    def test_derive_with_labels_gets_label_name(self):
+        """Test that a variant with new labels is named after them and can join its parent's collection
+        """
+        base_rule = Move_To("Bank", ["alerts@bank.com"])
+        derived_rule = base_rule.derive(labels=["Finance", "Bills"])
+
+        assert derived_rule.name == Move_To(["Finance", "Bills"]).name == "MOVE TO: Finance | Bills"
+        assert derived_rule.final_rule_str == Move_To(["Finance", "Bills"], ["alerts@bank.com"]).final_rule_str
+        assert base_rule.derive(rule_name="Money", labels="Finance").name == "Money"
+
+        collection = Rule_Collection()
+        collection.add_rule(base_rule)
+        collection.add_rule(derived_rule)
+        assert len(collection) == 2
+
+
+class TestXmlEscaping:
+
+    def test_escape_xml(self):
+        """Test escaping special characters, and keeping existing references only when asked to
+        """
+        assert _hp.escape_xml("Invoice 123") == "Invoice 123"
+        assert _hp.escape_xml("Smith & Sons' <offer>") == "Smith &amp; Sons&apos; &lt;offer&gt;"
+        assert _hp.escape_xml('"exact phrase"') == "&quot;exact phrase&quot;"
+        assert _hp.escape_xml("Smith &amp; Sons &#39;") == "Smith &amp;amp; Sons &amp;#39;"
+
+        assert _hp.escape_xml("Smith &amp; Sons &#39;&#x41;", keep_references=True) == "Smith &amp; Sons &#39;&#x41;"
+        assert _hp.escape_xml("&nbsp;", keep_references=True) == "&amp;nbsp;"
+        assert _hp.escape_xml("&#0;&#x1;&#xD800;&#1114112;", keep_references=True) == "&amp;#0;&amp;#x1;&amp;#xD800;&amp;#1114112;"
+        assert _hp.escape_xml("&#9;&#x10FFFF;", keep_references=True) == "&#9;&#x10FFFF;"
+
+        assert _hp.escape_xml("tab\tand\u00a0space") == "tab\tand\u00a0space"
+        assert _hp.escape_xml("caf\u00e9 & bar") == "caf\u00e9 &amp; bar"
+
+        with pytest.raises(ValueError):
+            _hp.escape_xml("bad\x01value")
+        with pytest.raises(ValueError):
+            _hp.escape_xml("bad\x01value & more")
+
+    def test_comments_with_double_hyphens(self):
+        """Test that names and labels containing `--` still produce a well-formed feed
+        """
+        new_rule = Copy_To(["Alerts -- urgent", "Alerts -"], ["alerts@bank.com"], rule_name="Bank -- alerts-")
+        xml_text = build_xml_text(new_rule.final_rule_str)
+
+        namespaces = {"atom": "http://www.w3.org/2005/Atom", "apps": "http://schemas.google.com/apps/2006"}
+        entries = ElementTree.fromstring(xml_text).findall("atom:entry", namespaces)
+
+        labels = [prop.get("value") for entry in entries for prop in entry.findall("apps:property", namespaces) if prop.get("name") == "label"]
+        assert labels == ["Alerts -- urgent", "Alerts -"]
+        assert "<!-- START: Bank - - alerts-  -->" in xml_text
+
+    def test_rule_values_and_names_are_escaped(self):
+        """Test that rule names, labels and attribute values produce well-formed xml
+        """
+        new_rule = Move_To("R&D <Team>", ["rnd@company.com"], {"subject": "Don't \"panic\" & relax"})
+        xml_text = build_xml_text(new_rule.final_rule_str)
+
+        namespaces = {"atom": "http://www.w3.org/2005/Atom", "apps": "http://schemas.google.com/apps/2006"}
+        entry = ElementTree.fromstring(xml_text).find("atom:entry", namespaces)
+
+        assert entry.find("atom:title", namespaces).text == "MOVE TO: R&D <Team>"
+        properties = {prop.get("name"): prop.get("value") for prop in entry.findall("apps:property", namespaces)}
+        assert properties["label"] == "R&D <Team>"
+        assert properties["subject"] == "Don't \"panic\" & relax"
+        assert new_rule.freeze().final_rule_str == new_rule.final_rule_str
+
+        reference_rule = Copy_To("News", ["news@paper.com"], {"subject": "AT&amp;T &#39;deals&#39;"})
+        entry = ElementTree.fromstring(build_xml_text(reference_rule.final_rule_str)).find("atom:entry", namespaces)
+        properties = {prop.get("name"): prop.get("value") for prop in entry.findall("apps:property", namespaces)}
+        assert properties["subject"] == "AT&amp;T &#39;deals&#39;"
@@ -0,0 +1,94 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from gmail_rules.actions.rule_collection import Rule_Collection
+from gmail_rules.rules.copy_to import Copy_To
+from gmail_rules.rules.move_to import Move_To
+from gmail_rules.rules.rule import Rule
+from gmail_rules.rules.rule_spec import RuleSpec
+from gmail_rules.rules import rendering
+
+
+class TestRuleSpec:
+
+    def test_default_arguments_are_not_shared(self):
+        """Test that rules no longer leak state through mutable default arguments
+        """
+        defaults = {"subject": "Hello"}
+        Move_To("label_1", rule_defaults=defaults)
+        assert defaults == {"subject": "Hello"}
+
+        rule_1 = Rule()
+        rule_2 = Rule()
+        rule_1.emails_list.append("leak@gmail.com")
+        assert rule_2.emails_list == []
+
+    def test_freeze_builds_identical_xml(self):
+        """Test that a frozen rule renders the same xml as the rule it came from
+        """
+        rule = Copy_To(["apple", "banana"], ["fruit@gmail.com"])
+        rule.add_attribute("subject", "Sale")
+
+        spec = rule.freeze()
+
+        assert isinstance(spec, RuleSpec)
+        assert spec.build_rule() == rule.build_rule()
+        assert spec.thaw().build_rule() == rule.build_rule()
+
+    def test_frozen_rule_does_not_depend_on_rule_internals(self, monkeypatch):
+        """Test that a frozen rule renders through the shared rendering functions, not :obj:`Rule`'s methods
+        """
+        rule = Copy_To(["apple", "banana"], ["fruit@gmail.com"])
+        expected_xml = rule.build_rule()
+
+        monkeypatch.setattr(Rule, "build_rule_parts", lambda *args: ["broken"])
+        monkeypatch.setattr(Rule, "rule_attributes_xmls", property(lambda self: {}))
+
+        spec = RuleSpec.from_rule(rule)
+        assert spec.build_rule() == expected_xml
+        assert spec.build_rule_parts() == rendering.build_rule_parts(
+            spec.name, spec.labels, spec.rule_attributes, spec.attribute_order, spec.rule_header,
+        )
+
+    def test_frozen_rules_are_hashable_and_comparable(self):
+        """Test equality, hashing and set-based deduplication of frozen rules
+        """
+        rule_1 = Copy_To("label_1", ["a@gmail.com"])
+        rule_1.add_attribute("subject", "Meow")
+        rule_2 = Copy_To("label_1", ["a@gmail.com"])
+        rule_2.add_attribute("subject", "Meow")
+
+        assert rule_1.freeze() == rule_2.freeze()
+        assert len({rule_1.freeze(), rule_2.freeze(), Copy_To("label_2").freeze()}) == 2
+
+        spec = rule_1.freeze()
+        assert copy.copy(spec) is spec
+        assert copy.deepcopy(spec) is spec
+
+    def test_frozen_rule_is_immutable(self):
+        """Ensure a frozen rule cannot be modified
+        """
+        spec = Rule(rule_name="Frozen").freeze()
+
+        with pytest.raises(AttributeError):
+            spec.name = "Changed"
+        with pytest.raises(TypeError):
+            spec.rule_attributes["subject"] = "Changed"
+
+    def test_frozen_rules_in_collection(self):
+        """Test adding frozen rules built from many threads to a collection
+        """
+        def build(index: int) -> RuleSpec:
+            return Move_To(f"label_{index}", [f"user_{index}@gmail.com"]).freeze()
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            specs = list(executor.map(build, range(20)))
+
+        collection = Rule_Collection()
+        collection.add_rules(specs)
+
+        assert len(collection) == 20
+        assert collection["MOVE TO: label_3"] is specs[3]
+        assert "user_19@gmail.com" in collection.final_string